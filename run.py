@@ -50,6 +50,28 @@ if __name__ == "__main__":
         action="append",
         help="Add verifier to trusted list",
     )
+    lookup_parser.add_argument(
+        "--workers",
+        dest="workers",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of crawler processes, each crawls a part of domains",
+    )
+    lookup_parser.add_argument(
+        "--config",
+        dest="config",
+        metavar="FILE",
+        default=None,
+        help="Config file (default res/lookup/config.json)",
+    )
+    lookup_parser.add_argument(
+        "--db",
+        dest="database",
+        metavar="FILE",
+        default=None,
+        help="Database file (default out/database.db)",
+    )
     lookup_start_group.add_argument(
         "--no-crawl", dest="crawl", action="store_false", help="Don't start the crawler"
     )
@@ -79,7 +101,9 @@ if __name__ == "__main__":
         if not args.crawl and not args.server and not args.verifiers:
             print("Nothing to do: start crawler and/or server or add verifier")
             exit(1)
-        runner: LookupRunner = LookupRunner(log_level)
+        runner: LookupRunner = LookupRunner(
+            log_level, config_file=args.config, database_path=args.database
+        )
 
         async def run_with_args():
             if args.verifiers:
@@ -87,7 +111,10 @@ if __name__ == "__main__":
                     vid, uri = await runner.add_verifier(v)
                     print(f"added verifier {uri} with id {vid}")
                 return
-            await runner.start(args.crawl_from if args.crawl else None, args.server)
+            if args.crawl and args.workers > 1:
+                await runner.start_workers(args.workers, args.crawl_from, args.server)
+            else:
+                await runner.start(args.crawl_from if args.crawl else None, args.server)
             await runner.spin_and_log()
 
     elif args.service == "verifier":
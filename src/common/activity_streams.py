@@ -1,5 +1,57 @@
+import hashlib
+import json
 from typing import Optional
 
+from common.json_codec import dumps
+
+
+class AsDocument(dict):
+    """
+    Fetched object together with the response body it was parsed from,
+    so it doesn't have to be serialized again for storage, and its content hash.
+    Like every fetched object, it must not be modified.
+    """
+
+    __slots__ = ("raw", "_text", "_hash")
+
+    def __init__(self, obj: dict, raw: bytes) -> None:
+        super().__init__(obj)
+        self.raw: bytes = raw
+        self._text: Optional[str] = None
+        self._hash: Optional[str] = None
+
+
+def serialize(as_obj: dict) -> str:
+    """
+    :return: JSON of `as_obj`, the fetched document itself if it's an `AsDocument`,
+        otherwise JSON with sorted keys, so equal objects have equal serialization.
+    """
+    if isinstance(as_obj, AsDocument):
+        if as_obj._text is None:
+            # the body was parsed as bytes, so it can have a BOM or be UTF-16 or UTF-32,
+            # but the stored text is parsed as a string, which can't
+            encoding = json.detect_encoding(as_obj.raw)
+            if encoding in ("utf-8", "utf-8-sig"):
+                as_obj._text = as_obj.raw.decode(encoding)
+            else:
+                as_obj._text = dumps(as_obj, sort_keys=True)
+        return as_obj._text
+    return dumps(as_obj, sort_keys=True)
+
+
+def content_hash(as_obj: dict) -> str:
+    """
+    :return: md5 of JSON of `as_obj` with sorted keys, so it doesn't depend on key order
+        and formatting of the document. It's the same serialization as before fetched
+        documents were kept, so stored hashes stay valid. Computed once for an `AsDocument`.
+    """
+    if isinstance(as_obj, AsDocument) and as_obj._hash is not None:
+        return as_obj._hash
+    ohash = hashlib.md5(json.dumps(as_obj, sort_keys=True).encode()).hexdigest()
+    if isinstance(as_obj, AsDocument):
+        as_obj._hash = ohash
+    return ohash
+
 
 def get_as_id(as_obj: dict) -> Optional[str]:
     if "id" in as_obj:
@@ -0,0 +1,105 @@
+import hashlib
+import math
+import struct
+from typing import Tuple
+
+
+class BloomFilter:
+    """
+    Set of strings which can answer "maybe contains" or "doesn't contain".
+    Sized so that with `capacity` items, a string that wasn't added is
+    reported as contained with probability `fp_rate` (at most 512 MiB are used).
+    """
+
+    _HEADER = struct.Struct("<4sQIQ")
+    _MAGIC = b"BLM1"
+
+    MAX_BITS = 2**32
+    MAX_HASHES = 16
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity: int = max(capacity, 1)
+        self.fp_rate: float = fp_rate
+        self.bit_count: int = min(
+            BloomFilter.MAX_BITS,
+            max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2)),
+        )
+        self.hash_count: int = min(
+            BloomFilter.MAX_HASHES,
+            max(1, round(self.bit_count / self.capacity * math.log(2))),
+        )
+        self.count: int = 0
+        """Number of added items (without those already reported as contained)"""
+        self._bits: bytearray = bytearray((self.bit_count + 7) // 8)
+        self._positions: struct.Struct = struct.Struct(f"<{self.hash_count}I")
+
+    def _hashes(self, item: str) -> Tuple[int, ...]:
+        # one 32 bit hash per position, all from one digest
+        return self._positions.unpack(
+            hashlib.blake2b(item.encode(), digest_size=self._positions.size).digest()
+        )
+
+    def __contains__(self, item: str) -> bool:
+        bits, bit_count = self._bits, self.bit_count
+        for pos in self._hashes(item):
+            pos %= bit_count
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, item: str) -> bool:
+        """:return: True if `item` wasn't reported as contained before."""
+        bits, bit_count = self._bits, self.bit_count
+        added = False
+        for pos in self._hashes(item):
+            pos %= bit_count
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    @property
+    def is_full(self) -> bool:
+        return self.count > self.capacity
+
+    @property
+    def size(self) -> int:
+        """Memory used by the bits in bytes"""
+        return len(self._bits)
+
+    def current_fp_rate(self) -> float:
+        """:return: estimated false positive rate with the items added so far."""
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_count)) ** (
+            self.hash_count
+        )
+
+    def to_bytes(self) -> bytes:
+        header = BloomFilter._HEADER.pack(
+            BloomFilter._MAGIC, self.bit_count, self.hash_count, self.count
+        )
+        return header + self._bits
+
+    def load_bytes(self, data: bytes) -> bool:
+        """
+        Replace the content with `data` from `to_bytes` of a filter of the same size.
+        :return: False (and the content is kept) if `data` isn't such a filter.
+        """
+        header_size = BloomFilter._HEADER.size
+        if len(data) != header_size + len(self._bits):
+            return False
+        magic, bit_count, hash_count, count = BloomFilter._HEADER.unpack_from(data)
+        if (magic, bit_count, hash_count) != (
+            BloomFilter._MAGIC,
+            self.bit_count,
+            self.hash_count,
+        ):
+            return False
+        self._bits = bytearray(data[header_size:])
+        self.count = count
+        return True
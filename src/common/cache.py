@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+MISSING: Any = object()
+"""Returned by `TtlCache.get` when the key isn't cached"""
+
+
+class TtlCache(Generic[K, V]):
+    """
+    Bounded cache with expiring entries, least recently used entries are evicted first.
+    None values are negative results and expire after `negative_ttl` seconds.
+    """
+
+    HITS = "hits"
+    MISSES = "misses"
+    EVICTIONS = "evictions"
+
+    def __init__(
+        self, max_size: int, ttl: float, negative_ttl: Optional[float] = None
+    ) -> None:
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.negative_ttl: float = ttl if negative_ttl is None else negative_ttl
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            TtlCache.HITS: 0,
+            TtlCache.MISSES: 0,
+            TtlCache.EVICTIONS: 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._entries.get(key, None)
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, key: K) -> V:
+        """:return: cached value or `MISSING`."""
+        entry = self._entries.get(key, None)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.stats[TtlCache.MISSES] += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.stats[TtlCache.HITS] += 1
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        if self.max_size <= 0:
+            return
+        ttl = self.negative_ttl if value is None else self.ttl
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats[TtlCache.EVICTIONS] += 1
+
+    def get_stats(self) -> dict:
+        return {"size": len(self._entries), **self.stats}
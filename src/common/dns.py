@@ -0,0 +1,98 @@
+import asyncio
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import AsyncResolver, ThreadedResolver, aiodns
+
+from common.cache import MISSING, TtlCache
+from common.single_flight import SingleFlight
+
+
+def default_resolver() -> AbstractResolver:
+    """:return: aiodns based resolver if aiodns is installed, thread pool one otherwise."""
+    if aiodns is not None:
+        return AsyncResolver()
+    return ThreadedResolver()
+
+
+class CachingResolver(AbstractResolver):
+    """
+    Caches results of another resolver, failed lookups are cached for `negative_ttl`.
+    Concurrent lookups of the same host are coalesced into one.
+    """
+
+    LOOKUPS = "lookups"
+    FAILED = "failed"
+    PREFETCHED = "prefetched"
+
+    def __init__(
+        self,
+        resolver: Optional[AbstractResolver] = None,
+        cache_size: int = 100000,
+        ttl: float = 300,
+        negative_ttl: float = 30,
+    ) -> None:
+        """
+        :param resolver: resolver making the lookups, `default_resolver()` if None.
+        :param ttl: how long to use resolved addresses in seconds.
+        :param negative_ttl: how long to consider a host unresolvable in seconds.
+        """
+        self.resolver: AbstractResolver = resolver or default_resolver()
+        self.cache: TtlCache[
+            Tuple[str, int], Optional[List[Dict[str, Any]]]
+        ] = TtlCache(cache_size, ttl, negative_ttl)
+        self.single_flight: SingleFlight = SingleFlight()
+        self.lookup_time: float = 0
+        self.stats: Dict[str, int] = {
+            CachingResolver.LOOKUPS: 0,
+            CachingResolver.FAILED: 0,
+            CachingResolver.PREFETCHED: 0,
+        }
+
+    async def resolve(
+        self, host: str, port: int = 0, family: int = socket.AF_INET
+    ) -> List[Dict[str, Any]]:
+        key = (host, family)
+        hosts = self.cache.get(key)
+        if hosts is MISSING:
+            hosts = await self.single_flight.run(
+                key, lambda: self._lookup(host, family)
+            )
+        if hosts is None:
+            raise OSError(f"Can't resolve {host}")
+        return [{**h, "port": port} for h in hosts]
+
+    async def _lookup(self, host: str, family: int) -> Optional[List[Dict[str, Any]]]:
+        self.stats[CachingResolver.LOOKUPS] += 1
+        started = time.monotonic()
+        try:
+            hosts = await self.resolver.resolve(host, 0, family)
+        except OSError:
+            self.stats[CachingResolver.FAILED] += 1
+            hosts = None
+        finally:
+            self.lookup_time += time.monotonic() - started
+        self.cache.set((host, family), hosts)
+        return hosts
+
+    def prefetch(self, host: str, family: int = 0) -> None:
+        """Start resolving `host` in the background unless it's cached."""
+        if (host, family) in self.cache:
+            return
+        self.stats[CachingResolver.PREFETCHED] += 1
+        future = asyncio.ensure_future(self.resolve(host, 0, family))
+        # failures are cached, nobody waits for the result
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def close(self) -> None:
+        await self.resolver.close()
+
+    def get_stats(self) -> dict:
+        lookups = self.stats[CachingResolver.LOOKUPS]
+        return {
+            **self.stats,
+            "avg_lookup_time": lookups and self.lookup_time / lookups,
+            "cache": self.cache.get_stats(),
+        }
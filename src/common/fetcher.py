@@ -1,16 +1,25 @@
 import asyncio
+import functools
 import json
 import logging
+import re
 import ssl
+import time
 import traceback
-from typing import Optional
+from typing import Any, Callable, Optional, Tuple, TypedDict
 from urllib.parse import urlparse
 
 import aiohttp
 import certifi
 from aiohttp import ClientTimeout
 
+from common.activity_streams import AsDocument
 from common.constants import ACCEPTABLE_CONTENT_TYPES, HIGHLY_RELIABLE_SITES
+from common.dns import CachingResolver
+from common.json_codec import loads
+from common.rate_control import RateController, parse_retry_after
+from common.single_flight import SingleFlight
+from common.tracing import ConnectionStats, LatencyStats, RequestTimings
 
 
 class FailedFetch(Exception):
@@ -26,6 +35,24 @@ class TemporaryFetchError(FailedFetch):
         super().__init__(uri, f"{message}, retry later")
 
 
+class RateLimited(TemporaryFetchError):
+    def __init__(self, uri, retry_at: Optional[float]):
+        """:param retry_at: time from the Retry-After header, None if not sent."""
+        self.retry_at: Optional[float] = retry_at
+        super().__init__(uri, "rate limit exceeded")
+
+
+JSON_CONTENT_TYPE_RE = re.compile(r"^application/(?:[\w.+-]+?\+)?json$")
+"""Content types of JSON documents (application/json, application/activity+json, ...)"""
+
+
+class Validators(TypedDict, total=False):
+    """HTTP cache validators of a fetched document."""
+
+    etag: str
+    last_modified: str
+
+
 class Fetcher:
     def __init__(
         self,
@@ -33,12 +60,51 @@ class Fetcher:
         limit: int = 100,
         debug: bool = False,
         timeout: float = 20,
+        keep_alive: bool = False,
+        limit_per_host: int = 0,
+        keep_alive_timeout: float = 15,
+        result_ttl: float = 0,
+        dns_ttl: float = 300,
+        dns_negative_ttl: float = 30,
+        trace: Optional[Callable[..., None]] = None,
+        max_body_size: int = 10 * 1024 * 1024,
+        decode_in_thread_size: int = 256 * 1024,
+        parse: Optional[Callable[[bytes], Any]] = None,
     ) -> None:
+        """
+        :param limit: maximum number of simultaneous connections.
+        :param keep_alive: reuse connections instead of closing them after every request.
+        :param limit_per_host: maximum number of simultaneous connections to one host,
+            0 if unlimited.
+        :param keep_alive_timeout: how long to keep an idle connection open.
+        :param result_ttl: how long to reuse a fetched object for requests of the same uri,
+            0 if only concurrent requests should share the response.
+        :param dns_ttl: how long to use resolved addresses of a host.
+        :param dns_negative_ttl: how long to consider a host that failed to resolve unresolvable.
+        :param trace: trace log function to which sampled request timings are written.
+        :param max_body_size: maximum size of a fetched document in bytes.
+        :param decode_in_thread_size: documents larger than this (in bytes)
+            are parsed in a thread, so they don't block the event loop.
+        :param parse: function parsing fetched documents,
+            e.g. to drop unused fields, `json_codec.loads` if None.
+        """
         self.logger = logger
         self._limit = limit
         self._timeout = timeout
         self._debug = debug
+        self._keep_alive = keep_alive
+        self._limit_per_host = limit_per_host
+        self._keep_alive_timeout = keep_alive_timeout
+        self._dns_ttl = dns_ttl
+        self._dns_negative_ttl = dns_negative_ttl
+        self._max_body_size = max_body_size
+        self._decode_in_thread_size = decode_in_thread_size
+        self._parse: Callable[[bytes], Any] = parse or loads
         self.session: Optional[aiohttp.ClientSession] = None
+        self.resolver: Optional[CachingResolver] = None
+        self.connection_stats: ConnectionStats = ConnectionStats()
+        self.latency_stats: LatencyStats = LatencyStats(trace=trace)
+        self.single_flight: SingleFlight = SingleFlight(result_ttl)
 
     async def check_connection(self):
         for url in HIGHLY_RELIABLE_SITES:
@@ -52,21 +118,123 @@ class Fetcher:
 
     async def setup(self) -> None:
         ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.resolver = CachingResolver(
+            ttl=self._dns_ttl, negative_ttl=self._dns_negative_ttl
+        )
+        if self._keep_alive:
+            connector = aiohttp.TCPConnector(
+                resolver=self.resolver,
+                use_dns_cache=False,
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                keepalive_timeout=self._keep_alive_timeout,
+                ssl=ssl_context,
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                resolver=self.resolver,
+                use_dns_cache=False,
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                force_close=True,
+                ssl=ssl_context,
+            )
         self.session = aiohttp.ClientSession(
             timeout=ClientTimeout(total=self._timeout, connect=5),
-            connector=aiohttp.TCPConnector(
-                limit=self._limit, force_close=True, ssl=ssl_context
-            ),
+            connector=connector,
+            trace_configs=[
+                self.connection_stats.trace_config(),
+                self.latency_stats.trace_config(),
+            ],
         )
 
     async def shutdown(self) -> None:
         await self.session.close()
+        await self.resolver.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "connections": self.connection_stats.get_stats(),
+            "requests": dict(self.single_flight.stats),
+            "dns": self.resolver and self.resolver.get_stats(),
+            "latency": self.latency_stats.get_stats(),
+        }
 
-    async def fetch_ap(self, uri: str) -> dict:
+    def prefetch_dns(self, uri: str) -> None:
+        """Start resolving host of `uri`, so it's cached once `uri` is fetched."""
+        try:
+            host = urlparse(uri).hostname
+        except ValueError:
+            return
+        if host and self.resolver is not None:
+            self.resolver.prefetch(host)
+
+    async def fetch_ap(self, uri: str, rate: Optional[RateController] = None) -> dict:
+        obj, _ = await self.fetch_ap_conditional(uri, rate=rate)
+        return obj
+
+    async def fetch_ap_conditional(
+        self,
+        uri: str,
+        validators: Optional[Validators] = None,
+        rate: Optional[RateController] = None,
+    ) -> Tuple[Optional[dict], Validators]:
+        """
+        Fetch ActivityPub object, sending `validators` of the previously fetched copy.
+        :param rate: rate controller of the domain, informed about the response.
+        :return: fetched object or None if it wasn't modified, and validators of the response.
+        """
         if not isinstance(uri, str):
             raise TypeError()
+        key = (uri, None, None)
+        if validators:
+            key = (uri, validators.get("etag"), validators.get("last_modified"))
+        return await self.single_flight.run(
+            key, lambda: self._fetch_ap_conditional(uri, validators, rate)
+        )
+
+    async def _read_json(self, uri: str, response: aiohttp.ClientResponse) -> Any:
+        """
+        Read the response body up to `max_body_size` bytes and parse it,
+        objects keep the body as `AsDocument.raw`.
+        Responses which aren't JSON are refused before their body is read.
+        """
+        if not JSON_CONTENT_TYPE_RE.match(response.content_type):
+            raise aiohttp.ContentTypeError(
+                response.request_info, response.history, message=response.content_type
+            )
+        if (response.content_length or 0) > self._max_body_size:
+            raise FailedFetch(uri, f"response larger than {self._max_body_size} bytes")
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self._max_body_size:
+                raise FailedFetch(
+                    uri, f"response larger than {self._max_body_size} bytes"
+                )
+        if size == 0:
+            return None
+        body = b"".join(chunks)
+        decode = functools.partial(self._parse, body)
+        if size > self._decode_in_thread_size:
+            obj = await asyncio.get_running_loop().run_in_executor(None, decode)
+        else:
+            obj = decode()
+        return AsDocument(obj, body) if isinstance(obj, dict) else obj
+
+    async def _fetch_ap_conditional(
+        self,
+        uri: str,
+        validators: Optional[Validators],
+        rate: Optional[RateController],
+    ) -> Tuple[Optional[dict], Validators]:
         if uri.startswith("//"):
             uri = "https:" + uri
+        timings: Optional[RequestTimings] = None
+        outcome = LatencyStats.NO_RESPONSE
+        read_body = False
         try:
             parsed_uri = urlparse(uri)
             if parsed_uri.scheme != "https" and not self._debug:
@@ -76,34 +244,62 @@ class Fetcher:
                 and not self._debug
             ):
                 raise FailedFetch(uri, "local requests aren't supported")
+            headers = {"Accept": ACCEPTABLE_CONTENT_TYPES}
+            if validators:
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+            timings = RequestTimings()
             async with self.session.get(
-                uri,
-                headers={"Accept": ACCEPTABLE_CONTENT_TYPES},
+                uri, headers=headers, trace_request_ctx=timings
             ) as response:
+                outcome = str(response.status)
+                if rate is not None:
+                    rate.on_response(
+                        response.status,
+                        response.headers,
+                        time.monotonic() - timings.started,
+                    )
+                new_validators: Validators = {}
+                if response.headers.get("ETag"):
+                    new_validators["etag"] = response.headers["ETag"]
+                if response.headers.get("Last-Modified"):
+                    new_validators["last_modified"] = response.headers["Last-Modified"]
+                if response.status == 304 and validators:
+                    return None, new_validators
                 if response.status == 401:
                     raise FailedFetch(uri, "Private resource")
                 if response.status == 403:
                     raise FailedFetch(uri, "Private resource")
                 if response.status == 404:
                     raise FailedFetch(uri, "not found")
-                elif response.status == 429:
-                    raise TemporaryFetchError(uri, "rate limit exceeded")
+                elif response.status == 429 or (
+                    response.status == 503 and "Retry-After" in response.headers
+                ):
+                    retry_at = parse_retry_after(response.headers, time.time())
+                    raise RateLimited(uri, retry_at)
                 elif response.status // 100 == 5:
                     raise TemporaryFetchError(uri, f"server error {response.status}")
                 elif response.status != 200:
                     raise FailedFetch(uri, f"response code {response.status}")
 
-                obj = await response.json()
+                read_body = True
+                obj = await self._read_json(uri, response)
                 if not obj:
                     raise FailedFetch(uri, "object not found")
                 if not isinstance(obj, dict):
                     raise FailedFetch(uri, "expected json dictionary")
-                return obj
+                return obj, new_validators
         except AssertionError:
             raise FailedFetch(uri, "probably uri parsing failed??")
         except asyncio.TimeoutError:
+            if rate is not None:
+                rate.on_error()
             raise TemporaryFetchError(uri, "timeout")
         except aiohttp.ServerDisconnectedError:
+            if rate is not None:
+                rate.on_error()
             raise TemporaryFetchError(uri, "server disconnected")
         except aiohttp.ClientConnectorError:
             raise TemporaryFetchError(uri, "failed to connect")
@@ -135,3 +331,8 @@ class Fetcher:
             self.logger.error(f"Fetching {uri} failed with exception")
             self.logger.exception(e)
             raise FailedFetch(uri, "unknown error") from e
+        finally:
+            if timings is not None:
+                self.latency_stats.record(
+                    parsed_uri.hostname, timings, with_body=read_body, outcome=outcome
+                )
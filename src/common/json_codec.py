@@ -0,0 +1,76 @@
+import json
+from typing import Any, Union
+
+try:
+    # noinspection PyPackageRequirements
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse JSON with orjson if it's installed.
+    Documents orjson refuses (NaN, lone surrogates) are parsed by `json.loads`,
+    integers which don't fit in 64 bits are parsed as floats by orjson.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """
+    Serialize `obj` to compact JSON with orjson if it's installed.
+    Output of orjson and of `json.dumps` differs in escaping and number formatting,
+    use `dumps_canonical` where the exact output matters.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0
+            ).decode()
+        except TypeError:
+            # non str keys, integers larger than 64 bits, ...
+            pass
+    return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":"))
+
+
+def dumps_canonical(obj: Any) -> str:
+    """
+    :return: the same string as `json.dumps(obj, sort_keys=True, separators=(",", ":"))`,
+        computed with orjson if it's installed and the output would be the same.
+    """
+    if orjson is not None and _is_plain(obj):
+        try:
+            text = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+        except TypeError:
+            # integers larger than 64 bits, lone surrogates, ...
+            pass
+        else:
+            # json escapes non ASCII characters (and DEL), orjson doesn't
+            if text.isascii() and "\x7f" not in text:
+                return text
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+def _is_plain(obj: Any) -> bool:
+    """:return: whether `obj` consists of types which orjson and json format the same."""
+    typ = type(obj)
+    if typ is dict:
+        obj = obj.values()
+    elif typ is not list:
+        return typ is str or typ is int or typ is bool or obj is None
+    for value in obj:
+        typ = type(value)
+        if typ is dict or typ is list:
+            if not _is_plain(value):
+                return False
+        elif (
+            typ is not str and typ is not int and typ is not bool and value is not None
+        ):
+            return False
+    return True
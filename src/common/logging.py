@@ -1,4 +1,5 @@
 import time
+from typing import Iterable, List
 
 
 class EventCounter:
@@ -13,9 +14,9 @@ class EventCounter:
         self.total_counts: dict = {}
         self.last_flush: float = time.time()
 
-    def on_event(self, typ: str) -> None:
-        self.total_counts[typ] = self.total_counts.get(typ, 0) + 1
-        self.counts[typ] = self.counts.get(typ, 0) + 1
+    def on_event(self, typ: str, count: int = 1) -> None:
+        self.total_counts[typ] = self.total_counts.get(typ, 0) + count
+        self.counts[typ] = self.counts.get(typ, 0) + count
 
     def get_stats(self) -> dict:
         stats = dict(self.counts)
@@ -32,3 +33,24 @@ class EventCounter:
         self.last_flush = stats["time"]
         self.counts = {}
         return stats
+
+
+def merge_stats(stats: List[dict], maximum: Iterable[str] = ("time", "period")) -> dict:
+    """
+    Stats of several processes as one: numbers are summed, nested stats merged.
+    :param maximum: keys whose largest value is taken instead of the sum.
+    """
+    maximum = set(maximum)
+    merged = {}
+    for item in stats:
+        for key, value in item.items():
+            if isinstance(value, dict):
+                merged[key] = merge_stats([merged.get(key, {}), value], maximum)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                if key in maximum:
+                    merged[key] = max(merged.get(key, value), value)
+                else:
+                    merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
@@ -0,0 +1,153 @@
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+
+def _parse_time(value: str, now: float) -> Optional[float]:
+    """
+    Parse time from a rate limiting header.
+    :return: absolute time or None if it can't be parsed.
+    """
+    value = value.strip()
+    try:
+        number = float(value)
+        # seconds since epoch or seconds from now
+        return number if number > 10**9 else now + number
+    except ValueError:
+        pass
+    try:
+        # HTTP date (Retry-After) or ISO 8601 (Mastodon's X-RateLimit-Reset)
+        if value[:1].isdigit():
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        else:
+            parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_retry_after(headers: Mapping[str, str], now: float) -> Optional[float]:
+    """:return: absolute time until which requests shouldn't be made, None if unknown."""
+    value = headers.get("Retry-After", None)
+    return None if value is None else _parse_time(value, now)
+
+
+class RateController:
+    """
+    Adaptive request rate and parallelism for one domain (AIMD).
+    Every success additively increases the allowed rate and parallelism,
+    errors, rate limit responses and latency spikes multiplicatively decrease them.
+    `Retry-After` blocks requests until the given time and
+    `X-RateLimit-Remaining`/`X-RateLimit-Reset` cap the rate to the remaining budget.
+    """
+
+    RATE_INCREASE = 0.05
+    """Requests per second added after each success"""
+
+    DECREASE = 0.5
+    """Rate and parallelism multiplier after an error"""
+
+    LATENCY_DECREASE = 0.8
+    """Rate multiplier after a slow response"""
+
+    SLOW_FACTOR = 3
+    """Response is slow if it took this many times longer than the fastest one"""
+
+    MIN_SLOW_LATENCY = 1
+    """Responses faster than this (in seconds) are never considered slow"""
+
+    def __init__(
+        self,
+        period: float,
+        min_period: float,
+        max_period: float,
+        max_parallelism: int = 1,
+    ) -> None:
+        """
+        :param period: initial minimum time between two requests (in seconds).
+        :param min_period: shortest allowed period.
+        :param max_period: longest period after decreases.
+        :param max_parallelism: maximum number of simultaneous requests.
+        """
+        self.min_rate: float = 1 / max_period
+        self.max_rate: float = 1 / min_period if min_period > 0 else float("inf")
+        self.rate: float = 1 / period if period > 0 else self.max_rate
+        self.max_parallelism: int = max_parallelism
+        self.window: float = 1
+        self.blocked_until: float = 0
+        self.min_latency: Optional[float] = None
+        self._budget_rate: Optional[float] = None
+
+    @property
+    def period(self) -> float:
+        """Current minimum time between two requests (in seconds)."""
+        rate = (
+            self.rate
+            if self._budget_rate is None
+            else min(self.rate, self._budget_rate)
+        )
+        return 1 / rate if rate > 0 else float("inf")
+
+    @property
+    def parallelism(self) -> int:
+        """Current maximum number of simultaneous requests."""
+        return int(self.window)
+
+    def _decrease(self, factor: float) -> None:
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.window = max(1.0, self.window * factor)
+
+    def _read_rate_limit(self, headers: Mapping[str, str], now: float) -> None:
+        remaining = headers.get("X-RateLimit-Remaining", None)
+        reset = headers.get("X-RateLimit-Reset", None)
+        if remaining is None or reset is None:
+            return
+        reset_at = _parse_time(reset, now)
+        try:
+            remaining = int(float(remaining))
+        except ValueError:
+            return
+        if reset_at is None or reset_at <= now:
+            self._budget_rate = None
+            return
+        if remaining <= 0:
+            self.blocked_until = max(self.blocked_until, reset_at)
+            self._budget_rate = None
+        else:
+            self._budget_rate = remaining / (reset_at - now)
+
+    def on_response(
+        self, status: int, headers: Mapping[str, str], latency: float
+    ) -> None:
+        now = time.time()
+        self._read_rate_limit(headers, now)
+        if status == 429 or status >= 500:
+            retry_at = parse_retry_after(headers, now)
+            if retry_at is not None:
+                self.blocked_until = max(self.blocked_until, retry_at)
+            self._decrease(RateController.DECREASE)
+            return
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if (
+            latency > RateController.MIN_SLOW_LATENCY
+            and latency > RateController.SLOW_FACTOR * self.min_latency
+        ):
+            self._decrease(RateController.LATENCY_DECREASE)
+            return
+        self.rate = min(self.max_rate, self.rate + RateController.RATE_INCREASE)
+        self.window = min(self.max_parallelism, self.window + 1 / self.window)
+
+    def on_error(self) -> None:
+        """Request failed without response (timeout, connection error)."""
+        self._decrease(RateController.DECREASE)
+
+    def get_stats(self) -> dict:
+        return {
+            "period": self.period,
+            "parallelism": self.parallelism,
+            "blocked_for": max(0.0, self.blocked_until - time.time()),
+        }
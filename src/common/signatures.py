@@ -1,7 +1,6 @@
 import asyncio
 import base64
 import binascii
-import json
 from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
@@ -18,6 +17,8 @@ from Crypto.PublicKey.RSA import RsaKey
 # noinspection PyPackageRequirements
 from Crypto.Signature import pkcs1_15
 
+from common.json_codec import dumps_canonical
+
 
 def _verify(data: str, signer_key: str, signature: str) -> bool:
     s_key = RSA.import_key(signer_key)
@@ -66,7 +67,7 @@ def get_data_to_sign(actor: dict, aux: dict, sign_time: int) -> Optional[str]:
         "key": actor_key,
         "signature_time": sign_time,
     }
-    return json.dumps(to_sign, sort_keys=True, separators=(",", ":"))
+    return dumps_canonical(to_sign)
 
 
 class Verifier:
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Coalesces concurrent calls with the same key into one call.
+    All callers get the result (or the exception) of the call that is in flight.
+    If `ttl` is positive, successful results are also reused for `ttl` seconds.
+    Results are shared, callers must not modify them.
+    """
+
+    CALLS = "calls"
+    COALESCED = "coalesced"
+    CACHED = "cached"
+
+    def __init__(self, ttl: float = 0) -> None:
+        self.ttl: float = ttl
+        self._in_flight: Dict[K, asyncio.Future] = {}
+        self._results: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            SingleFlight.CALLS: 0,
+            SingleFlight.COALESCED: 0,
+            SingleFlight.CACHED: 0,
+        }
+
+    async def run(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        self.stats[SingleFlight.CALLS] += 1
+        if self.ttl > 0 and key in self._results:
+            expires, result = self._results[key]
+            if expires > time.time():
+                self.stats[SingleFlight.CACHED] += 1
+                return result
+        future = self._in_flight.get(key, None)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, func))
+            # the caller might be cancelled, don't warn about unretrieved exceptions
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._in_flight[key] = future
+        else:
+            self.stats[SingleFlight.COALESCED] += 1
+        # cancelling one caller must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def _run(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        try:
+            result = await func()
+        finally:
+            del self._in_flight[key]
+        if self.ttl > 0:
+            self._store(key, result)
+        return result
+
+    def _store(self, key: K, result: V) -> None:
+        now = time.time()
+        # all entries live for the same time, so the oldest are first
+        while self._results and next(iter(self._results.values()))[0] <= now:
+            self._results.popitem(last=False)
+        self._results[key] = (now + self.ttl, result)
+        self._results.move_to_end(key)
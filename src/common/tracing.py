@@ -0,0 +1,294 @@
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+
+class ConnectionStats:
+    """
+    Counts new and reused connections per host using aiohttp request tracing.
+    Only the `max_hosts` most recently connected hosts have their own counts.
+    """
+
+    REUSED = "reused"
+    NEW = "new"
+
+    def __init__(self, max_hosts: int = 1000) -> None:
+        self.max_hosts: int = max_hosts
+        self.per_host: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self.total: Dict[str, int] = {ConnectionStats.REUSED: 0, ConnectionStats.NEW: 0}
+
+    def _count(self, host: str, typ: str) -> None:
+        self.total[typ] += 1
+        if self.max_hosts <= 0:
+            return
+        if host in self.per_host:
+            self.per_host.move_to_end(host)
+        else:
+            self.per_host[host] = {ConnectionStats.REUSED: 0, ConnectionStats.NEW: 0}
+            if len(self.per_host) > self.max_hosts:
+                self.per_host.popitem(last=False)
+        self.per_host[host][typ] += 1
+
+    async def _on_request_start(
+        self, _session, ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        ctx.host = params.url.host
+
+    async def _on_connection_create_end(self, _session, ctx: SimpleNamespace, _params):
+        self._count(ctx.host, ConnectionStats.NEW)
+
+    async def _on_connection_reuseconn(self, _session, ctx: SimpleNamespace, _params):
+        self._count(ctx.host, ConnectionStats.REUSED)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+
+    def get_stats(self, top_hosts: int = 50) -> dict:
+        """Total counts and counts of `top_hosts` hosts with the most connections."""
+        hosts = sorted(
+            self.per_host.items(),
+            key=lambda x: x[1][ConnectionStats.REUSED] + x[1][ConnectionStats.NEW],
+            reverse=True,
+        )
+        return {"total": dict(self.total), "hosts": dict(hosts[:top_hosts])}
+
+
+class Histogram:
+    """Counts of values in fixed buckets (latencies in seconds)."""
+
+    BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(Histogram.BOUNDS) + 1)
+        self.count: int = 0
+        self.sum: float = 0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_left(Histogram.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """:return: upper bound of the bucket containing `q` quantile, inf if above all."""
+        if self.count == 0:
+            return None
+        seen = 0
+        for bound, count in zip(Histogram.BOUNDS, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+    def get_stats(self) -> dict:
+        labels = [f"<={b}" for b in Histogram.BOUNDS] + [f">{Histogram.BOUNDS[-1]}"]
+        return {
+            "count": self.count,
+            "avg": self.count and self.sum / self.count,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {label: c for label, c in zip(labels, self.counts) if c},
+        }
+
+
+class RequestTimings:
+    """
+    Phase timings of one request, filled in by `LatencyStats` trace hooks.
+    Pass it as `trace_request_ctx` of the request and `LatencyStats.record` it
+    once the request ends (however it ends), otherwise it's recorded without
+    the body phase when the response headers arrive.
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.response_at: Optional[float] = None
+        self._marks: Dict[str, float] = {}
+
+    def _add(self, phase: str, duration: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0) + duration
+
+
+class LatencyStats:
+    """
+    Latency histograms of request phases, globally and per host, using aiohttp request tracing.
+    Phases: queued (waiting for a free connection), dns, connect (TCP and TLS handshake),
+    ttfb (request sent to response headers), body (reading the body) and total.
+    Total latency is also kept per outcome: response status or `NO_RESPONSE`.
+    Only the `max_hosts` most recently requested hosts have their own histograms.
+    """
+
+    NO_RESPONSE = "no_response"
+
+    PHASES = ("queued", "dns", "connect", "ttfb", "body", "total")
+
+    def __init__(
+        self,
+        max_hosts: int = 1000,
+        trace: Optional[Callable[..., None]] = None,
+        trace_sample: float = 0.01,
+    ) -> None:
+        """
+        :param max_hosts: maximum number of hosts with their own histograms,
+            the least recently requested host is dropped to make room.
+        :param trace: called with "L", host and phase timings of sampled requests.
+        :param trace_sample: probability that a request is traced.
+        """
+        self.max_hosts: int = max_hosts
+        self.trace: Optional[Callable[..., None]] = trace
+        self.trace_sample: float = trace_sample
+        self.total: Dict[str, Histogram] = {p: Histogram() for p in LatencyStats.PHASES}
+        self.per_host: "OrderedDict[str, Dict[str, Histogram]]" = OrderedDict()
+        self.outcomes: Dict[str, Histogram] = {}
+
+    @staticmethod
+    def _timings(ctx: SimpleNamespace) -> RequestTimings:
+        if not hasattr(ctx, "timings"):
+            if isinstance(ctx.trace_request_ctx, RequestTimings):
+                ctx.timings = ctx.trace_request_ctx
+                ctx.own_timings = False
+            else:
+                ctx.timings = RequestTimings()
+                ctx.own_timings = True
+        return ctx.timings
+
+    async def _on_request_start(
+        self, _session, ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        ctx.host = params.url.host
+        self._timings(ctx)
+
+    async def _on_connection_queued_start(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        self._timings(ctx)._marks["queued"] = time.monotonic()
+
+    async def _on_connection_queued_end(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        timings = self._timings(ctx)
+        timings._add("queued", time.monotonic() - timings._marks["queued"])
+
+    async def _on_connection_create_start(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        timings = self._timings(ctx)
+        timings._marks["connect"] = time.monotonic()
+        timings._marks["dns_before_connect"] = timings.phases.get("dns", 0)
+
+    async def _on_connection_create_end(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        timings = self._timings(ctx)
+        # connection creation includes the host resolution
+        dns = timings.phases.get("dns", 0) - timings._marks["dns_before_connect"]
+        timings._add("connect", time.monotonic() - timings._marks["connect"] - dns)
+
+    async def _on_dns_resolvehost_start(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        self._timings(ctx)._marks["dns"] = time.monotonic()
+
+    async def _on_dns_resolvehost_end(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        timings = self._timings(ctx)
+        timings._add("dns", time.monotonic() - timings._marks["dns"])
+
+    async def _on_request_headers_sent(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        self._timings(ctx)._marks["sent"] = time.monotonic()
+
+    async def _on_request_end(
+        self, _session, ctx: SimpleNamespace, params: aiohttp.TraceRequestEndParams
+    ) -> None:
+        timings = self._timings(ctx)
+        timings.response_at = time.monotonic()
+        sent = timings._marks.get("sent", timings.started)
+        timings.phases["ttfb"] = timings.response_at - sent
+        if ctx.own_timings:
+            # nobody reads the body with tracing
+            self.record(
+                ctx.host, timings, with_body=False, outcome=str(params.response.status)
+            )
+
+    async def _on_request_exception(
+        self, _session, ctx: SimpleNamespace, _params
+    ) -> None:
+        timings = self._timings(ctx)
+        if ctx.own_timings:
+            self.record(
+                ctx.host, timings, with_body=False, outcome=LatencyStats.NO_RESPONSE
+            )
+
+    def record(
+        self,
+        host: Optional[str],
+        timings: RequestTimings,
+        with_body: bool = True,
+        outcome: Optional[str] = None,
+    ) -> None:
+        """
+        Add timings of a finished request, the body was read until now.
+        :param outcome: label of the total latency, e.g. response status.
+        """
+        now = time.monotonic()
+        phases = dict(timings.phases)
+        if with_body and timings.response_at is not None:
+            phases["body"] = now - timings.response_at
+        phases["total"] = now - timings.started
+        for phase, duration in phases.items():
+            self.total[phase].add(duration)
+        if outcome is not None:
+            if outcome not in self.outcomes:
+                self.outcomes[outcome] = Histogram()
+            self.outcomes[outcome].add(phases["total"])
+        if host is not None and self.max_hosts > 0:
+            if host in self.per_host:
+                self.per_host.move_to_end(host)
+            else:
+                self.per_host[host] = {p: Histogram() for p in LatencyStats.PHASES}
+                if len(self.per_host) > self.max_hosts:
+                    self.per_host.popitem(last=False)
+            for phase, duration in phases.items():
+                self.per_host[host][phase].add(duration)
+        if self.trace is not None and random.random() < self.trace_sample:
+            self.trace("L", host, *(f"{p}={d:.4f}" for p, d in sorted(phases.items())))
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_queued_start.append(self._on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_connection_queued_end)
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+        trace_config.on_request_headers_sent.append(self._on_request_headers_sent)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    def get_stats(self, top_hosts: int = 20) -> dict:
+        """Global histograms and histograms of `top_hosts` hosts with the most time spent."""
+        hosts = sorted(
+            self.per_host.items(), key=lambda x: x[1]["total"].sum, reverse=True
+        )
+        return {
+            "total": {p: h.get_stats() for p, h in self.total.items()},
+            "outcomes": {o: h.get_stats() for o, h in self.outcomes.items()},
+            "hosts": {
+                host: {p: h.get_stats() for p, h in phases.items() if h.count}
+                for host, phases in hosts[:top_hosts]
+            },
+        }
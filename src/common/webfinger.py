@@ -1,9 +1,8 @@
 import asyncio
 import logging
-import time
 import traceback
 import urllib.parse
-from typing import Dict, Optional, Tuple, Union
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 from xml.etree.ElementTree import Element
 
@@ -11,7 +10,9 @@ import defusedxml.ElementTree as XmlTree
 from aiohttp import ClientError, ClientSession
 
 from common.activity_streams import get_as_id
+from common.cache import MISSING, TtlCache
 from common.constants import HOST_META_CONTENT_TYPE, WEBFINGER_CONTENT_TYPE
+from common.single_flight import SingleFlight
 
 
 def get_webfinger_uri(actor: str) -> Optional[str]:
@@ -56,9 +57,34 @@ def actor_from_as(
 
 
 class WebFinger:
-    def __init__(self, session: ClientSession) -> None:
+    def __init__(
+        self,
+        session: ClientSession,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600,
+        negative_ttl: float = 300,
+    ) -> None:
+        """
+        :param cache_size: max number of cached actor resolutions and host-meta templates.
+        :param cache_ttl: how long successful results are cached (in seconds).
+        :param negative_ttl: how long failed resolutions are cached (in seconds).
+        """
         self.session: ClientSession = session
-        self.meta_cache: Dict[str, Tuple[float, Union[str, asyncio.Event, None]]] = {}
+        self.meta_cache: TtlCache[str, Optional[str]] = TtlCache(
+            cache_size, cache_ttl, negative_ttl
+        )
+        self.actor_cache: TtlCache[str, Optional[Tuple[str, str]]] = TtlCache(
+            cache_size, cache_ttl, negative_ttl
+        )
+        self.single_flight: SingleFlight = SingleFlight()
+        self.meta_single_flight: SingleFlight = SingleFlight()
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": dict(self.single_flight.stats),
+            "actor_cache": self.actor_cache.get_stats(),
+            "meta_cache": self.meta_cache.get_stats(),
+        }
 
     async def get_webfinger_meta(self, meta_uri: str) -> Optional[Element]:
         try:
@@ -79,27 +105,26 @@ class WebFinger:
             logging.exception(e)
             return None
 
+    async def get_meta_template(self, meta_uri: str) -> Optional[str]:
+        template = self.meta_cache.get(meta_uri)
+        if template is not MISSING:
+            return template
+        return await self.meta_single_flight.run(
+            meta_uri, lambda: self._get_meta_template(meta_uri)
+        )
+
+    async def _get_meta_template(self, meta_uri: str) -> Optional[str]:
+        meta = await self.get_webfinger_meta(meta_uri)
+        template = None
+        if meta is not None:
+            for child in meta:
+                if "rel" in child.attrib and child.attrib["rel"] == "lrdd":
+                    template = child.attrib["template"]
+        self.meta_cache.set(meta_uri, template)
+        return template
+
     async def resolve_webfinger_from_host_meta(self, actor: str) -> Optional[dict]:
-        meta_uri = get_meta_uri(actor)
-        cache = self.meta_cache.get(meta_uri, (0, None))
-        if cache[0] + 3600 < time.time():
-            if cache[0] == -1:
-                await cache[1].wait()
-                cache = self.meta_cache[meta_uri]
-            else:
-                event = asyncio.Event()
-                self.meta_cache[meta_uri] = (-1, event)
-                meta = await self.get_webfinger_meta(meta_uri)
-                if meta is None:
-                    return None
-                template = None
-                for child in meta:
-                    if "rel" in child.attrib and child.attrib["rel"] == "lrdd":
-                        template = child.attrib["template"]
-                cache = (time.time(), template)
-                self.meta_cache[meta_uri] = cache
-                event.set()
-        template = cache[1]
+        template = await self.get_meta_template(get_meta_uri(actor))
         if template is None:
             return None
         uri = template.replace("{uri}", actor)
@@ -107,6 +132,14 @@ class WebFinger:
 
     async def resolve_webfinger(
         self, actor: str, use_meta=True, override_uri=None
+    ) -> Optional[dict]:
+        return await self.single_flight.run(
+            (actor, use_meta, override_uri),
+            lambda: self._resolve_webfinger(actor, use_meta, override_uri),
+        )
+
+    async def _resolve_webfinger(
+        self, actor: str, use_meta: bool, override_uri: Optional[str]
     ) -> Optional[dict]:
         uri = override_uri or get_webfinger_uri(actor)
         if uri is None:
@@ -133,6 +166,15 @@ class WebFinger:
             return None
 
     async def get_actor_webfinger(self, actor: str) -> Optional[Tuple[str, str]]:
+        if actor is None:
+            return None
+        result = self.actor_cache.get(actor)
+        if result is MISSING:
+            result = await self._get_actor_webfinger(actor)
+            self.actor_cache.set(actor, result)
+        return result
+
+    async def _get_actor_webfinger(self, actor: str) -> Optional[Tuple[str, str]]:
         for _ in range(2):
             if actor is None:
                 return None
@@ -157,3 +199,15 @@ class WebFinger:
         if res and res[1] == self_href:
             return res[0]
         return None
+
+    def get_cached_actor_webfinger(self, actor: str, self_href: str) -> Optional[str]:
+        """
+        Like `resolve_actor_webfinger`, but only uses already cached resolutions.
+        :return: webfinger address, None or `MISSING` if the resolution isn't cached.
+        """
+        res = self.actor_cache.get(actor)
+        if res is MISSING:
+            return MISSING
+        if res and res[1] == self_href:
+            return res[0]
+        return None
@@ -0,0 +1,226 @@
+import asyncio
+import math
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from aiohttp import ClientError, ClientSession
+
+from lookup.logging import logger
+from lookup.shard import FoundUri, Shard, domain_shard
+
+SECRET_HEADER = "X-Cluster-Secret"
+
+
+class LeaseTable:
+    """
+    Coordinator's leases of domain buckets to cluster nodes.
+    Domains are split to `buckets` buckets by `domain_shard`.
+    Nodes renew their lease regularly and get their fair share of buckets.
+    A node which didn't renew for `ttl` seconds loses its buckets to other nodes.
+    Buckets above the fair share are released on renewal of the node that has them.
+    The node may not get that response, so it keeps crawling them until its previous
+    lease ends. Released buckets are therefore leased to others only `ttl` seconds
+    later, so a bucket never has two owners.
+    Waiting queue elements of a released bucket aren't handed over, they stay in
+    the database of the previous owner until the bucket is leased to it again.
+    """
+
+    def __init__(self, buckets: int, ttl: float) -> None:
+        self.ttl: float = ttl
+        self.owners: List[Optional[str]] = [None] * buckets
+        # when leases of released buckets held by their previous owners end
+        self.free_at: List[float] = [0] * buckets
+        self.nodes: Dict[str, float] = {}
+
+    def _expire(self, now: float) -> None:
+        expired = {}
+        for node, expires in list(self.nodes.items()):
+            if expires <= now:
+                logger.warning(f"Lease of cluster node {node} expired")
+                expired[node] = expires
+                del self.nodes[node]
+        for bucket, owner in enumerate(self.owners):
+            if owner is not None and owner not in self.nodes:
+                self.owners[bucket] = None
+                self.free_at[bucket] = expired.get(owner, now)
+
+    def renew(self, node: str, now: Optional[float] = None) -> dict:
+        """
+        Renew lease of `node` and rebalance its buckets.
+        :return: lease response, see `ClusterNode.apply_lease`.
+        """
+        now = time.time() if now is None else now
+        self.nodes[node] = now + self.ttl
+        self._expire(now)
+        fair_share = math.ceil(len(self.owners) / len(self.nodes))
+        owned = [b for b, owner in enumerate(self.owners) if owner == node]
+        for bucket in owned[fair_share:]:
+            self.owners[bucket] = None
+            self.free_at[bucket] = now + self.ttl
+        owned = owned[:fair_share]
+        for bucket, owner in enumerate(self.owners):
+            if len(owned) >= fair_share:
+                break
+            if owner is None and self.free_at[bucket] <= now:
+                self.owners[bucket] = node
+                owned.append(bucket)
+
+        nodes = list(self.nodes)
+        node_index = {n: i for i, n in enumerate(nodes)}
+        return {
+            "ttl": self.ttl,
+            "nodes": nodes,
+            "owners": [node_index.get(owner, -1) for owner in self.owners],
+        }
+
+
+class ClusterNode(Shard):
+    """
+    Part of domains crawled by one node of a crawl cluster.
+    The node owns domains of buckets leased from the coordinator, until the lease expires.
+    Uris found for other nodes are posted to their `/cluster/found`,
+    uris whose owner isn't known are kept until the next lease renewal.
+    :param lease_table: leases if this node is the coordinator.
+    """
+
+    MAX_PENDING = 100000
+    """Maximum number of kept uris without a known owner"""
+
+    def __init__(
+        self,
+        node_uri: str,
+        coordinator_uri: str,
+        session: ClientSession,
+        buckets: int,
+        ttl: float,
+        secret: str = "",
+        lease_table: Optional[LeaseTable] = None,
+    ) -> None:
+        super().__init__(0, buckets, [])
+        self.node_uri: str = node_uri.rstrip("/")
+        self.coordinator_uri: str = coordinator_uri.rstrip("/")
+        self.session: ClientSession = session
+        self.ttl: float = ttl
+        self.secret: str = secret
+        self.lease_table: Optional[LeaseTable] = lease_table
+        self.owners: List[Optional[str]] = [None] * buckets
+        self.owned: Set[int] = set()
+        self.lease_until: float = 0
+        self.on_found: Optional[Callable[[List[FoundUri]], Awaitable[None]]] = None
+        self._pending: List[FoundUri] = []
+        self.dropped: int = 0
+
+    def owner(self, domain: str) -> Optional[str]:
+        return self.owners[domain_shard(domain, self.count)]
+
+    def owns(self, domain: str) -> bool:
+        return (
+            time.time() < self.lease_until
+            and domain_shard(domain, self.count) in self.owned
+        )
+
+    def buckets(self) -> Set[int]:
+        if time.time() >= self.lease_until:
+            return set()
+        return set(self.owned)
+
+    def _keep(self, batch: List[FoundUri]) -> None:
+        free = ClusterNode.MAX_PENDING - len(self._pending)
+        self.dropped += max(0, len(batch) - free)
+        self._pending.extend(batch[:free])
+
+    def _deliver(self, target: Optional[str], batch: List[FoundUri]) -> None:
+        if target is None or target == self.node_uri:
+            # bucket isn't leased (or our lease expired), retry after renewal
+            self.forwarded -= len(batch)
+            self._keep(batch)
+            return
+        asyncio.ensure_future(self._post(target, batch))
+
+    async def _post(self, target: str, batch: List[FoundUri]) -> None:
+        try:
+            async with self.session.post(
+                target + "/cluster/found",
+                json={"found": batch},
+                headers={SECRET_HEADER: self.secret},
+            ) as response:
+                if response.status == 200:
+                    return
+                logger.warning(f"Cluster node {target} refused uris: {response.status}")
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Can't send uris to cluster node {target}: {e}")
+        self._keep(batch)
+
+    async def handle_found(self, batch: List[FoundUri]) -> None:
+        """Handle uris sent by other nodes (or kept until the lease renewal)."""
+        owned = []
+        for found in batch:
+            domain = urlparse(found[0]).netloc
+            if self.on_found is not None and self.owns(domain):
+                owned.append(found)
+            else:
+                # owner changed in the meantime
+                self.forward(domain, found)
+        if owned:
+            self.received += len(owned)
+            await self.on_found(owned)
+
+    def apply_lease(self, lease: dict, requested_at: float) -> None:
+        """
+        :param lease: {"ttl": seconds, "nodes": [node uris],
+            "owners": [index of the bucket owner in nodes or -1]}.
+        :param requested_at: local time before the renewal request was sent.
+        """
+        nodes = lease["nodes"]
+        self.owners = [nodes[i] if i >= 0 else None for i in lease["owners"]]
+        self.owned = {
+            b for b, owner in enumerate(self.owners) if owner == self.node_uri
+        }
+        self.lease_until = requested_at + lease["ttl"]
+
+    async def renew(self) -> None:
+        requested_at = time.time()
+        if self.lease_table is not None:
+            lease = self.lease_table.renew(self.node_uri, requested_at)
+        else:
+            async with self.session.post(
+                self.coordinator_uri + "/cluster/lease",
+                json={"node": self.node_uri},
+                headers={SECRET_HEADER: self.secret},
+            ) as response:
+                if response.status != 200:
+                    logger.warning(f"Lease renewal refused: {response.status}")
+                    return
+                lease = await response.json()
+        self.apply_lease(lease, requested_at)
+        pending, self._pending = self._pending, []
+        await self.handle_found(pending)
+
+    async def receive(
+        self, on_found: Callable[[List[FoundUri]], Awaitable[None]]
+    ) -> None:
+        """Keep the lease renewed, uris from other nodes come through the web server."""
+        self.on_found = on_found
+        while True:
+            try:
+                await self.renew()
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Can't renew lease at {self.coordinator_uri}: {e}")
+            except Exception as e:
+                # something went very wrong
+                traceback.print_exc()
+                logger.exception(e)
+            await asyncio.sleep(self.ttl / 4)
+
+    def get_stats(self) -> dict:
+        return {
+            "node": self.node_uri,
+            "buckets": len(self.owned),
+            "lease_valid_for": max(0.0, self.lease_until - time.time()),
+            "forwarded": self.forwarded,
+            "received": self.received,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+        }
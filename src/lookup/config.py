@@ -1,5 +1,5 @@
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 
 class Config:
@@ -31,7 +31,62 @@ class Config:
     """How many parallel requests to make"""
 
     domain_request_period: float = 2
-    """Minimum time between two requests to the same domain"""
+    """
+    Initial minimum time between two requests to the same domain,
+    adapted between `min_domain_request_period` and `max_domain_request_period`
+    based on responses of the domain.
+    """
+
+    min_domain_request_period: float = 2
+    """
+    Shortest time between two requests to the same domain,
+    lower it (e.g. to 0.25) to let the rate grow for domains which respond well
+    """
+
+    max_domain_request_period: float = 60
+    """Longest time between two requests to the same domain after slowing down"""
+
+    max_parallel_per_domain: int = 1
+    """
+    Maximum number of simultaneous requests to the same domain,
+    parallelism grows up to it for domains which respond well
+    """
+
+    host_group_request_period: float = 0
+    """
+    Minimum time between two requests to domains resolved to the same host group
+    (e.g. 0.2), 0 if domains shouldn't be grouped
+    """
+
+    host_group_ipv4_prefix: int = 32
+    """IPv4 addresses in the same network of this prefix length form one host group"""
+
+    host_group_ipv6_prefix: int = 64
+    """IPv6 addresses in the same network of this prefix length form one host group"""
+
+    host_group_networks: List[str] = []
+    """CIDR ranges (e.g. of a hosting provider) whose domains form one host group each"""
+
+    host_group_dns_ttl: float = 3600
+    """How long to keep a domain in its host group before resolving it again in seconds"""
+
+    keep_alive: bool = False
+    """If true, connections are kept open and reused for next requests to the same host"""
+
+    connections_per_host: int = 0
+    """Maximum number of simultaneous connections to one host, 0 if unlimited"""
+
+    keep_alive_timeout: float = 15
+    """How long to keep an idle connection open in seconds"""
+
+    max_response_size: int = 10 * 1024 * 1024
+    """Maximum size of a fetched document in bytes, larger ones are refused"""
+
+    dns_ttl: float = 300
+    """How long to use resolved addresses of a host in seconds"""
+
+    dns_negative_ttl: float = 30
+    """How long to consider a host that failed to resolve unresolvable in seconds"""
 
     check_for_internet_access: float = 10
     """
@@ -60,12 +115,74 @@ class Config:
     max_queue_size: int = 10000
     """Maximum in-memory queue size"""
 
+    visited_filter_fp_rate: float = 0.0001
+    """
+    Probability that a new uri is mistaken for a known one by the in-memory filter
+    of known uris (and isn't crawled), 0 to check every uri in the database
+    """
+
+    visited_filter_capacity: int = 1000000
+    """Minimum number of uris the filter of known uris is sized for"""
+
+    archive_period: float = 0
+    """
+    How often to move queue elements which won't be fetched again to the compact
+    archive in seconds (e.g. 600), 0 to keep them in the queue.
+    Archiving is one-way: only hashes of uris, their domains and states are kept,
+    uris, aux data and validators of archived elements are deleted.
+    """
+
+    archive_batch: int = 10000
+    """Maximum number of queue elements to archive at once"""
+
     min_update_period: int = 3600 * 24
     """Minimum time between object updates in seconds"""
 
     max_update_period: int = 3600 * 24 * 10
     """Maximum time between object updates in seconds"""
 
+    recrawl_window: int = 3600
+    """How far ahead in seconds to load due times of objects to update"""
+
+    recrawl_window_size: int = 10000
+    """Maximum number of due times of objects to update to keep in memory"""
+
+    recrawl_batch: int = 500
+    """Maximum number of objects to move to the update queue at once"""
+
+    webfinger_cache_size: int = 100000
+    """Maximum number of cached WebFinger resolutions (and host-meta templates)"""
+
+    webfinger_cache_ttl: float = 3600 * 24
+    """How long to cache successful WebFinger resolutions in seconds"""
+
+    webfinger_negative_ttl: float = 600
+    """How long to cache failed WebFinger resolutions in seconds"""
+
+    parallel_webfinger: int = 20
+    """How many parallel WebFinger resolutions of found actors to make"""
+
+    webfinger_chunk: int = 1000
+    """How many actors waiting for WebFinger resolution to keep in memory"""
+
+    cluster_node_uri: str = ""
+    """
+    Base uri of this node's web server reachable by other nodes of the crawl cluster,
+    empty if not running in a cluster.
+    """
+
+    cluster_coordinator_uri: str = ""
+    """Base uri of the cluster coordinator, same as `cluster_node_uri` on the coordinator"""
+
+    cluster_secret: str = ""
+    """Secret shared by nodes of the cluster, required if `cluster_node_uri` is set"""
+
+    cluster_buckets: int = 1024
+    """Into how many buckets domains are split for leasing (same on all nodes)"""
+
+    cluster_lease_ttl: float = 60
+    """How long a domain bucket lease is valid without renewal in seconds"""
+
     @staticmethod
     def load(filename):
         with open(filename, "r") as f:
@@ -78,6 +195,20 @@ class Config:
             "archive_collections": bool,
             "parallel_fetches": int,
             "domain_request_period": float,
+            "min_domain_request_period": float,
+            "max_domain_request_period": float,
+            "max_parallel_per_domain": int,
+            "host_group_request_period": float,
+            "host_group_ipv4_prefix": int,
+            "host_group_ipv6_prefix": int,
+            "host_group_networks": list,
+            "host_group_dns_ttl": float,
+            "keep_alive": bool,
+            "connections_per_host": int,
+            "keep_alive_timeout": float,
+            "max_response_size": int,
+            "dns_ttl": float,
+            "dns_negative_ttl": float,
             "check_for_internet_access": float,
             "prob_choose_from_domains": float,
             "scheduler_chunk": int,
@@ -85,8 +216,25 @@ class Config:
             "domain_chunk": int,
             "choose_from_domain_queue": int,
             "max_queue_size": int,
+            "visited_filter_fp_rate": float,
+            "visited_filter_capacity": int,
+            "archive_period": float,
+            "archive_batch": int,
             "min_update_period": int,
             "max_update_period": int,
+            "recrawl_window": int,
+            "recrawl_window_size": int,
+            "recrawl_batch": int,
+            "webfinger_cache_size": int,
+            "webfinger_cache_ttl": float,
+            "webfinger_negative_ttl": float,
+            "parallel_webfinger": int,
+            "webfinger_chunk": int,
+            "cluster_node_uri": str,
+            "cluster_coordinator_uri": str,
+            "cluster_secret": str,
+            "cluster_buckets": int,
+            "cluster_lease_ttl": float,
         }
         unknown_props = set(data.keys() - properties.keys())
         if len(unknown_props) > 0:
@@ -97,3 +245,6 @@ class Config:
         for prop, constr in properties.items():
             if prop in data:
                 setattr(Config, prop, constr(data[prop]))
+
+        if Config.cluster_node_uri and not Config.cluster_secret:
+            raise ValueError("cluster_secret is required in a cluster")
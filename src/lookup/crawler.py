@@ -1,43 +1,99 @@
 import asyncio
-import json
 import random
 import time
 import traceback
 from typing import Dict, Iterable, List, Optional, Tuple
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
 
 from common.activity_streams import get_as_id
-from common.fetcher import FailedFetch, Fetcher, TemporaryFetchError
+from common.fetcher import (
+    FailedFetch,
+    Fetcher,
+    RateLimited,
+    TemporaryFetchError,
+    Validators,
+)
+from common.json_codec import loads
 from common.webfinger import WebFinger
 from lookup.config import Config
-from lookup.constants import FETCH_RETRY_TIMERS, INFINITY_TIME, TRACE_LOG, log_trace
+from lookup.constants import (
+    ACTOR_TYPES,
+    COLLECTION_TYPES,
+    FETCH_RETRY_TIMERS,
+    INFINITY_TIME,
+    TRACE_LOG,
+    log_trace,
+)
 from lookup.database.database import Database
 from lookup.database.domains import DomainState
-from lookup.database.queue import QueueState
+from lookup.database.queue import QueueItem, QueueState
+from lookup.host_groups import HostGroups
 from lookup.logging import event_counter, logger
 from lookup.obj_handler import ObjectHandler
+from lookup.random_set import RandomSet
+from lookup.recrawl import RecrawlScheduler
 from lookup.schedule_queue import Domain, ScheduleQueue
+from lookup.shard import FoundUri, Shard
+from lookup.visited_filter import VisitedFilter
+from lookup.webfinger_resolver import WebfingerResolver
 
 
 class Crawler:
-    def __init__(self, database: Database, fetcher: Fetcher):
+    def __init__(
+        self,
+        database: Database,
+        fetcher: Fetcher,
+        shard: Optional[Shard] = None,
+        visited_filter_path: Optional[str] = None,
+    ):
+        """
+        :param shard: if given, only domains of this shard are crawled,
+            uris of other domains are sent to their shards.
+        :param visited_filter_path: file in which to keep the filter of known uris.
+        """
         self.database: Database = database
         self.fetcher: Fetcher = fetcher
-        self.webfinger: WebFinger = WebFinger(self.fetcher.session)
+        self.shard: Optional[Shard] = shard
+        self.webfinger: WebFinger = WebFinger(
+            self.fetcher.session,
+            Config.webfinger_cache_size,
+            Config.webfinger_cache_ttl,
+            Config.webfinger_negative_ttl,
+        )
         self.items_to_explore: Optional[ScheduleQueue] = None
+        self.recrawl: RecrawlScheduler = RecrawlScheduler(self.database.queue)
+        self.visited: VisitedFilter = VisitedFilter(
+            self.database.queue,
+            Config.visited_filter_fp_rate,
+            Config.visited_filter_capacity,
+            visited_filter_path,
+        )
         self.domains: Dict[str, Domain] = {}
-        self.not_scheduled_domains: List[str] = []
+        self.not_scheduled_domains: RandomSet[str] = RandomSet()
+        self.host_groups: HostGroups = HostGroups(
+            self.fetcher.resolver,
+            Config.host_group_ipv4_prefix,
+            Config.host_group_ipv6_prefix,
+            Config.host_group_networks,
+            ttl=Config.host_group_dns_ttl,
+        )
+        self.webfinger_resolver: WebfingerResolver = WebfingerResolver(
+            self.database, self.webfinger, self.domains
+        )
         self.tasks: List[asyncio.Task] = []
         self.object_handler: Optional[ObjectHandler] = None
         self.internet: Optional[asyncio.Event] = None
         self.active: int = 0
 
     async def run(self, start_uris: Iterable[str] = None):
-        self.items_to_explore = ScheduleQueue(Config.max_queue_size)
+        self.items_to_explore = ScheduleQueue(
+            Config.max_queue_size, lambda item: self.fetcher.prefetch_dns(item.uri)
+        )
         self.internet = asyncio.Event()
         self.object_handler = ObjectHandler(
-            self.database, self.add_if_not_visited, self.webfinger
+            self.database, self.add_all_if_not_visited, self.webfinger_resolver
         )
+        await self.visited.load()
 
         for uri in start_uris:
             parse = urlparse(uri)
@@ -63,11 +119,19 @@ class Crawler:
             if domain.state <= DomainState.Unknown:
                 domain.has_waiting_elements = True
                 if not domain.not_scheduled:
-                    self.not_scheduled_domains.append(domain_name)
+                    self.not_scheduled_domains.add(domain_name)
                     domain.not_scheduled = True
 
+        if self.shard is not None:
+            self.tasks.append(
+                asyncio.create_task(self.shard.receive(self.add_all_if_not_visited))
+            )
+            self.tasks.append(asyncio.create_task(self.shard.forward_periodically()))
+        await self.webfinger_resolver.run()
         self.tasks.append(asyncio.create_task(self._process_queue()))
         self.tasks.append(asyncio.create_task(self._process_update()))
+        if Config.archive_period > 0:
+            self.tasks.append(asyncio.create_task(self._archive_periodically()))
         self.tasks.extend(
             [asyncio.create_task(self._fetch()) for _ in range(Config.parallel_fetches)]
         )
@@ -77,40 +141,55 @@ class Crawler:
             self.internet.set()
 
     async def add_if_not_visited(
-        self, uri: str, found_in: str, priority: bool = False, aux: dict = None
+        self, uri: str, found_in: str, priority: bool = False, aux: str = None
     ) -> None:
-        if uri in ["https://www.w3.org/ns/activitystreams#Public"]:
+        await self.add_all_if_not_visited([(uri, found_in, priority, aux)])
+
+    async def add_all_if_not_visited(self, found: List[FoundUri]) -> None:
+        """Insert uris that aren't in the queue yet, all in one batch."""
+        elements = []
+        for uri, found_in, priority, aux in found:
+            if uri in ["https://www.w3.org/ns/activitystreams#Public"]:
+                continue
+            domain: str = urlsplit(uri).netloc
+            if not self._owns(domain):
+                self.shard.forward(domain, (uri, found_in, priority, aux))
+                continue
+            if uri in self.visited:
+                continue
+            if domain not in self.domains:
+                self.domains[domain] = Domain()
+            state = QueueState.WaitingPriority if priority else QueueState.Waiting
+            if self.domains[domain].state >= DomainState.Unreachable:
+                state = QueueState.Blocked
+            update_time = Config.min_update_period if priority else INFINITY_TIME
+            elements.append((uri, domain, found_in, state, update_time, aux))
+        if not elements:
             return
-        parsed = urlparse(uri)
-        domain: str = parsed.netloc
-        if domain not in self.domains:
-            self.domains[domain] = Domain()
-        state = QueueState.WaitingPriority if priority else QueueState.Waiting
-        if self.domains[domain].state >= DomainState.Unreachable:
-            state = QueueState.Blocked
-        if await self.database.queue.insert(
-            uri,
-            domain,
-            found_in,
-            state,
-            Config.min_update_period if priority else INFINITY_TIME,
-            aux,
-        ):
-            if self.domains[domain].state < DomainState.Unreachable:
-                self.domains[domain].has_waiting_elements = True
-                if (
-                    self.domains[domain].scheduled_items == 0
-                    and not self.domains[domain].not_scheduled
-                ):
-                    self.not_scheduled_domains.append(domain)
-                    self.domains[domain].not_scheduled = True
-            event_counter.on_event(event_counter.NEW_URI_FOUND)
-            event_counter.queue_size += 1
+        new_uris = await self.database.queue.insert_many(elements)
+        self.visited.add_all(e[0] for e in elements)
+        await self.visited.grow_if_full()
+        if not new_uris:
+            return
+        for domain_name in {e[1] for e in elements if e[0] in new_uris}:
+            domain = self.domains[domain_name]
+            if domain.state < DomainState.Unreachable:
+                domain.has_waiting_elements = True
+                if domain.scheduled_items == 0 and not domain.not_scheduled:
+                    self.not_scheduled_domains.add(domain_name)
+                    domain.not_scheduled = True
+        event_counter.on_event(event_counter.NEW_URI_FOUND, len(new_uris))
+        event_counter.queue_size += len(new_uris)
 
     async def stop(self):
         for task in self.tasks:
             task.cancel()
         self.items_to_explore.stop()
+        self.host_groups.stop()
+        await self.webfinger_resolver.stop()
+        if self.shard is not None:
+            self.shard.flush()
+        await self.visited.save()
 
     async def _check_connection(self):
         while True:
@@ -121,9 +200,18 @@ class Crawler:
                 self.internet.clear()
             await asyncio.sleep(Config.check_for_internet_access)
 
+    def _owns(self, domain_name: str) -> bool:
+        return self.shard is None or self.shard.owns(domain_name)
+
     def _is_domain_ok_for_scheduling(self, domain_name: str, domain: Domain) -> bool:
         if domain.is_temp_unreachable():
             return False
+        if not self._owns(domain_name):
+            # domain was leased to another cluster node
+            if domain.not_scheduled:
+                self.not_scheduled_domains.remove(domain_name)
+                domain.not_scheduled = False
+            return False
         if domain.state > DomainState.Unknown:
             if domain.not_scheduled:
                 self.not_scheduled_domains.remove(domain_name)
@@ -133,7 +221,10 @@ class Crawler:
         if domain.scheduled_items > 0 and domain.not_scheduled:
             self.not_scheduled_domains.remove(domain_name)
             domain.not_scheduled = False
-        if domain.scheduled_items >= Config.max_in_queue_per_domain:
+        if (
+            domain.scheduled_items
+            >= Config.max_in_queue_per_domain * domain.parallelism
+        ):
             return False
         return True
 
@@ -144,16 +235,18 @@ class Crawler:
             tries -= 1
             if len(self.not_scheduled_domains) == 0:
                 return None
-            random_domain_name = random.choice(self.not_scheduled_domains)
+            random_domain_name = self.not_scheduled_domains.choice()
             domain = self.domains[random_domain_name]
             if not self._is_domain_ok_for_scheduling(random_domain_name, domain):
                 random_domain_name = None
         return random_domain_name
 
-    async def _schedule_items(self, items):
+    async def _schedule_items(self, items: List[QueueItem]):
+        if Config.host_group_request_period > 0:
+            self._assign_host_groups(items)
         for item in items:
-            uri = item["uri"]
-            domain_name = urlparse(uri).netloc
+            uri = item.uri
+            domain_name = item.domain
             if domain_name not in self.domains:
                 self.domains[domain_name] = Domain()
             domain = self.domains[domain_name]
@@ -163,9 +256,12 @@ class Crawler:
                 event_counter.queue_size -= 1
                 continue
 
-            if domain.is_temp_unreachable():
+            if domain.is_temp_unreachable() or not self._owns(domain_name):
                 continue
-            if domain.scheduled_items >= Config.max_in_queue_per_domain:
+            if (
+                domain.scheduled_items
+                >= Config.max_in_queue_per_domain * domain.parallelism
+            ):
                 continue
 
             if domain.scheduled_items == 0 and domain.not_scheduled:
@@ -173,9 +269,21 @@ class Crawler:
                 domain.not_scheduled = False
             domain.scheduled_items += 1
 
-            await self.database.queue.update_state(uri, -item["state"])
+            await self.database.queue.update_state(uri, -item.state)
             await self.items_to_explore.put(item, domain)
 
+    def _assign_host_groups(self, items: List[QueueItem]):
+        domains = {}
+        for item in items:
+            domain_name = item.domain
+            if domain_name not in self.domains:
+                self.domains[domain_name] = Domain()
+            domain = self.domains[domain_name]
+            if domain.state <= DomainState.Unknown and not domain.is_temp_unreachable():
+                domains[domain_name] = domain
+        # scheduling doesn't wait for DNS, new domains are grouped once resolved
+        self.host_groups.assign_soon(domains)
+
     async def _schedule_random_from_all(self):
         items = await self.database.queue.get_random(Config.scheduler_chunk)
         if len(items) < min(Config.scheduler_chunk, 200):
@@ -186,8 +294,8 @@ class Crawler:
 
     async def _schedule_random_from_domain(self):
         domains = []
-        random.shuffle(self.not_scheduled_domains)
-        for domain_name in self.not_scheduled_domains:
+        # some sampled domains might be unavailable, sample more than needed
+        for domain_name in self.not_scheduled_domains.sample(2 * Config.domain_chunk):
             if self._is_domain_ok_for_scheduling(
                 domain_name, self.domains[domain_name]
             ):
@@ -197,7 +305,7 @@ class Crawler:
         if not domains:
             return await self._schedule_random_from_all()
         # noinspection PyTypeChecker
-        domain_items: Tuple[List[dict]] = await asyncio.gather(
+        domain_items: Tuple[List[QueueItem]] = await asyncio.gather(
             *(
                 self.database.queue.get_random_from_domain(
                     domain_name, Config.choose_from_domain_queue
@@ -210,7 +318,7 @@ class Crawler:
             cnt = 0
             for item in d_items:
                 cnt += 1
-                if item["state"] == QueueState.Waiting:
+                if item.state == QueueState.Waiting:
                     break
                 items.append(item)
             if cnt == 0:
@@ -250,8 +358,12 @@ class Crawler:
                         self.items_to_explore.available,
                         self.items_to_explore.total,
                     )
-                await self.database.queue.set_next_to_update()
-                await asyncio.sleep(2)
+                promoted = await self.recrawl.promote_due()
+                if promoted < Config.recrawl_batch:
+                    await asyncio.sleep(2)
+                else:
+                    # there is a backlog, let other tasks run between batches
+                    await asyncio.sleep(0.1)
 
             except Exception as e:
                 # something went very wrong
@@ -259,6 +371,24 @@ class Crawler:
                 logger.exception(e)
                 await asyncio.sleep(2)
 
+    async def _archive_periodically(self):
+        while True:
+            try:
+                archived = await self.database.queue.archive_terminal(
+                    Config.archive_batch
+                )
+                if archived < Config.archive_batch:
+                    await asyncio.sleep(Config.archive_period)
+                else:
+                    # there is a backlog, let other tasks run between batches
+                    await asyncio.sleep(0.1)
+
+            except Exception as e:
+                # something went very wrong
+                traceback.print_exc()
+                logger.exception(e)
+                await asyncio.sleep(Config.archive_period)
+
     async def _process_queue(self):
         while True:
             try:
@@ -279,28 +409,33 @@ class Crawler:
                 logger.exception(e)
                 await asyncio.sleep(2)
 
-    async def _fetch_single(self, item, domain: Domain):
-        uri = item["uri"]
+    async def _fetch_single(self, item: QueueItem, domain: Domain):
+        uri = item.uri
         parsed_uri = urlparse(uri)
-        domain_name = parsed_uri.netloc
+        domain_name = item.domain
         if domain.state > DomainState.Unknown:
             await self.database.queue.update_state(uri, QueueState.Blocked)
             event_counter.queue_size -= 1
             return
-        if domain.is_temp_unreachable():
-            await self.database.queue.update_state(uri, item["state"])
+        if domain.is_temp_unreachable() or not self._owns(domain_name):
+            await self.database.queue.update_state(uri, item.state)
             return
 
         old_next_req = domain.next_req
         old_fail_streak = domain.fail_streak
+        rate = domain.get_rate()
         try:
-            domain.next_req = max(
-                domain.next_req, time.time() + Config.domain_request_period
-            )
+            domain.next_req = max(domain.next_req, time.time() + rate.period)
             self.active += 1
             if TRACE_LOG:
                 log_trace("F", domain_name, time.time(), self.active)
-            obj = await self.fetcher.fetch_ap(uri)
+            validators: Optional[Validators] = None
+            if item.hash:
+                # refetch of an actor or collection
+                validators = {"etag": item.etag, "last_modified": item.last_modified}
+            obj, validators = await self.fetcher.fetch_ap_conditional(
+                uri, validators, rate
+            )
             if TRACE_LOG:
                 log_trace("FF", domain_name, time.time(), uri, self.active)
             event_counter.on_event(event_counter.PAGE_FETCHED)
@@ -312,6 +447,14 @@ class Crawler:
                     domain_name, domain.fail_streak, domain.next_req
                 )
 
+            if obj is None:
+                await self.object_handler.handle_not_modified(uri, item.hash)
+                if validators:
+                    await self.database.queue.update_validators(
+                        uri, validators.get("etag"), validators.get("last_modified")
+                    )
+                return
+
             oid = get_as_id(obj)
             if oid is not None and oid != uri:
                 # don't visit via this redirect, use object id instead
@@ -321,7 +464,7 @@ class Crawler:
                 received_netloc = urlparse(oid).netloc
                 if received_netloc != parsed_uri.netloc:
                     await self.add_if_not_visited(
-                        oid, domain_name, item["state"] == QueueState.WaitingPriority
+                        oid, domain_name, item.state == QueueState.WaitingPriority
                     )
                     return
                 else:
@@ -329,9 +472,23 @@ class Crawler:
             await self.object_handler.handle(
                 obj,
                 domain_name,
-                item["state"] == QueueState.WaitingPriority,
-                (item["aux"] and json.loads(item["aux"])) or None,
+                item.state == QueueState.WaitingPriority,
+                (item.aux and loads(item.aux)) or None,
+            )
+            if validators and obj.get("type") in ACTOR_TYPES + COLLECTION_TYPES:
+                await self.database.queue.update_validators(
+                    oid or uri, validators.get("etag"), validators.get("last_modified")
+                )
+
+        except RateLimited:
+            # domain isn't down, only asks to slow down, retry once it allows it
+            event_counter.on_event(event_counter.PAGE_FETCH_RATE_LIMITED)
+            if TRACE_LOG:
+                log_trace("FRL", domain_name, time.time(), uri)
+            domain.next_req = max(
+                domain.next_req, rate.blocked_until, time.time() + rate.period
             )
+            await self.database.queue.update_state(uri, item.state)
 
         except TemporaryFetchError:
             event_counter.on_event(event_counter.PAGE_FETCH_TEMP_ERROR)
@@ -353,7 +510,7 @@ class Crawler:
                 await self.database.domains.update(
                     domain_name, domain.fail_streak, domain.next_req
                 )
-                await self.database.queue.update_state(uri, item["state"])
+                await self.database.queue.update_state(uri, item.state)
 
         except FailedFetch:
             if TRACE_LOG:
@@ -380,15 +537,17 @@ class Crawler:
             try:
                 await self.internet.wait()
                 item, domain = await self.items_to_explore.get_first_available()
-                uri = item["uri"]
-                parsed_uri = urlparse(uri)
-                domain_name = parsed_uri.netloc
+                uri = item.uri
+                domain_name = item.domain
                 domain.scheduled_items -= 1
                 if domain.scheduled_items == 0 and not domain.not_scheduled:
                     if domain.has_waiting_elements:
-                        self.not_scheduled_domains.append(domain_name)
+                        self.not_scheduled_domains.add(domain_name)
                         domain.not_scheduled = True
-                await self._fetch_single(item, domain)
+                try:
+                    await self._fetch_single(item, domain)
+                finally:
+                    self.items_to_explore.release(domain)
 
             except Exception as e:
                 # something went terribly wrong
@@ -5,25 +5,49 @@ import aiosqlite
 
 from lookup.constants import COMMIT_AFTER_EVERY_OP
 from lookup.database.aliases import Aliases
+from lookup.database.domain_ids import DomainIds
 from lookup.database.domains import Domains
 from lookup.database.objects import Objects
 from lookup.database.queue import FifoQueue
 from lookup.database.signatures import Signatures
 from lookup.database.stats import Stats
 from lookup.database.verifiers import Verifiers
+from lookup.database.webfinger_queue import WebfingerQueue
+from lookup.logging import logger
+from lookup.shard import Shard
 
 
 class Database:
-    def __init__(self):
+    COMMIT_PERIOD = 3
+    """How often to commit (in seconds)"""
+
+    SHARED_COMMIT_PERIOD = 0.5
+    """
+    How often to commit if the database is shared by crawler processes,
+    writers hold the database lock until commit.
+    """
+
+    SHARED_BUSY_TIMEOUT = 60
+    """How long to wait for the database lock held by other processes (in seconds)"""
+
+    def __init__(self, shard: Optional[Shard] = None, shared: bool = False):
+        """
+        :param shard: if given, only elements of domains in this shard are scheduled.
+        :param shared: True if other processes write to the database too.
+        """
         self.conn: Optional[aiosqlite.Connection] = None
+        self.path: Optional[str] = None
+        self.shared: bool = shared or shard is not None
 
-        self.domains: Domains = Domains()
+        self.domain_ids: DomainIds = DomainIds()
+        self.domains: Domains = Domains(self.domain_ids)
         self.objects: Objects = Objects()
         self.aliases: Aliases = Aliases()
-        self.queue: FifoQueue = FifoQueue()
+        self.queue: FifoQueue = FifoQueue(shard, self.domain_ids)
         self.stats: Stats = Stats()
         self.signatures: Signatures = Signatures()
         self.verifiers: Verifiers = Verifiers()
+        self.webfinger_queue: WebfingerQueue = WebfingerQueue(shard, self.domain_ids)
 
         self._commit_task = (
             None
@@ -32,9 +56,17 @@ class Database:
         )
 
     async def setup(self, path=None):
-        self.conn = await aiosqlite.connect(path or "./out/database.db")
+        self.path = path or "./out/database.db"
+        self.conn = await aiosqlite.connect(
+            self.path,
+            timeout=Database.SHARED_BUSY_TIMEOUT if self.shared else 5,
+        )
         self.conn.row_factory = aiosqlite.Row
+        if self.shared:
+            # readers don't block the writer
+            await self.conn.execute("PRAGMA journal_mode=WAL")
 
+        await self.domain_ids.setup(self.conn)
         await self.domains.setup(self.conn)
         await self.objects.setup(self.conn)
         await self.aliases.setup(self.conn)
@@ -42,13 +74,24 @@ class Database:
         await self.stats.setup(self.conn)
         await self.signatures.setup(self.conn)
         await self.verifiers.setup(self.conn)
+        await self.webfinger_queue.setup(self.conn)
 
     async def _commit_periodically(self):
         while True:
-            await asyncio.sleep(3)
-            await self.conn.commit()
+            await asyncio.sleep(
+                Database.SHARED_COMMIT_PERIOD if self.shared else Database.COMMIT_PERIOD
+            )
+            try:
+                await self.queue.flush()
+                await self.conn.commit()
+            except Exception as e:
+                # e.g. the database is locked by another process for too long,
+                # buffered rows are kept and written by the next attempt
+                logger.exception(e)
 
     async def close(self):
         if self._commit_task is not None:
             self._commit_task.cancel()
+        await self.queue.flush()
+        await self.conn.commit()
         await self.conn.close()
@@ -0,0 +1,160 @@
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import aiosqlite
+
+from lookup.logging import logger
+from lookup.shard import Shard, domain_shard
+
+
+class DomainIds:
+    """
+    Dictionary of domains, lookup tables store integer ids of domains instead of names.
+    Known ids are cached, names are interned, so every use of a domain shares one string.
+    Ids of domains owned by a shard are kept in the temporary table `owned_domain_ids`,
+    so queries can be limited to them without hashing every domain name.
+    """
+
+    SELECT_CHUNK = 500
+    """Maximum number of values in one `IN (...)` query"""
+
+    def __init__(self):
+        self.conn = None
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._max_id: int = 0
+        # (count, buckets) of the shard in owned_domain_ids, ids added since its sync
+        self._owned_key: Optional[Tuple[int, FrozenSet[int]]] = None
+        self._unsynced: List[Tuple[int, str]] = []
+
+    async def setup(self, connection: aiosqlite.Connection):
+        self.conn = connection
+        await self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS domain_ids ("
+            "id INTEGER PRIMARY KEY,"
+            "domain TEXT UNIQUE NOT NULL);"
+        )
+        async with self.conn.execute("SELECT id, domain FROM domain_ids") as cursor:
+            async for row in cursor:
+                self._add(row[0], row[1])
+
+    def _add(self, domain_id: int, name: str) -> None:
+        name = sys.intern(name)
+        if self._owned_key is not None and domain_id not in self._names:
+            self._unsynced.append((domain_id, name))
+        self._ids[name] = domain_id
+        self._names[domain_id] = name
+        self._max_id = max(self._max_id, domain_id)
+
+    async def _load(self, column: str, values: List) -> None:
+        """Cache domains whose `column` is in `values`."""
+        for i in range(0, len(values), DomainIds.SELECT_CHUNK):
+            chunk = values[i : i + DomainIds.SELECT_CHUNK]
+            async with self.conn.execute(
+                "SELECT id, domain FROM domain_ids "
+                f"WHERE {column} IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ) as cursor:
+                async for row in cursor:
+                    self._add(row[0], row[1])
+
+    async def sync_owned(self, shard: Shard) -> None:
+        """Update `owned_domain_ids` to ids of domains currently owned by `shard`."""
+        # ids only grow, so this picks up domains added by other crawler processes
+        async with self.conn.execute(
+            "SELECT id, domain FROM domain_ids WHERE id > $1", [self._max_id]
+        ) as cursor:
+            async for row in cursor:
+                self._add(row[0], row[1])
+        buckets = shard.buckets()
+        key = (shard.count, frozenset(buckets))
+        if key != self._owned_key:
+            await self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS owned_domain_ids (id INTEGER PRIMARY KEY)"
+            )
+            await self.conn.execute("DELETE FROM owned_domain_ids")
+            added = self._ids.items()
+        else:
+            added = ((name, domain_id) for domain_id, name in self._unsynced)
+        await self.conn.executemany(
+            "INSERT OR IGNORE INTO owned_domain_ids(id) VALUES ($1)",
+            [
+                (domain_id,)
+                for name, domain_id in added
+                if domain_shard(name, shard.count) in buckets
+            ],
+        )
+        self._owned_key = key
+        self._unsynced = []
+
+    async def get_ids(self, names: Iterable[str]) -> Dict[str, int]:
+        """:return: ids of domains `names`, unknown domains are assigned new ids."""
+        names = set(names)
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            # other crawler processes may be adding the same domains
+            await self.conn.executemany(
+                "INSERT OR IGNORE INTO domain_ids(domain) VALUES ($1)",
+                [(name,) for name in missing],
+            )
+            await self._load("domain", missing)
+        return {name: self._ids[name] for name in names}
+
+    async def get_id(self, name: str) -> int:
+        """:return: id of domain `name`, assigned if it's unknown."""
+        if name in self._ids:
+            return self._ids[name]
+        return (await self.get_ids([name]))[name]
+
+    async def find(self, name: str) -> Optional[int]:
+        """:return: id of domain `name`, None if it's unknown."""
+        if name not in self._ids:
+            await self._load("domain", [name])
+        return self._ids.get(name)
+
+    async def get_names(self, domain_ids: Iterable[Optional[int]]) -> Dict[int, str]:
+        """:return: names of domains by their ids (None ids are skipped)."""
+        domain_ids = {i for i in domain_ids if i is not None}
+        missing = [i for i in domain_ids if i not in self._names]
+        if missing:
+            # added by another crawler process
+            await self._load("id", missing)
+        return {i: self._names[i] for i in domain_ids}
+
+    async def migrate_table(self, table: str, create: str, columns: List[str]) -> None:
+        """
+        Replace domain names in `columns` of `table` created before domain ids were used.
+        :param create: statement creating `table` with integer `columns`.
+        """
+        async with self.conn.execute(f"PRAGMA table_info({table})") as cursor:
+            old_columns = {row[1]: row[2] async for row in cursor}
+        if old_columns.get(columns[0], "").upper() != "TEXT":
+            return
+        logger.info(f"Replacing domain names in table {table} by ids")
+        for column in columns:
+            await self.conn.execute(
+                f"INSERT OR IGNORE INTO domain_ids(domain) SELECT DISTINCT {column} "
+                f"FROM {table} WHERE {column} IS NOT NULL"
+            )
+        await self.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_names")
+        await self.conn.execute(create)
+        async with self.conn.execute(f"PRAGMA table_info({table})") as cursor:
+            new_columns = [tuple(row) async for row in cursor]
+        copied = [row[1] for row in new_columns if row[1] in old_columns]
+        values = [
+            f"(SELECT id FROM domain_ids WHERE domain = {table}_names.{c})"
+            if c in columns
+            else c
+            for c in copied
+        ]
+        if not any(row[5] and row[2].upper() == "INTEGER" for row in new_columns):
+            # keep rowids unless a column is their alias
+            copied.insert(0, "rowid")
+            values.insert(0, "rowid")
+        await self.conn.execute(
+            f"INSERT INTO {table}({', '.join(copied)}) "
+            f"SELECT {', '.join(values)} FROM {table}_names"
+        )
+        await self.conn.execute(f"DROP TABLE {table}_names")
+        await self.conn.commit()
+        await self.setup(self.conn)
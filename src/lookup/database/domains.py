@@ -1,9 +1,10 @@
 from enum import IntEnum
-from typing import List
+from typing import List, Optional
 
 import aiosqlite
 
 from lookup.constants import COMMIT_AFTER_EVERY_OP
+from lookup.database.domain_ids import DomainIds
 
 
 class DomainState(IntEnum):
@@ -15,25 +16,32 @@ class DomainState(IntEnum):
 
 
 class Domains:
-    def __init__(self):
+    CREATE_TABLE = (
+        "CREATE TABLE IF NOT EXISTS domains ("
+        "domain INTEGER PRIMARY KEY,"  # id in domain_ids
+        "next_req REAL,"  # next retry time
+        "fail_streak INTEGER,"  # number of failed requests in a row
+        "state INTEGER NOT NULL);"
+    )
+
+    def __init__(self, domain_ids: Optional[DomainIds] = None):
         self.conn = None
+        self.domain_ids: DomainIds = domain_ids or DomainIds()
 
     async def setup(self, connection: aiosqlite.Connection):
         self.conn = connection
-        await self.conn.execute(
-            "CREATE TABLE IF NOT EXISTS domains ("
-            "domain TEXT PRIMARY KEY,"
-            "next_req REAL,"  # next retry time
-            "fail_streak INTEGER,"  # number of failed requests in a row
-            "state INTEGER NOT NULL);"
-        )
+        if self.domain_ids.conn is None:
+            await self.domain_ids.setup(connection)
+        await self.conn.execute(Domains.CREATE_TABLE)
+        await self.domain_ids.migrate_table("domains", Domains.CREATE_TABLE, ["domain"])
 
     async def get_all(self) -> List[dict]:
         async with self.conn.execute("SELECT * FROM domains") as cursor:
-            ret = []
-            async for row in cursor:
-                ret.append(dict(row))
-            return ret
+            ret = [dict(row) async for row in cursor]
+        names = await self.domain_ids.get_names(row["domain"] for row in ret)
+        for row in ret:
+            row["domain"] = names[row["domain"]]
+        return ret
 
     async def count_by_state(self, state: DomainState) -> List[dict]:
         async with self.conn.execute(
@@ -51,6 +59,7 @@ class Domains:
             return row[0]
 
     async def update_state(self, domain: str, state: DomainState) -> None:
+        domain = await self.domain_ids.get_id(domain)
         async with self.conn.execute(
             "UPDATE domains SET state = $1 WHERE domain = $2",
             [state, domain],
@@ -66,6 +75,7 @@ class Domains:
             await self.conn.commit()
 
     async def update(self, domain: str, fail_streak: int, next_req: float) -> None:
+        domain = await self.domain_ids.get_id(domain)
         async with self.conn.execute(
             "REPLACE INTO domains(domain, fail_streak, next_req, state) "
             f"VALUES ($1, $2, $3, {DomainState.Unknown})",
@@ -1,10 +1,11 @@
-import json
 import time
 from enum import IntEnum
 from typing import AsyncIterable, List, Optional
 
 import aiosqlite
 
+from common.activity_streams import serialize
+from common.json_codec import dumps
 from lookup.constants import COMMIT_AFTER_EVERY_OP
 
 
@@ -34,7 +35,27 @@ class Objects:
         async with self.conn.execute(
             "REPLACE INTO as_objects(uri, type, json, last_update, aux)"
             "VALUES ($1, $2, $3, $4, $5)",
-            [uri, typ, json.dumps(obj), time.time(), json.dumps(aux)],
+            [uri, typ, serialize(obj), time.time(), dumps(aux)],
+        ):
+            if COMMIT_AFTER_EVERY_OP:
+                await self.conn.commit()
+
+    async def insert_keeping_aux(
+        self, uri: str, obj: dict, typ: AsObjectType, aux: Optional[dict] = None
+    ) -> None:
+        """Like `insert`, but an already stored object keeps its aux."""
+        async with self.conn.execute(
+            "INSERT INTO as_objects(uri, type, json, last_update, aux)"
+            "VALUES ($1, $2, $3, $4, $5) ON CONFLICT(uri) DO UPDATE SET "
+            "type=excluded.type, json=excluded.json, last_update=excluded.last_update",
+            [uri, typ, serialize(obj), time.time(), dumps(aux)],
+        ):
+            if COMMIT_AFTER_EVERY_OP:
+                await self.conn.commit()
+
+    async def update_aux(self, uri: str, aux: Optional[dict]) -> None:
+        async with self.conn.execute(
+            "UPDATE as_objects SET aux=$1 WHERE uri=$2", [dumps(aux), uri]
         ):
             if COMMIT_AFTER_EVERY_OP:
                 await self.conn.commit()
@@ -1,12 +1,16 @@
+import asyncio
+import hashlib
 import time
 from enum import IntEnum
 from random import randint
-from typing import List
+from typing import AsyncIterable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 import aiosqlite
 
-from lookup.constants import COMMIT_AFTER_EVERY_OP
-from lookup.logging import event_counter
+from lookup.constants import COMMIT_AFTER_EVERY_OP, INFINITY_TIME
+from lookup.database.domain_ids import DomainIds
+from lookup.logging import event_counter, logger
+from lookup.shard import Shard
 
 MAX_QUEUE_ID = 2**30
 
@@ -15,6 +19,13 @@ def rand_queue_id():
     return randint(0, MAX_QUEUE_ID)
 
 
+def uri_hash(uri: str) -> int:
+    """:return: 64-bit hash of `uri` identifying it in the archive."""
+    return int.from_bytes(
+        hashlib.blake2b(uri.encode(), digest_size=8).digest(), "little", signed=True
+    )
+
+
 class QueueState(IntEnum):
     """
     All Waiting > 0
@@ -32,23 +43,114 @@ class QueueState(IntEnum):
     WaitingPriority = 2
 
 
+class QueueItem(NamedTuple):
+    """Element of the queue scheduled for fetching, with only the fields the fetch needs."""
+
+    uri: str
+    domain: str
+    state: int
+    aux: Optional[str]
+    hash: Optional[str]
+    """Hash of the last fetched data, set for refetched actors and collections"""
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
 class FifoQueue:
-    def __init__(self):
+    """
+    Persistent crawl queue.
+    Writes are buffered and flushed in batches: inserts are flushed as soon as
+    the event loop is free and resolve to the uris which were new,
+    state updates are write-behind and flushed with the next batch,
+    before any query that depends on the queue state or when too many are buffered.
+    """
+
+    FLUSH_SIZE = 500
+    """Number of buffered state updates that triggers a flush"""
+
+    RETRY_PERIOD = 1
+    """How long to wait before writing buffered rows again after a failure (in seconds)"""
+
+    SELECT_CHUNK = 500
+    """Maximum number of uris in one `IN (...)` query"""
+
+    TERMINAL_CONDITION = (
+        f"(state IN ({QueueState.Failed}, {QueueState.Redirected}, {QueueState.Blocked})"
+        f" OR (state = {QueueState.Fetched}"
+        f" AND (next_update IS NULL OR update_time >= {INFINITY_TIME})))"
+    )
+    """Elements which will never be fetched again"""
+
+    CREATE_TABLE = (
+        "CREATE TABLE IF NOT EXISTS queue ("
+        "queue_id INTEGER,"  # for selecting random element
+        "uri TEXT PRIMARY KEY,"  # uri of the resource
+        "domain INTEGER,"  # id of the domain of the resource in domain_ids
+        "found_in INTEGER,"  # id of the domain in which uri was found
+        "state INTEGER,"  # state of the entry QueueState
+        "next_update INTEGER,"  # when is the next update scheduled for
+        "update_time INTEGER,"  # time between two updates
+        "hash TEXT,"  # hash of the last crawled data
+        "etag TEXT,"  # ETag of the last crawled data
+        "last_modified TEXT,"  # Last-Modified of the last crawled data
+        "aux TEXT);"  # other data needed for the object handler
+    )
+
+    # terminal elements moved out of the queue by `archive_terminal`,
+    # they are only needed to recognise known uris and for stats
+    CREATE_ARCHIVE = (
+        "CREATE TABLE IF NOT EXISTS queue_archive ("
+        "hash INTEGER PRIMARY KEY,"  # uri_hash of the uri
+        "domain INTEGER,"
+        "state INTEGER);"
+    )
+
+    ITEM_COLUMNS = ", ".join(QueueItem._fields)
+    """Columns selected for `QueueItem`"""
+
+    def __init__(
+        self, shard: Optional[Shard] = None, domain_ids: Optional[DomainIds] = None
+    ):
+        """
+        :param domain_ids: dictionary of domains shared with other tables.
+        """
         self.conn = None
+        self.shard: Optional[Shard] = shard
+        self.domain_ids: DomainIds = domain_ids or DomainIds()
+        self._inserts: Dict[str, list] = {}
+        self._flushing_inserts: Dict[str, list] = {}
+        self._insert_waiters: List[Tuple[List[str], asyncio.Future]] = []
+        # uris found new by flushes that failed, possibly after inserting them
+        self._failed_new: Set[str] = set()
+        self._updates: Dict[str, dict] = {}
+        self._flushing_updates: Dict[str, dict] = {}
+        self._flush_lock: asyncio.Lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _shard_filter(self) -> str:
+        """Condition limiting queries to domains of `shard` (empty if not sharded)."""
+        if self.shard is None:
+            return ""
+        await self.domain_ids.sync_owned(self.shard)
+        return " AND domain IN (SELECT id FROM owned_domain_ids)"
 
     async def setup(self, connection: aiosqlite.Connection):
         self.conn = connection
-        await self.conn.execute(
-            "CREATE TABLE IF NOT EXISTS queue ("
-            "queue_id INTEGER,"  # for selecting random element
-            "uri TEXT PRIMARY KEY,"  # uri of the resource
-            "domain TEXT,"  # domain of the resource
-            "found_in TEXT,"  # domain in which uri was found
-            "state INTEGER,"  # state of the entry QueueState
-            "next_update INTEGER,"  # when is the next update scheduled for
-            "update_time INTEGER,"  # time between two updates
-            "hash TEXT,"  # hash of the last crawled data
-            "aux TEXT);"  # other data needed for the object handler
+        if self.domain_ids.conn is None:
+            await self.domain_ids.setup(connection)
+        await self.conn.execute(FifoQueue.CREATE_TABLE)
+        async with self.conn.execute("PRAGMA table_info(queue)") as cursor:
+            columns = [row[1] async for row in cursor]
+        for column in ["etag", "last_modified"]:
+            if column not in columns:
+                await self.conn.execute(f"ALTER TABLE queue ADD COLUMN {column} TEXT")
+        await self.conn.execute(FifoQueue.CREATE_ARCHIVE)
+        # indexes of migrated tables are dropped with them and created below
+        await self.domain_ids.migrate_table(
+            "queue", FifoQueue.CREATE_TABLE, ["domain", "found_in"]
+        )
+        await self.domain_ids.migrate_table(
+            "queue_archive", FifoQueue.CREATE_ARCHIVE, ["domain"]
         )
         await self.conn.execute(
             "CREATE INDEX IF NOT EXISTS queue_domain_state_id_idx "
@@ -66,16 +168,18 @@ class FifoQueue:
             f"ON queue(next_update) WHERE state={QueueState.Fetched};"
         )
 
+        shard_filter = await self._shard_filter()
         await self.conn.execute(
             f"UPDATE queue SET state={QueueState.WaitingPriority} "
-            f"WHERE state={QueueState.ProcessingPriority}"
+            f"WHERE state={QueueState.ProcessingPriority}" + shard_filter
         )
         await self.conn.execute(
             f"UPDATE queue SET state={QueueState.Waiting} "
-            f"WHERE state={QueueState.Processing}"
+            f"WHERE state={QueueState.Processing}" + shard_filter
         )
 
     async def get_size(self) -> int:
+        await self.flush()
         async with self.conn.execute(
             f"SELECT count(*) FROM queue WHERE state = {QueueState.WaitingPriority}",
         ) as cursor:
@@ -95,149 +199,376 @@ class FifoQueue:
         Elements are compared based on URI. If URI already exists, no-op.
         :return: true if element is inserted else false.
         """
-        async with self.conn.execute(
-            "INSERT OR IGNORE INTO queue(uri, domain, found_in, state, "
-            "queue_id, aux, next_update, update_time)"
-            "VALUES ($1, $2, $3, $4, $5, $6, $7, $8)",
-            [
+        return uri in await self.insert_many(
+            [(uri, domain, found_in, state, update_time, aux)]
+        )
+
+    async def insert_many(
+        self,
+        elements: Iterable[Tuple[str, str, str, QueueState, int, Optional[str]]],
+    ) -> Set[str]:
+        """
+        Insert new uris to queue, existing uris are left as they are.
+        All of them are written in the same batch.
+        :param elements: (uri, domain, found_in, state, update_time, aux) tuples.
+        :return: uris which were inserted.
+        """
+        now = time.time()
+        uris = []
+        for uri, domain, found_in, state, update_time, aux in elements:
+            if uri in self._inserts:
+                continue
+            self._inserts[uri] = [
                 uri,
                 domain,
                 found_in,
                 int(state),
                 rand_queue_id(),
                 aux,
-                int(time.time() + update_time),
+                int(now + update_time),
                 int(update_time),
-            ],
+            ]
+            uris.append(uri)
+        if not uris:
+            return set()
+        future = asyncio.get_running_loop().create_future()
+        self._insert_waiters.append((uris, future))
+        self._schedule_flush()
+        return await future
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        # let other coroutines add their writes to the same batch
+        await asyncio.sleep(0)
+        while True:
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                # writes stay buffered, inserting coroutines wait for the retry
+                logger.exception(e)
+                await asyncio.sleep(FifoQueue.RETRY_PERIOD)
+
+    async def flush(self) -> None:
+        """
+        Write all buffered inserts and updates to the database in one transaction.
+        If writing fails, they stay buffered and inserts are resolved by the next flush.
+        """
+        async with self._flush_lock:
+            if not self._inserts and not self._updates:
+                return
+            self._flushing_inserts, self._inserts = self._inserts, {}
+            self._flushing_updates, self._updates = self._updates, {}
+            waiters, self._insert_waiters = self._insert_waiters, []
+            new_uris: Set[str] = set()
+            try:
+                rows, new_uris = await self._new_rows(self._flushing_inserts)
+                if rows:
+                    await self.conn.executemany(
+                        "INSERT OR IGNORE INTO queue(uri, domain, found_in, state, "
+                        "queue_id, aux, next_update, update_time)"
+                        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8)",
+                        rows,
+                    )
+                await self._flush_updates(self._flushing_updates)
+                if COMMIT_AFTER_EVERY_OP:
+                    await self.conn.commit()
+            except Exception:
+                # a part of the rows may be written already (the transaction goes on),
+                # the retry finds them in the queue, but they are still new
+                self._failed_new.update(new_uris)
+                # keep the rows for the next flush, writes buffered meanwhile are newer
+                for uri, params in self._flushing_inserts.items():
+                    self._inserts.setdefault(uri, params)
+                for uri, values in self._flushing_updates.items():
+                    self._updates[uri] = {**values, **self._updates.get(uri, {})}
+                self._insert_waiters = waiters + self._insert_waiters
+                raise
+            finally:
+                self._flushing_inserts, self._flushing_updates = {}, {}
+            if self._failed_new:
+                flushed = {uri for uris, _ in waiters for uri in uris}
+                new_uris.update(self._failed_new.intersection(flushed))
+                self._failed_new.difference_update(flushed)
+            for uris, future in waiters:
+                if not future.done():
+                    future.set_result(new_uris.intersection(uris))
+
+    async def _new_rows(self, inserts: Dict[str, list]) -> Tuple[List[list], Set[str]]:
+        """:return: queue rows of `inserts` not in the queue yet and their uris."""
+        if not inserts:
+            return [], set()
+        uris = list(inserts.keys())
+        existing = set()
+        for i in range(0, len(uris), FifoQueue.SELECT_CHUNK):
+            chunk = uris[i : i + FifoQueue.SELECT_CHUNK]
+            async with self.conn.execute(
+                f"SELECT uri FROM queue WHERE uri IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ) as cursor:
+                async for row in cursor:
+                    existing.add(row[0])
+        hashes = {uri_hash(uri): uri for uri in uris if uri not in existing}
+        existing.update(await self._get_archived(hashes))
+        new = [params for uri, params in inserts.items() if uri not in existing]
+        ids = await self.domain_ids.get_ids(
+            {p[1] for p in new}.union(p[2] for p in new if p[2] is not None)
+        )
+        rows = [[p[0], ids[p[1]], ids.get(p[2])] + p[3:] for p in new]
+        return rows, set(uris) - existing
+
+    async def _get_archived(self, hashes: Dict[int, str]) -> List[str]:
+        """:return: uris (given by their hashes) which are archived."""
+        archived = []
+        keys = list(hashes.keys())
+        for i in range(0, len(keys), FifoQueue.SELECT_CHUNK):
+            chunk = keys[i : i + FifoQueue.SELECT_CHUNK]
+            async with self.conn.execute(
+                "SELECT hash FROM queue_archive "
+                f"WHERE hash IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ) as cursor:
+                async for row in cursor:
+                    archived.append(hashes[row[0]])
+        return archived
+
+    async def archive_terminal(self, count: int) -> int:
+        """
+        Move up to `count` elements which will never be fetched again to the archive,
+        which keeps only hashes of their uris, domains and states.
+        :return: number of archived elements.
+        """
+        await self.flush()
+        shard_filter = await self._shard_filter()
+        async with self.conn.execute(
+            "SELECT rowid, uri, domain, state FROM queue "
+            f"WHERE {FifoQueue.TERMINAL_CONDITION} {shard_filter} LIMIT $1",
+            [count],
         ) as cursor:
-            if COMMIT_AFTER_EVERY_OP:
-                await self.conn.commit()
-            return cursor.rowcount == 1
+            rows = [tuple(row) async for row in cursor]
+        if not rows:
+            return 0
+        await self.conn.executemany(
+            "INSERT OR REPLACE INTO queue_archive(hash, domain, state) "
+            "VALUES ($1, $2, $3)",
+            [(uri_hash(uri), domain, state) for _, uri, domain, state in rows],
+        )
+        await self.conn.executemany(
+            "DELETE FROM queue WHERE rowid = $1", [(row[0],) for row in rows]
+        )
+        if COMMIT_AFTER_EVERY_OP:
+            await self.conn.commit()
+        return len(rows)
 
-    async def set_next_to_update(self) -> None:
-        await self.conn.execute(
-            "UPDATE queue "
-            f"SET state = {QueueState.WaitingPriority} "
-            f"WHERE state = {QueueState.Fetched} "
-            "AND next_update <= $1",
-            [int(time.time())],
+    async def _flush_updates(self, updates: Dict[str, dict]) -> None:
+        by_columns: Dict[Tuple[str, ...], list] = {}
+        for uri, values in updates.items():
+            columns = tuple(sorted(values.keys()))
+            by_columns.setdefault(columns, []).append(
+                [values[c] for c in columns] + [uri]
+            )
+        for columns, params in by_columns.items():
+            assignments = ", ".join(f"{c}=${i + 1}" for i, c in enumerate(columns))
+            await self.conn.executemany(
+                f"UPDATE queue SET {assignments} WHERE uri=${len(columns) + 1}",
+                params,
+            )
+
+    def _buffer_update(self, uri: str, values: dict) -> None:
+        if uri in self._updates:
+            self._updates[uri].update(values)
+        else:
+            self._updates[uri] = values
+        if len(self._updates) >= FifoQueue.FLUSH_SIZE:
+            self._schedule_flush()
+
+    async def get_next_to_update(
+        self, until_time: int, count: int
+    ) -> List[Tuple[int, str]]:
+        """
+        Fetched elements that are due for an update before `until_time`.
+        :return: up to `count` (next_update, uri) pairs ordered by next_update.
+        """
+        await self.flush()
+        shard_filter = await self._shard_filter()
+        async with self.conn.execute(
+            "SELECT next_update, uri FROM queue "
+            f"WHERE state = {QueueState.Fetched} AND next_update <= $1 "
+            f"{shard_filter} ORDER BY next_update LIMIT $2",
+            [until_time, count],
+        ) as cursor:
+            return [(row[0], row[1]) async for row in cursor]
+
+    async def set_to_update(self, uris: List[str], now: int) -> None:
+        """Move fetched elements that are due for an update to the priority queue."""
+        await self.flush()
+        await self.conn.executemany(
+            f"UPDATE queue SET state = {QueueState.WaitingPriority} "
+            f"WHERE uri = $1 AND state = {QueueState.Fetched} AND next_update <= $2",
+            [(uri, now) for uri in uris],
         )
         if COMMIT_AFTER_EVERY_OP:
             await self.conn.commit()
 
-    async def get_last(self, count: int) -> List[dict]:
+    async def _to_elements(self, rows: List[aiosqlite.Row]) -> List[dict]:
+        """:return: `rows` as dicts with domain names instead of their ids."""
+        elements = [dict(row) for row in rows]
+        names = await self.domain_ids.get_names(
+            {e["domain"] for e in elements}.union(e["found_in"] for e in elements)
+        )
+        for element in elements:
+            element["domain"] = names.get(element["domain"])
+            element["found_in"] = names.get(element["found_in"])
+        return elements
+
+    async def _to_items(self, rows: List[aiosqlite.Row]) -> List[QueueItem]:
+        """:return: `rows` of `ITEM_COLUMNS` as items with domain names instead of ids."""
+        names = await self.domain_ids.get_names(row[1] for row in rows)
+        return [
+            QueueItem(uri, names[domain], state, aux, ohash, etag, last_modified)
+            for uri, domain, state, aux, ohash, etag, last_modified in rows
+        ]
+
+    async def get_last(self, count: int) -> List[QueueItem]:
+        await self.flush()
+        shard_filter = await self._shard_filter()
         async with self.conn.execute(
-            "SELECT * FROM queue "
+            f"SELECT {FifoQueue.ITEM_COLUMNS} FROM queue "
             f"WHERE (state = {QueueState.WaitingPriority} OR state = {QueueState.Waiting}) "
-            "ORDER BY state DESC, queue_id DESC LIMIT $1",
+            f"{shard_filter} ORDER BY state DESC, queue_id DESC LIMIT $1",
             [count],
         ) as cursor:
-            ret = []
-            async for row in cursor:
-                ret.append(dict(row))
-                if len(ret) >= count:
-                    break
-            return ret
+            rows = await cursor.fetchmany(count)
+        return await self._to_items(rows)
 
-    async def get_random(self, count: int) -> List[dict]:
+    async def get_random(self, count: int) -> List[QueueItem]:
+        await self.flush()
+        shard_filter = await self._shard_filter()
         async with self.conn.execute(
-            "SELECT * FROM queue "
+            f"SELECT {FifoQueue.ITEM_COLUMNS} FROM queue "
             f"WHERE (state = {QueueState.WaitingPriority} OR state = {QueueState.Waiting}) "
-            "AND queue_id > $1 "
+            f"AND queue_id > $1 {shard_filter} "
             "ORDER BY state DESC, queue_id LIMIT $2",
             [rand_queue_id(), count],
         ) as cursor:
-            ret = []
             event_counter.on_event(event_counter.SCHEDULE_RANDOM)
-            async for row in cursor:
-                ret.append(dict(row))
-                if len(ret) >= count:
-                    break
-            if not ret:
-                return await self.get_last(count)
-            return ret
-
-    async def get_last_from_domain(self, domain: str, count: int) -> List[dict]:
+            rows = await cursor.fetchmany(count)
+        if not rows:
+            return await self.get_last(count)
+        return await self._to_items(rows)
+
+    async def get_last_from_domain(self, domain: str, count: int) -> List[QueueItem]:
+        await self.flush()
+        domain_id = await self.domain_ids.find(domain)
+        if domain_id is None:
+            return []
         async with self.conn.execute(
-            "SELECT * FROM queue "
+            f"SELECT {FifoQueue.ITEM_COLUMNS} FROM queue "
             f"WHERE (state = {QueueState.WaitingPriority}) "
             "AND domain = $1 "
             "ORDER BY state DESC, queue_id DESC LIMIT $2",
-            [domain, count],
+            [domain_id, count],
         ) as cursor:
-            ret = []
-            async for row in cursor:
-                ret.append(dict(row))
-                if len(ret) >= count:
-                    break
-            return ret
+            rows = await cursor.fetchmany(count)
+        return await self._to_items(rows)
 
-    async def get_random_from_domain(self, domain: str, count: int) -> List[dict]:
+    async def get_random_from_domain(self, domain: str, count: int) -> List[QueueItem]:
+        await self.flush()
+        domain_id = await self.domain_ids.find(domain)
+        if domain_id is None:
+            return []
         async with self.conn.execute(
-            "SELECT * FROM queue "
+            f"SELECT {FifoQueue.ITEM_COLUMNS} FROM queue "
             f"WHERE (state = {QueueState.WaitingPriority}) "
             "AND domain = $1 AND queue_id > $2 "
             "ORDER BY state DESC, queue_id LIMIT $3",
-            [domain, rand_queue_id(), count],
+            [domain_id, rand_queue_id(), count],
         ) as cursor:
-            ret = []
             event_counter.on_event(event_counter.SCHEDULE_RANDOM_FROM_DOMAIN)
-            async for row in cursor:
-                ret.append(dict(row))
-                if len(ret) >= count:
-                    break
-            if not ret:
-                return await self.get_last_from_domain(domain, count)
-            return ret
+            rows = await cursor.fetchmany(count)
+        if not rows:
+            return await self.get_last_from_domain(domain, count)
+        return await self._to_items(rows)
 
     async def get_waiting_domains(self) -> List[str]:
+        await self.flush()
+        shard_filter = await self._shard_filter()
         async with self.conn.execute(
             "SELECT domain FROM queue "
             f"WHERE (state = {QueueState.WaitingPriority} OR state = {QueueState.Waiting}) "
-            "GROUP BY domain",
+            f"{shard_filter} GROUP BY domain",
         ) as cursor:
-            ret = []
-            async for row in cursor:
-                ret.append(row["domain"])
-            return ret
+            domain_ids = [row[0] async for row in cursor]
+        return list((await self.domain_ids.get_names(domain_ids)).values())
 
     async def get_domain_count_by_state(self, state: QueueState) -> List[str]:
+        await self.flush()
         async with self.conn.execute(
-            f"SELECT count(DISTINCT domain) FROM queue WHERE state = {state}",
+            "SELECT count(DISTINCT domain) FROM ("
+            f"SELECT domain FROM queue WHERE state = {state} "
+            f"UNION SELECT domain FROM queue_archive WHERE state = {state})",
         ) as cursor:
             row = await cursor.fetchone()
             return row[0]
 
-    async def get_element(self, uri: str) -> dict:
+    async def get_element(self, uri: str) -> Optional[dict]:
+        if uri in self._inserts or uri in self._flushing_inserts:
+            await self.flush()
         async with self.conn.execute(
             "SELECT * FROM queue WHERE uri = $1", [uri]
         ) as cursor:
             row = await cursor.fetchone()
-            return row and dict(row)
+        if row is None:
+            return None
+        (element,) = await self._to_elements([row])
+        element.update(self._flushing_updates.get(uri, {}))
+        element.update(self._updates.get(uri, {}))
+        return element
+
+    async def get_last_rowid(self) -> int:
+        await self.flush()
+        async with self.conn.execute("SELECT max(rowid) FROM queue") as cursor:
+            row = await cursor.fetchone()
+            return row[0] or 0
+
+    async def get_uris(self, after_rowid: int = 0) -> AsyncIterable[str]:
+        """:return: uris of all elements inserted after the element with `after_rowid`."""
+        await self.flush()
+        async with self.conn.execute(
+            "SELECT uri FROM queue WHERE rowid > $1", [after_rowid]
+        ) as cursor:
+            async for row in cursor:
+                yield row[0]
 
     async def get_count_by_state(self, state: QueueState) -> List[str]:
+        await self.flush()
         async with self.conn.execute(
-            f"SELECT count(*) FROM queue WHERE state = {state}",
+            f"SELECT (SELECT count(*) FROM queue WHERE state = {state})"
+            f" + (SELECT count(*) FROM queue_archive WHERE state = {state})",
         ) as cursor:
             row = await cursor.fetchone()
             return row[0]
 
     async def update_state(self, uri: str, state: QueueState) -> None:
-        async with self.conn.execute(
-            "UPDATE queue SET state=$1, next_update=NULL WHERE uri=$2",
-            [int(state), uri],
-        ) as cursor:
-            if COMMIT_AFTER_EVERY_OP:
-                await self.conn.commit()
-            return cursor.rowcount == 1
+        self._buffer_update(uri, {"state": int(state), "next_update": None})
+
+    async def update_validators(
+        self, uri: str, etag: Optional[str], last_modified: Optional[str]
+    ) -> None:
+        self._buffer_update(uri, {"etag": etag, "last_modified": last_modified})
 
     async def update_state_time(
         self, uri: str, state: QueueState, update_time: int, ohash: str
     ) -> None:
-        async with self.conn.execute(
-            "UPDATE queue SET state=$1, next_update=$3, update_time=$2, hash=$4 WHERE uri=$5",
-            [int(state), int(time.time() + update_time), int(update_time), ohash, uri],
-        ) as cursor:
-            if COMMIT_AFTER_EVERY_OP:
-                await self.conn.commit()
-            return cursor.rowcount == 1
+        self._buffer_update(
+            uri,
+            {
+                "state": int(state),
+                "next_update": int(time.time() + update_time),
+                "update_time": int(update_time),
+                "hash": ohash,
+            },
+        )
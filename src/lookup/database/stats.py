@@ -1,8 +1,8 @@
-import json
 from typing import List, Optional
 
 import aiosqlite
 
+from common.json_codec import dumps
 from lookup.constants import COMMIT_AFTER_EVERY_OP
 
 
@@ -20,7 +20,7 @@ class Stats:
     async def insert(self, stats: dict) -> None:
         async with self.conn.execute(
             "INSERT INTO stats(json) VALUES ($1)",
-            [json.dumps(stats)],
+            [dumps(stats)],
         ):
             if COMMIT_AFTER_EVERY_OP:
                 await self.conn.commit()
@@ -34,6 +34,13 @@ class Stats:
                 return None
             return dict(item)
 
+    async def get_latest(self, count: int) -> List[dict]:
+        """:return: last `count` rows, newest first."""
+        async with self.conn.execute(
+            "SELECT * FROM stats ORDER BY id DESC LIMIT $1", [count]
+        ) as cursor:
+            return [dict(row) async for row in cursor]
+
     async def get_all(self) -> List[dict]:
         async with self.conn.execute("SELECT * FROM stats ORDER BY id") as cursor:
             ret = []
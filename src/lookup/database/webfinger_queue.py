@@ -0,0 +1,71 @@
+from typing import List, Optional
+
+import aiosqlite
+
+from lookup.constants import COMMIT_AFTER_EVERY_OP
+from lookup.database.domain_ids import DomainIds
+from lookup.shard import Shard
+
+
+class WebfingerQueue:
+    """Actors whose WebFinger address is waiting to be verified."""
+
+    CREATE_TABLE = (
+        "CREATE TABLE IF NOT EXISTS webfinger_queue ("
+        "num INTEGER PRIMARY KEY AUTOINCREMENT,"
+        "uri TEXT UNIQUE,"  # actor id
+        "actor TEXT,"  # webfinger address to verify (acct:user@domain)
+        "domain INTEGER);"  # id in domain_ids
+    )
+
+    def __init__(
+        self, shard: Optional[Shard] = None, domain_ids: Optional[DomainIds] = None
+    ):
+        self.conn = None
+        self.shard: Optional[Shard] = shard
+        self.domain_ids: DomainIds = domain_ids or DomainIds()
+
+    async def setup(self, connection: aiosqlite.Connection):
+        self.conn = connection
+        if self.domain_ids.conn is None:
+            await self.domain_ids.setup(connection)
+        await self.conn.execute(WebfingerQueue.CREATE_TABLE)
+        await self.domain_ids.migrate_table(
+            "webfinger_queue", WebfingerQueue.CREATE_TABLE, ["domain"]
+        )
+
+    async def insert(self, uri: str, actor: str, domain: str) -> None:
+        async with self.conn.execute(
+            "INSERT OR IGNORE INTO webfinger_queue(uri, actor, domain)"
+            "VALUES ($1, $2, $3)",
+            [uri, actor, await self.domain_ids.get_id(domain)],
+        ):
+            if COMMIT_AFTER_EVERY_OP:
+                await self.conn.commit()
+
+    async def remove(self, uri: str) -> None:
+        async with self.conn.execute("DELETE FROM webfinger_queue WHERE uri=$1", [uri]):
+            if COMMIT_AFTER_EVERY_OP:
+                await self.conn.commit()
+
+    async def get_after(self, num: int, count: int) -> List[dict]:
+        """Get at most `count` elements inserted after element `num`, oldest first."""
+        shard_filter = ""
+        if self.shard is not None:
+            await self.domain_ids.sync_owned(self.shard)
+            shard_filter = "AND domain IN (SELECT id FROM owned_domain_ids) "
+        async with self.conn.execute(
+            f"SELECT * FROM webfinger_queue WHERE num > $1 {shard_filter}"
+            "ORDER BY num LIMIT $2",
+            [num, count],
+        ) as cursor:
+            ret = [dict(row) async for row in cursor]
+        names = await self.domain_ids.get_names(item["domain"] for item in ret)
+        for item in ret:
+            item["domain"] = names.get(item["domain"])
+        return ret
+
+    async def get_size(self) -> int:
+        async with self.conn.execute("SELECT count(*) FROM webfinger_queue") as cursor:
+            row = await cursor.fetchone()
+            return row[0]
@@ -0,0 +1,145 @@
+import asyncio
+import ipaddress
+import time
+from typing import Dict, Iterable, List, Optional, Set, Union
+from urllib.parse import urlsplit
+
+from aiohttp.abc import AbstractResolver
+
+from common.cache import MISSING, TtlCache
+from common.dns import default_resolver
+from lookup.logging import logger
+from lookup.schedule_queue import Domain, HostGroup
+
+IpNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class HostGroups:
+    """
+    Groups domains into politeness buckets by their resolved IP address.
+    Addresses are grouped by `networks` containing them (e.g. ranges of a hosting provider),
+    otherwise by their /`ipv4_prefix` or /`ipv6_prefix` network.
+    Domains whose address can't be resolved aren't grouped.
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[AbstractResolver],
+        ipv4_prefix: int = 32,
+        ipv6_prefix: int = 64,
+        networks: Iterable[str] = (),
+        cache_size: int = 100000,
+        ttl: float = 3600,
+        negative_ttl: float = 300,
+        timeout: float = 5,
+    ) -> None:
+        """
+        :param resolver: resolver of domain names, `default_resolver()` if None.
+        :param networks: CIDR ranges whose domains form one group each.
+        :param ttl: how long to keep a domain in its group before resolving it again.
+        :param negative_ttl: how long to keep a domain ungrouped after failed resolution.
+        :param timeout: maximum time of one resolution.
+        """
+        self.resolver: AbstractResolver = resolver or default_resolver()
+        self.ipv4_prefix: int = ipv4_prefix
+        self.ipv6_prefix: int = ipv6_prefix
+        self.networks: List[IpNetwork] = [ipaddress.ip_network(n) for n in networks]
+        self.timeout: float = timeout
+        self.groups: Dict[str, HostGroup] = {}
+        self.addresses: TtlCache[str, Optional[str]] = TtlCache(
+            cache_size, ttl, negative_ttl
+        )
+        self._resolving: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def group_key(self, address: str) -> str:
+        """:return: key of the group of IP `address`."""
+        ip = ipaddress.ip_address(address)
+        for network in self.networks:
+            if ip in network:
+                return str(network)
+        prefix = self.ipv4_prefix if ip.version == 4 else self.ipv6_prefix
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    async def _resolve(self, domain_name: str) -> Optional[str]:
+        host = urlsplit("//" + domain_name).hostname
+        if not host:
+            return None
+        try:
+            # same family as the fetcher's connections, so the lookup is shared
+            hosts = await asyncio.wait_for(
+                self.resolver.resolve(host, 443, 0), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError, UnicodeError) as e:
+            logger.debug(f"Can't resolve {host}: {e}")
+            return None
+        return self.group_key(hosts[0]["host"]) if hosts else None
+
+    def _join(self, key: Optional[str]) -> Optional[HostGroup]:
+        if key is None:
+            return None
+        if key not in self.groups:
+            self.groups[key] = HostGroup(key)
+        return self.groups[key]
+
+    async def get_group(self, domain_name: str) -> Optional[HostGroup]:
+        """:return: group of the domain, None if it isn't grouped."""
+        key = self.addresses.get(domain_name)
+        if key is MISSING:
+            key = await self._resolve(domain_name)
+            self.addresses.set(domain_name, key)
+        return self._join(key)
+
+    async def assign(self, domains: Dict[str, Domain]) -> None:
+        """Set `Domain.group` of `domains` (by domain name), resolving them in parallel."""
+        names = [n for n in domains if n not in self.addresses]
+        if names:
+            await asyncio.gather(*(self.get_group(name) for name in names))
+        for name, domain in domains.items():
+            self._set_group(domain, await self.get_group(name))
+
+    def assign_soon(self, domains: Dict[str, Domain]) -> None:
+        """
+        Set `Domain.group` of `domains` without waiting for DNS: domains resolved before
+        are assigned at once, others once they are resolved in the background.
+        """
+        unknown = {}
+        for name, domain in domains.items():
+            if name in self.addresses:
+                self._set_group(domain, self._join(self.addresses.get(name)))
+            elif name not in self._resolving:
+                unknown[name] = domain
+        if unknown:
+            self._resolving.update(unknown)
+            task = asyncio.create_task(self._assign_unknown(unknown))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _assign_unknown(self, domains: Dict[str, Domain]) -> None:
+        try:
+            await self.assign(domains)
+        finally:
+            self._resolving.difference_update(domains)
+
+    @staticmethod
+    def _set_group(domain: Domain, group: Optional[HostGroup]) -> None:
+        if group is domain.group:
+            return
+        if domain.group is not None:
+            domain.group.domains -= 1
+        if group is not None:
+            group.domains += 1
+        domain.group = group
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        return {
+            "groups": len(self.groups),
+            "shared": sum(1 for g in self.groups.values() if g.domains > 1),
+            "largest": max((g.domains for g in self.groups.values()), default=0),
+            "waiting": sum(1 for g in self.groups.values() if g.next_req > now),
+        }
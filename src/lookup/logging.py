@@ -11,9 +11,13 @@ class LookupEventCounter(EventCounter):
     PAGE_FETCHED = "page_fetched"
     PAGE_FETCH_FAILED = "page_fetch_failed"
     PAGE_FETCH_TEMP_ERROR = "page_fetch_temporary_error"
+    PAGE_FETCH_RATE_LIMITED = "page_fetch_rate_limited"
     PAGE_REFETCHED = "page_refetched"
     PAGE_UPDATED = "page_updated"
+    PAGE_NOT_MODIFIED = "page_not_modified"
+    PAGE_UNCHANGED = "page_unchanged"
     ACTOR_FOUND = "actor_found"
+    ACTOR_WEBFINGER_RESOLVED = "actor_webfinger_resolved"
     OBJECT_FOUND = "object_found"
     GET_OBJECT_SERVED = "get_object_served"
     GET_OBJECT_NOT_FOUND = "get_object_not_found"
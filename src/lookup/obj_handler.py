@@ -1,27 +1,116 @@
-import hashlib
 import json
-from typing import Awaitable, Callable, List, Optional, Union
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
-from common.activity_streams import get_as_id
-from common.webfinger import WebFinger, actor_from_as
+from common import json_codec
+from common.activity_streams import content_hash, get_as_id
+from common.cache import MISSING
+from common.json_codec import dumps
+from common.webfinger import actor_from_as
 from lookup.config import Config
 from lookup.constants import ACTOR_TYPES, COLLECTION_TYPES, INFINITY_TIME
 from lookup.database.database import Database
 from lookup.database.objects import AsObjectType
 from lookup.database.queue import QueueState
 from lookup.logging import event_counter, logger
+from lookup.shard import FoundUri
+from lookup.webfinger_resolver import WebfingerResolver
+
+PRUNED_TYPES = frozenset(
+    [
+        "Note",
+        "Article",
+        "Page",
+        "Question",
+        "Event",
+        "Create",
+        "Update",
+        "Announce",
+        "Like",
+        "Delete",
+    ]
+)
+"""Types of objects whose fields `ObjectHandler` doesn't use are dropped when parsed"""
+
+HANDLED_FIELDS = frozenset(
+    [
+        "id",
+        "uri",
+        "type",
+        "to",
+        "cc",
+        "attributedTo",
+        "actor",
+        "object",
+        "replies",
+        "first",
+        "next",
+        "last",
+        "items",
+        "orderedItems",
+        "followers",
+        "following",
+        "outbox",
+    ]
+)
+"""Fields used by `ObjectHandler`"""
+
+
+def prune_unused_fields(pairs: List[Tuple[str, Any]]) -> dict:
+    """
+    JSON `object_pairs_hook` keeping only `HANDLED_FIELDS` of `PRUNED_TYPES` objects.
+    Outbox pages embed whole activities with notes, of which only a few fields are used,
+    pruning them while parsing frees their content before the rest of the page is parsed.
+    Actors and collections are kept whole, they are stored.
+    """
+    for key, value in pairs:
+        if key == "type":
+            if isinstance(value, str) and value in PRUNED_TYPES:
+                return {k: v for k, v in pairs if k in HANDLED_FIELDS}
+            break
+    return dict(pairs)
+
+
+def _prune_parsed(obj: Any) -> Any:
+    """Drop fields as `prune_unused_fields` would have while parsing `obj`."""
+    if type(obj) is dict:
+        typ = obj.get("type")
+        if type(typ) is str and typ in PRUNED_TYPES:
+            obj = {k: v for k, v in obj.items() if k in HANDLED_FIELDS}
+        items = obj.items()
+    else:
+        items = enumerate(obj)
+    for key, value in items:
+        if type(value) is dict or type(value) is list:
+            obj[key] = _prune_parsed(value)
+    return obj
+
+
+def parse_pruned(data: bytes) -> Any:
+    """
+    Parse JSON `data` keeping only `HANDLED_FIELDS` of `PRUNED_TYPES` objects.
+    With orjson, the document is parsed whole and pruned afterwards, which is faster
+    than parsing with `prune_unused_fields` by json (but the whole tree exists for a while).
+    """
+    if json_codec.orjson is None:
+        return json.loads(data, object_pairs_hook=prune_unused_fields)
+    obj = json_codec.loads(data)
+    return _prune_parsed(obj) if type(obj) is dict or type(obj) is list else obj
 
 
 class ObjectHandler:
     def __init__(
         self,
         database: Database,
-        on_id_found: Callable[[str, str, bool, Optional[str]], Awaitable[None]],
-        webfinger: WebFinger,
+        on_ids_found: Callable[[List[FoundUri]], Awaitable[None]],
+        webfinger: WebfingerResolver,
     ) -> None:
+        """
+        :param on_ids_found: called with all uris referenced by a handled object at once.
+        """
         self.database = database
-        self.on_id_found = on_id_found
+        self.on_ids_found = on_ids_found
         self.webfinger = webfinger
 
     async def handle(
@@ -31,20 +120,26 @@ class ObjectHandler:
         priority: bool = False,
         aux: dict = None,
     ) -> None:
-        return await self._handle(obj, trust_domain, priority, True, aux)
+        found: List[FoundUri] = []
+        await self._handle(obj, trust_domain, found, priority, True, aux)
+        if found:
+            await self.on_ids_found(found)
 
     async def _handle(
         self,
         obj: Union[dict, str],
         trust_domain: Optional[str],
+        found: List[FoundUri],
         priority: bool = False,
         top_level: bool = False,
         aux: Optional[dict] = None,
     ) -> None:
+        """
+        :param found: list to which uris referenced by `obj` are added.
+        """
         if isinstance(obj, str):
-            return await self.on_id_found(
-                obj, trust_domain, priority, (aux and json.dumps(aux)) or None
-            )
+            found.append((obj, trust_domain, priority, (aux and dumps(aux)) or None))
+            return
         if not isinstance(obj, dict):
             return
 
@@ -62,22 +157,17 @@ class ObjectHandler:
                     event_counter.all_time_fetched += 1
                     event_counter.queue_size -= 1
                     if typ in ACTOR_TYPES or typ in COLLECTION_TYPES:
-                        cur_hash = hashlib.md5(
-                            json.dumps(obj, sort_keys=True).encode()
-                        ).hexdigest()
-                        upd_period = min(
-                            Config.min_update_period * 2, Config.max_update_period
-                        )
-                        if old["hash"]:
-                            event_counter.on_event(event_counter.PAGE_REFETCHED)
-                            if old["hash"] != cur_hash:
-                                event_counter.on_event(event_counter.PAGE_UPDATED)
-                                upd_period = max(
-                                    Config.min_update_period, old["update_time"] / 2
-                                )
+                        cur_hash = content_hash(obj)
                         await self.database.queue.update_state_time(
-                            oid, QueueState.Fetched, upd_period, cur_hash
+                            oid,
+                            QueueState.Fetched,
+                            self._update_period(old, cur_hash),
+                            cur_hash,
                         )
+                        if old["hash"] == cur_hash:
+                            # stored and referenced objects were handled when fetched
+                            event_counter.on_event(event_counter.PAGE_UNCHANGED)
+                            return
                     else:
                         await self.database.queue.update_state(oid, QueueState.Fetched)
                 else:
@@ -93,41 +183,76 @@ class ObjectHandler:
                         None,
                     )
             else:
-                await self.on_id_found(oid, trust_domain, priority, None)
+                found.append((oid, trust_domain, priority, None))
                 return
 
         if typ in ACTOR_TYPES:
-            await self._handle_actor(obj, trust_domain)
+            await self._handle_actor(obj, trust_domain, found)
         elif typ in COLLECTION_TYPES:
-            await self._handle_collection_or_page(obj, trust_domain, priority, aux)
+            await self._handle_collection_or_page(
+                obj, trust_domain, found, priority, aux
+            )
         elif typ in ["Note"]:
-            await self._handle_note(obj, trust_domain)
+            await self._handle_note(obj, trust_domain, found)
         elif typ in ["Create"]:
-            await self._handle_activity(obj, trust_domain)
-        else:
-            logger.debug(f"Unknown type {typ}: {json.dumps(obj)}")
+            await self._handle_activity(obj, trust_domain, found)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Unknown type {typ}: {dumps(obj)}")
+
+    @staticmethod
+    def _update_period(old: dict, cur_hash: str) -> float:
+        upd_period = min(Config.min_update_period * 2, Config.max_update_period)
+        if old["hash"]:
+            event_counter.on_event(event_counter.PAGE_REFETCHED)
+            if old["hash"] != cur_hash:
+                event_counter.on_event(event_counter.PAGE_UPDATED)
+                upd_period = max(Config.min_update_period, old["update_time"] / 2)
+        return upd_period
+
+    async def handle_not_modified(self, uri: str, ohash: str) -> None:
+        """
+        Handle refetch of an actor or collection which wasn't modified since last fetch.
+        :param ohash: hash of the object stored in its queue element.
+        """
+        event_counter.all_time_fetched += 1
+        event_counter.queue_size -= 1
+        event_counter.on_event(event_counter.PAGE_NOT_MODIFIED)
+        await self.database.queue.update_state_time(
+            uri, QueueState.Fetched, self._update_period({"hash": ohash}, ohash), ohash
+        )
 
-    async def _handle_actor(self, actor: dict, trusted_domain):
+    async def _handle_actor(self, actor: dict, trusted_domain, found: List[FoundUri]):
         oid = get_as_id(actor)
         if trusted_domain and oid:
-            webfinger_actor = actor_from_as(actor, trusted_domain)
-            webfinger_actor = await self.webfinger.resolve_actor_webfinger(
-                webfinger_actor, oid
-            )
+            acct = actor_from_as(actor, trusted_domain)
+            webfinger_actor = self.webfinger.get_cached(acct, oid)
             event_counter.on_event(event_counter.ACTOR_FOUND)
-            if webfinger_actor is not None:
-                await self.database.aliases.insert(webfinger_actor, oid)
-            await self.database.objects.insert(
-                oid, actor, AsObjectType.Actor, {"webfinger": webfinger_actor}
-            )
+            if webfinger_actor is MISSING:
+                # don't hold the fetch slot, aux is updated once resolved,
+                # until then a refetched actor keeps its resolved address
+                await self.webfinger.defer(oid, acct, trusted_domain)
+                await self.database.objects.insert_keeping_aux(
+                    oid, actor, AsObjectType.Actor, {"webfinger": None}
+                )
+            else:
+                if webfinger_actor is not None:
+                    await self.database.aliases.insert(webfinger_actor, oid)
+                await self.database.objects.insert(
+                    oid, actor, AsObjectType.Actor, {"webfinger": webfinger_actor}
+                )
             event_counter.actor_count += 1
         await self._handle_fields(
-            actor, ["followers", "following"], trusted_domain, True
+            actor, ["followers", "following"], trusted_domain, found, True
         )
-        await self._handle_fields(actor, ["outbox"], trusted_domain)
+        await self._handle_fields(actor, ["outbox"], trusted_domain, found)
 
     async def _handle_collection_or_page(
-        self, coll: dict, trusted_domain, priority: bool, aux=None
+        self,
+        coll: dict,
+        trusted_domain,
+        found: List[FoundUri],
+        priority: bool,
+        aux=None,
     ):
         oid = get_as_id(coll)
         if trusted_domain and Config.archive_collections and oid:
@@ -148,25 +273,28 @@ class ObjectHandler:
             aux["empPag"] = aux.get("empPag", 0) + 1
             if aux["empPag"] > 2:
                 return
-        await self._handle_fields(coll, fields, trusted_domain, priority, aux)
+        await self._handle_fields(coll, fields, trusted_domain, found, priority, aux)
 
-    async def _handle_note(self, note: dict, trusted_domain):
+    async def _handle_note(self, note: dict, trusted_domain, found: List[FoundUri]):
         oid = get_as_id(note)
         if trusted_domain and Config.archive_notes and oid:
             await self.database.objects.insert(oid, note, AsObjectType.Other)
         await self._handle_fields(
-            note, ["to", "cc", "attributedTo"], trusted_domain, True
+            note, ["to", "cc", "attributedTo"], trusted_domain, found, True
         )
-        await self._handle_fields(note, ["replies"], trusted_domain)
+        await self._handle_fields(note, ["replies"], trusted_domain, found)
 
-    async def _handle_activity(self, activity: dict, trusted_domain):
-        await self._handle_fields(activity, ["actor", "object"], trusted_domain)
+    async def _handle_activity(
+        self, activity: dict, trusted_domain, found: List[FoundUri]
+    ):
+        await self._handle_fields(activity, ["actor", "object"], trusted_domain, found)
 
     async def _handle_fields(
         self,
         obj: dict,
         fields: List[str],
         trusted_domain,
+        found: List[FoundUri],
         priority: bool = False,
         aux: Optional[dict] = None,
     ) -> None:
@@ -175,6 +303,10 @@ class ObjectHandler:
                 continue
             if isinstance(obj[field], list):
                 for value in obj[field]:
-                    await self._handle(value, trusted_domain, priority, False, aux)
+                    await self._handle(
+                        value, trusted_domain, found, priority, False, aux
+                    )
             else:
-                await self._handle(obj[field], trusted_domain, priority, False, aux)
+                await self._handle(
+                    obj[field], trusted_domain, found, priority, False, aux
+                )
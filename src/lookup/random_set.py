@@ -0,0 +1,50 @@
+import random
+from typing import Dict, Generic, Hashable, Iterator, List, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+class RandomSet(Generic[T]):
+    """
+    Set with O(1) add, remove and uniform random choice.
+    Elements are stored in an array, removed element is replaced by the last one.
+    """
+
+    def __init__(self) -> None:
+        self._items: List[T] = []
+        self._positions: Dict[T, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._positions
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def add(self, item: T) -> None:
+        if item in self._positions:
+            return
+        self._positions[item] = len(self._items)
+        self._items.append(item)
+
+    def remove(self, item: T) -> None:
+        """Remove `item` from the set. Raises KeyError if it isn't present."""
+        pos = self._positions.pop(item)
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._positions[last] = pos
+
+    def discard(self, item: T) -> None:
+        if item in self._positions:
+            self.remove(item)
+
+    def choice(self) -> T:
+        """Uniformly random element. Raises IndexError if the set is empty."""
+        return random.choice(self._items)
+
+    def sample(self, count: int) -> List[T]:
+        """Up to `count` distinct uniformly random elements, in random order."""
+        return random.sample(self._items, min(count, len(self._items)))
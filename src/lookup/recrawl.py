@@ -0,0 +1,58 @@
+import heapq
+import time
+from typing import List, Tuple
+
+from lookup.config import Config
+from lookup.database.queue import FifoQueue
+
+
+class RecrawlScheduler:
+    """
+    Moves fetched elements back to the queue when they are due for an update.
+    Due times are read from `queue_next_update_idx` in windows of at most
+    `Config.recrawl_window` seconds and `Config.recrawl_window_size` elements
+    and kept in a min-heap, so only elements that are actually due are updated.
+    Elements that become due inside an already loaded window
+    are picked up when the next window is loaded.
+    """
+
+    def __init__(self, queue: FifoQueue):
+        self.queue: FifoQueue = queue
+        self._heap: List[Tuple[int, str]] = []
+        self._loaded_until: int = 0
+
+    async def _load_window(self, now: int) -> None:
+        until = now + Config.recrawl_window
+        rows = await self.queue.get_next_to_update(until, Config.recrawl_window_size)
+        if len(rows) >= Config.recrawl_window_size:
+            # window is truncated, load the rest once these are promoted
+            until = rows[-1][0]
+        self._heap = rows
+        heapq.heapify(self._heap)
+        self._loaded_until = until
+
+    async def promote_due(self) -> int:
+        """
+        Move at most `Config.recrawl_batch` due elements to the queue.
+        :return: number of promoted elements.
+        """
+        now = int(time.time())
+        if not self._heap and now >= self._loaded_until:
+            await self._load_window(now)
+        uris = []
+        while (
+            self._heap and self._heap[0][0] <= now and len(uris) < Config.recrawl_batch
+        ):
+            uris.append(heapq.heappop(self._heap)[1])
+        if uris:
+            await self.queue.set_to_update(uris, now)
+        return len(uris)
+
+    async def lag(self) -> float:
+        """How many seconds the oldest due element has been waiting for an update."""
+        now = time.time()
+        if self._heap:
+            return max(0.0, now - self._heap[0][0])
+        # due elements which aren't loaded yet, e.g. they became due inside the last window
+        rows = await self.queue.get_next_to_update(int(now), 1)
+        return max(0.0, now - rows[0][0]) if rows else 0
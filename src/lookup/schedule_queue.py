@@ -1,15 +1,42 @@
 import asyncio
+import heapq
+import itertools
 import time
-import traceback
-from typing import List, Tuple
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
 
+from common.rate_control import RateController
 from lookup.config import Config
 from lookup.constants import TRACE_LOG, log_trace
 from lookup.database.domains import DomainState
-from lookup.logging import logger
+
+
+class HostGroup:
+    """Domains served from the same address (or network), crawled as one host."""
+
+    def __init__(self, key: str) -> None:
+        self.key: str = key
+        self.next_req: float = 0
+        self.domains: int = 0
 
 
 class Domain:
+    # one instance per known domain, there can be millions of them
+    __slots__ = (
+        "next_req",
+        "fail_streak",
+        "temp_unreachable",
+        "state",
+        "scheduled_items",
+        "failed_items",
+        "fetched_items",
+        "has_waiting_elements",
+        "not_scheduled",
+        "rate",
+        "group",
+        "in_flight",
+    )
+
     def __init__(
         self,
         next_req: float = 0,
@@ -25,6 +52,33 @@ class Domain:
         self.fetched_items: int = 0
         self.has_waiting_elements: bool = False
         self.not_scheduled: bool = False
+        self.rate: Optional[RateController] = None
+        self.group: Optional[HostGroup] = None
+        # items being processed, in all schedule queues
+        self.in_flight: int = 0
+
+    def get_rate(self) -> RateController:
+        """Adaptive request rate of the domain, created on the first request."""
+        if self.rate is None:
+            self.rate = RateController(
+                Config.domain_request_period,
+                Config.min_domain_request_period,
+                Config.max_domain_request_period,
+                Config.max_parallel_per_domain,
+            )
+        return self.rate
+
+    @property
+    def request_period(self) -> float:
+        """Current minimum time between two requests to the domain."""
+        if self.rate is None:
+            return Config.domain_request_period
+        return self.rate.period
+
+    @property
+    def parallelism(self) -> int:
+        """Current maximum number of simultaneous requests to the domain."""
+        return 1 if self.rate is None else self.rate.parallelism
 
     def is_temp_unreachable(self):
         if self.temp_unreachable:
@@ -34,72 +88,218 @@ class Domain:
                 return True
         return False
 
+    def ready_at(self) -> float:
+        """
+        Earliest time at which an item of this domain can be handed to a fetcher.
+        Items of unreachable or blocked domains are released immediately,
+        fetcher puts them back to the database queue without fetching.
+        """
+        if self.temp_unreachable or self.state > DomainState.Unknown:
+            return 0
+        ready_at = self.next_req
+        if self.rate is not None:
+            # rate limit response or exhausted rate limit budget
+            ready_at = max(ready_at, self.rate.blocked_until)
+        if self.group is not None:
+            ready_at = max(ready_at, self.group.next_req)
+        return ready_at
+
+
+def count_domains(domains: Dict[str, Domain]) -> Dict[str, int]:
+    """:return: numbers of known domains by their state, shown by the web server."""
+    counts = {
+        "found": len(domains),
+        "waiting": 0,
+        "waiting_reachable": 0,
+        "unreachable": 0,
+        "blocked": 0,
+    }
+    for d in domains.values():
+        if d.state > DomainState.Unknown:
+            counts["blocked"] += 1
+            continue
+        if d.fail_streak > 0:
+            counts["unreachable"] += 1
+        if d.has_waiting_elements:
+            counts["waiting"] += 1
+            if d.fail_streak == 0:
+                counts["waiting_reachable"] += 1
+    return counts
+
 
 class ScheduleQueue:
-    def __init__(self, size: int):
-        self.unavailable: List[Tuple[float, dict, Domain]] = []
-        self.available_items: asyncio.Queue[
-            Tuple[float, dict, Domain]
-        ] = asyncio.Queue()
+    """
+    In-memory queue of items to fetch.
+    Every domain with waiting items has exactly one entry in a heap keyed by
+    the time its next item may be fetched, items of a domain are kept in FIFO order.
+    Heap keys are lower bounds: `Domain.ready_at` only grows while items are queued,
+    so a popped domain which isn't ready yet is simply pushed back with its real key.
+    Fetchers waiting for an item are woken by a single timer set to the earliest key.
+    Domains with `Domain.parallelism` items being processed are parked outside the heap
+    until `release` is called for one of them.
+    Items of the same domains processed by other queues count against the limit too,
+    their ends aren't signalled to this queue, so such a domain is retried later.
+    """
+
+    def __init__(self, size: int, prefetch: Optional[Callable[[Any], None]] = None):
+        """
+        :param prefetch: called with the first queued item of a domain,
+            to prepare its fetch (e.g. resolve the host) while it waits for its turn.
+        """
         self.size = size
+        self.prefetch: Optional[Callable[[Any], None]] = prefetch
         self.free_spaces = asyncio.Semaphore(size)
-        self._track_waiting_task = asyncio.create_task(self._track_waiting())
-        self.available: int = 0
         self.total: int = 0
+        self._items: Dict[Domain, Deque[Any]] = {}
+        self._heap: List[Tuple[float, int, Domain]] = []
+        self._counter = itertools.count()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at: float = 0
+        self._in_flight: Dict[Domain, int] = {}
+        self._parked: Set[Domain] = set()
 
-    async def _track_waiting(self) -> None:
-        waiting_items = []
-        try:
-            while True:
-                waiting_items.extend(self.unavailable)
-                self.unavailable = []
-
-                waiting_items.sort(key=lambda x: x[0])
-                new_waiting = []
-
-                for t, uri, domain in waiting_items:
-                    if (
-                        domain.next_req < time.time()
-                        or domain.temp_unreachable
-                        or domain.state > DomainState.Unknown
-                    ):
-                        self.available_items.put_nowait((t, uri, domain))
-                        self.available += 1
-                    else:
-                        new_waiting.append((t, uri, domain))
-
-                waiting_items = new_waiting
-
-                await asyncio.sleep(Config.domain_request_period / 4)
-        except Exception as e:
-            # something went very wrong
-            traceback.print_exc()
-            logger.exception(e)
-
-    async def get_first_available(self) -> Tuple[dict, Domain]:
-        cnt = 0
-        while True:
-            t, uri, domain = await self.available_items.get()
-            self.available -= 1
-            if (
-                domain.next_req < time.time()
-                or domain.temp_unreachable
-                or domain.state > DomainState.Unknown
-            ):
-                self.free_spaces.release()
-                if TRACE_LOG:
-                    log_trace("A", self.available, self.total, cnt)
-                self.total -= 1
-                return uri, domain
+    @property
+    def available(self) -> int:
+        """Number of domains that have an item ready to be fetched (for tracing)."""
+        now = time.time()
+        return sum(1 for t, _, _ in self._heap if t <= now)
+
+    def _push_domain(self, domain: Domain, ready_at: float) -> None:
+        heapq.heappush(self._heap, (ready_at, next(self._counter), domain))
+
+    def _pop_ready(self) -> Optional[Tuple[Any, Domain]]:
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, domain = heapq.heappop(self._heap)
+            ready_at = domain.ready_at()
+            if ready_at > now:
+                self._push_domain(domain, ready_at)
+                continue
+            fetchable = (
+                not domain.temp_unreachable and domain.state <= DomainState.Unknown
+            )
+            in_flight = self._in_flight.get(domain, 0)
+            if fetchable and in_flight >= domain.parallelism:
+                self._parked.add(domain)
+                continue
+            if fetchable and domain.in_flight >= domain.parallelism:
+                self._push_domain(domain, now + domain.request_period)
+                continue
+            self._in_flight[domain] = in_flight + 1
+            domain.in_flight += 1
+            if fetchable and domain.group is not None:
+                # other domains of the same host wait for their turn
+                domain.group.next_req = max(
+                    domain.group.next_req, now + Config.host_group_request_period
+                )
+            items = self._items[domain]
+            item = items.popleft()
+            if items:
+                if fetchable:
+                    # fetcher will postpone domain.next_req by the same period
+                    ready_at = max(ready_at, now + domain.request_period)
+                self._push_domain(domain, ready_at)
             else:
-                self.unavailable.append((t, uri, domain))
-            cnt += 1
+                del self._items[domain]
+            return item, domain
+        return None
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            entry = self._pop_ready()
+            if entry is None:
+                break
+            self._waiters.popleft()
+            waiter.set_result(entry)
+        self._set_timer()
+
+    def _set_timer(self) -> None:
+        if not self._waiters or not self._heap:
+            return
+        wake_at = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_at <= wake_at:
+                return
+            self._timer.cancel()
+        self._timer_at = wake_at
+        self._timer = asyncio.get_running_loop().call_later(
+            max(wake_at - time.time(), 0), self._on_timer
+        )
 
-    async def put(self, uri: dict, domain: Domain):
+    async def get_first_available(self) -> Tuple[Any, Domain]:
+        entry = None if self._waiters else self._pop_ready()
+        if entry is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._set_timer()
+            try:
+                entry = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._return_item(*waiter.result())
+                raise
+        self.total -= 1
+        self.free_spaces.release()
+        if TRACE_LOG:
+            log_trace("A", self.available, self.total, len(self._waiters))
+        return entry
+
+    def _end_processing(self, domain: Domain) -> bool:
+        """:return: True if the domain was parked and is back in the heap."""
+        domain.in_flight -= 1
+        in_flight = self._in_flight.pop(domain) - 1
+        if in_flight > 0:
+            self._in_flight[domain] = in_flight
+        if domain not in self._parked:
+            return False
+        self._parked.remove(domain)
+        self._push_domain(domain, domain.ready_at())
+        return True
+
+    def release(self, domain: Domain) -> None:
+        """Processing of an item of `domain` returned by `get_first_available` ended."""
+        if self._end_processing(domain):
+            self._dispatch()
+
+    def _return_item(self, item: Any, domain: Domain) -> None:
+        self._end_processing(domain)
+        if domain in self._items:
+            self._items[domain].appendleft(item)
+        else:
+            self._items[domain] = deque([item])
+            self._push_domain(domain, domain.ready_at())
+        self._dispatch()
+
+    async def put(self, item: Any, domain: Domain):
         await self.free_spaces.acquire()
-        self.available += 1
         self.total += 1
-        self.available_items.put_nowait((time.time(), uri, domain))
+        if domain in self._items:
+            self._items[domain].append(item)
+            return
+        self._items[domain] = deque([item])
+        if self.prefetch is not None:
+            self.prefetch(item)
+        ready_at = domain.ready_at()
+        self._push_domain(domain, ready_at)
+        if self._waiters:
+            if ready_at <= time.time():
+                self._dispatch()
+            else:
+                self._set_timer()
 
     def stop(self):
-        self._track_waiting_task.cancel()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
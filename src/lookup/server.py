@@ -1,4 +1,4 @@
-import json
+import hmac
 import logging
 import time
 from typing import Optional, Tuple
@@ -6,21 +6,35 @@ from typing import Optional, Tuple
 from aiohttp import web
 
 from common.constants import AS_JSON_CONTENT_TYPE, HTML_CONTENT_TYPE, JSON_CONTENT_TYPE
+from common.json_codec import dumps, loads
+from common.logging import merge_stats
 from common.request import get_int_query_param, get_str_query_param
 from common.signatures import Verifier
 from lookup import Crawler, event_counter
+from lookup.cluster import SECRET_HEADER, ClusterNode
 from lookup.config import Config
 from lookup.database.database import Database
-from lookup.database.domains import DomainState
 from lookup.database.objects import AsObjectType
 from lookup.logging import logger
+from lookup.schedule_queue import count_domains
 from lookup.signatures import add_signatures
 
 
 class WebServer:
-    def __init__(self, database: Database, crawler: Optional[Crawler] = None):
+    def __init__(
+        self,
+        database: Database,
+        crawler: Optional[Crawler] = None,
+        cluster: Optional[ClusterNode] = None,
+        workers: int = 0,
+    ):
+        """
+        :param workers: number of crawler processes whose stats are shown, if they run.
+        """
         self.database: Database = database
         self.crawler: Optional[Crawler] = crawler
+        self.cluster: Optional[ClusterNode] = cluster
+        self.workers: int = workers
         self.app: Optional[web.Application] = None
         self.runner: Optional[web.AppRunner] = None
         self.site: Optional[web.TCPSite] = None
@@ -52,24 +66,58 @@ class WebServer:
                     }
                 )
         event_counter.on_event(event_counter.GET_OBJECT_SERVED)
-        return web.Response(
-            text=json.dumps(as_object), content_type=AS_JSON_CONTENT_TYPE
+        return web.Response(text=dumps(as_object), content_type=AS_JSON_CONTENT_TYPE)
+
+    async def _get_workers_stats(self) -> Optional[dict]:
+        """:return: sum of the last logged stats of every crawler process."""
+        # every worker logs at the same period, so the latest rows are one per worker
+        latest = {}
+        for row in await self.database.stats.get_latest(2 * self.workers):
+            stats = loads(row["json"])
+            latest.setdefault(stats.get("shard", {}).get("index"), stats)
+        if not latest:
+            return None
+        shards = [stats.pop("shard", None) for stats in latest.values()]
+        # every worker counts the whole shared queue
+        maximum = (
+            "time",
+            "period",
+            "queue_size",
+            "webfinger_queue_size",
+            "recrawl_lag",
         )
+        merged = merge_stats(list(latest.values()), maximum)
+        merged["shards"] = shards
+        return merged
 
-    async def status_handler(self, _request: web.Request):
+    async def _get_last_stats(self) -> Optional[dict]:
         if self.last_stats_cache[0] < time.time() - 1:
-            stats = await self.database.stats.get_last()
-            self.last_stats_cache = (
-                time.time(),
-                None if stats is None else json.loads(stats["json"]),
-            )
+            if self.workers:
+                stats = await self._get_workers_stats()
+            else:
+                row = await self.database.stats.get_last()
+                stats = None if row is None else loads(row["json"])
+            self.last_stats_cache = (time.time(), stats)
+        return self.last_stats_cache[1]
 
+    async def status_handler(self, _request: web.Request):
+        previous = await self._get_last_stats()
         return web.Response(
-            text=json.dumps(
+            text=dumps(
                 {
                     "total": event_counter.get_total_stats(),
                     "current": event_counter.get_stats(),
-                    "previous": self.last_stats_cache[1],
+                    "previous": previous,
+                    "fetcher": self.crawler and self.crawler.fetcher.get_stats(),
+                    "cluster": self.cluster and self.cluster.get_stats(),
+                    "host_groups": self.crawler
+                    and self.crawler.host_groups.get_stats(),
+                    "visited_filter": self.crawler and self.crawler.visited.get_stats(),
+                    "webfinger": self.crawler
+                    and {
+                        **self.crawler.webfinger.get_stats(),
+                        "resolver": self.crawler.webfinger_resolver.get_stats(),
+                    },
                 },
                 sort_keys=True,
             ),
@@ -85,7 +133,7 @@ class WebServer:
         page_cnt = await self.database.objects.get_page_count()
         event_counter.on_event(event_counter.ACTOR_PAGE_SERVED)
         return web.Response(
-            text=json.dumps({"actors": page, "page_count": page_cnt}),
+            text=dumps({"actors": page, "page_count": page_cnt}),
             content_type=JSON_CONTENT_TYPE,
         )
 
@@ -97,12 +145,12 @@ class WebServer:
         page = [await self.database.objects.get_as_object_by_num(num) for num in nums]
         event_counter.on_event(event_counter.ACTORS_TO_SIGN_SERVED)
         return web.Response(
-            text=json.dumps({"actors": page}),
+            text=dumps({"actors": page}),
             content_type=JSON_CONTENT_TYPE,
         )
 
     async def sign_page_handler(self, request: web.Request):
-        data = await request.json()
+        data = await request.json(loads=loads)
         if "signed_by" not in data or "signatures" not in data:
             raise web.HTTPBadRequest(text="Missing signed_by or signatures")
 
@@ -118,35 +166,54 @@ class WebServer:
 
         return web.HTTPOk()
 
+    def _check_cluster_secret(self, request: web.Request) -> None:
+        if self.cluster is None:
+            raise web.HTTPNotFound()
+        secret = request.headers.get(SECRET_HEADER, "")
+        # without a secret anybody could take leases or inject uris
+        if not self.cluster.secret or not hmac.compare_digest(
+            secret.encode(), self.cluster.secret.encode()
+        ):
+            raise web.HTTPForbidden()
+
+    async def cluster_lease_handler(self, request: web.Request):
+        self._check_cluster_secret(request)
+        if self.cluster.lease_table is None:
+            raise web.HTTPNotFound(text="This node isn't the coordinator")
+        data = await request.json(loads=loads)
+        if not isinstance(data.get("node", None), str):
+            raise web.HTTPBadRequest(text="Missing node")
+        return web.Response(
+            text=dumps(self.cluster.lease_table.renew(data["node"])),
+            content_type=JSON_CONTENT_TYPE,
+        )
+
+    async def cluster_found_handler(self, request: web.Request):
+        self._check_cluster_secret(request)
+        data = await request.json(loads=loads)
+        found = data.get("found", None)
+        if not isinstance(found, list) or not all(
+            isinstance(f, list) and len(f) == 4 for f in found
+        ):
+            raise web.HTTPBadRequest(text="Found must be an array of uris")
+        await self.cluster.handle_found(found)
+        return web.HTTPOk()
+
     async def main_handler(self, _request: web.Request):
         actor_cnt = event_counter.actor_count
         queue_sz = event_counter.queue_size
         uris_fetched = event_counter.all_time_fetched
 
         if self.crawler is not None:
-            domains = self.crawler.domains
+            domains = count_domains(self.crawler.domains)
         else:
-            domains = {}
-
-        waiting_domains_sz = sum(
-            1
-            for d in domains.values()
-            if d.state <= DomainState.Unknown and d.has_waiting_elements
-        )
-        waiting_reachable = sum(
-            1
-            for d in domains.values()
-            if d.state <= DomainState.Unknown
-            and d.fail_streak == 0
-            and d.has_waiting_elements
-        )
-        domains_sz = len(domains)
-        unreachable_cnt = sum(
-            1
-            for d in domains.values()
-            if d.fail_streak > 0 and d.state <= DomainState.Unknown
-        )
-        blocked_cnt = sum(1 for d in domains.values() if d.state > DomainState.Unknown)
+            # crawler processes log their domain counts
+            domains = ((await self._get_last_stats()) or {}).get("domains", {})
+        domains_sz = domains.get("found", 0)
+        waiting_domains_sz = domains.get("waiting", 0)
+        waiting_reachable = domains.get("waiting_reachable", 0)
+        unreachable_cnt = domains.get("unreachable", 0)
+        blocked_cnt = domains.get("blocked", 0)
 
         return web.Response(
             text=f"""
@@ -192,6 +259,8 @@ For any questions please reach out to <a href="https://lelesius.eu/">lelesius.eu
         self.app.router.add_route("GET", "/actors/to_sign", self.actors_to_sign_handler)
         self.app.router.add_route("POST", "/actors/sign", self.sign_page_handler)
         self.app.router.add_route("GET", "/status", self.status_handler)
+        self.app.router.add_route("POST", "/cluster/lease", self.cluster_lease_handler)
+        self.app.router.add_route("POST", "/cluster/found", self.cluster_found_handler)
         self.app.router.add_route("GET", "/", self.main_handler)
 
         self.runner = web.AppRunner(self.app)
@@ -0,0 +1,97 @@
+import asyncio
+import queue
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# (uri, found_in, priority, aux) arguments of `Crawler.add_if_not_visited`
+FoundUri = Tuple[str, str, bool, Optional[str]]
+
+
+def domain_shard(domain: str, count: int) -> int:
+    """Shard owning `domain`, stable across processes (unlike `hash`)."""
+    return zlib.crc32(domain.encode()) % count
+
+
+class Shard:
+    """
+    Part of domains crawled by one crawler process.
+    The process owns domains with `domain_shard(domain, count) == index`,
+    only the owner fetches from a domain, so per-domain politeness holds globally.
+    Uris found for other shards are sent in batches to the owner's inbox.
+    Subclasses can change the ownership and delivery (see `lookup.cluster`).
+    :param inboxes: one multiprocessing queue per shard.
+    """
+
+    FORWARD_PERIOD = 0.2
+    """How often to send found uris to other shards (in seconds)"""
+
+    FORWARD_BATCH = 500
+    """Number of buffered uris for one shard that triggers sending"""
+
+    def __init__(self, index: int, count: int, inboxes: list) -> None:
+        self.index: int = index
+        self.count: int = count
+        self.inboxes: list = inboxes
+        self._outboxes: Dict[Any, List[FoundUri]] = {}
+        self.forwarded: int = 0
+        self.received: int = 0
+
+    def owner(self, domain: str) -> Any:
+        """:return: key of the shard which owns `domain`."""
+        return domain_shard(domain, self.count)
+
+    def owns(self, domain: str) -> bool:
+        return self.owner(domain) == self.index
+
+    def buckets(self) -> Set[int]:
+        """:return: values of `domain_shard(domain, count)` of domains owned now."""
+        return {self.index}
+
+    def forward(self, domain: str, found: FoundUri) -> None:
+        target = self.owner(domain)
+        outbox = self._outboxes.setdefault(target, [])
+        outbox.append(found)
+        if len(outbox) >= Shard.FORWARD_BATCH:
+            self._send(target)
+
+    def _send(self, target: Any) -> None:
+        batch = self._outboxes.pop(target, None)
+        if not batch:
+            return
+        self.forwarded += len(batch)
+        self._deliver(target, batch)
+
+    def _deliver(self, target: Any, batch: List[FoundUri]) -> None:
+        self.inboxes[target].put(batch)
+
+    def flush(self) -> None:
+        for target in list(self._outboxes):
+            self._send(target)
+
+    async def forward_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(Shard.FORWARD_PERIOD)
+            self.flush()
+
+    async def receive(
+        self, on_found: Callable[[List[FoundUri]], Awaitable[None]]
+    ) -> None:
+        """Call `on_found` with every batch of uris sent to this shard by others."""
+        loop = asyncio.get_running_loop()
+        inbox = self.inboxes[self.index]
+        while True:
+            try:
+                # wake up regularly, so the executor thread ends soon after shutdown
+                batch = await loop.run_in_executor(None, inbox.get, True, 1)
+            except queue.Empty:
+                continue
+            self.received += len(batch)
+            await on_found(batch)
+
+    def get_stats(self) -> dict:
+        return {
+            "index": self.index,
+            "count": self.count,
+            "forwarded": self.forwarded,
+            "received": self.received,
+        }
@@ -1,7 +1,7 @@
-import json
 import traceback
 from typing import List, TypedDict
 
+from common.json_codec import loads
 from common.signatures import Verifier
 from lookup import logger
 from lookup.database.database import Database
@@ -27,8 +27,8 @@ async def add_signatures(
             actor = await database.objects.get_as_object(signature["uri"])
             if actor is None:
                 continue
-            actor_json = json.loads(actor["json"])
-            actor_aux = json.loads(actor["aux"])
+            actor_json = loads(actor["json"])
+            actor_aux = loads(actor["aux"])
             if await verifier.verify(
                 actor_json,
                 actor_aux,
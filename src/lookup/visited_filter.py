@@ -0,0 +1,129 @@
+import os
+import struct
+from typing import Iterable, Optional
+
+from common.bloom import BloomFilter
+from lookup.database.queue import FifoQueue
+from lookup.logging import logger
+
+
+class VisitedFilter:
+    """
+    In-memory filter of uris which are in the queue, most known uris are rejected
+    by it without querying the database.
+    A new uri is mistaken for a known one (and isn't crawled) with probability `fp_rate`.
+    The filter is built from the queue on start and saved on stop together with
+    the rowid of the last queue element, so the next start only adds newer elements.
+    """
+
+    _HEADER = struct.Struct("<QQ")
+
+    def __init__(
+        self,
+        queue: FifoQueue,
+        fp_rate: float,
+        capacity: int,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        :param fp_rate: false positive rate when full, 0 to disable the filter.
+        :param capacity: minimum number of uris the filter is sized for,
+            it's rebuilt twice as large once it holds more.
+        :param path: file to save the filter to, None if it shouldn't be saved.
+        """
+        self.queue: FifoQueue = queue
+        self.fp_rate: float = fp_rate
+        self.min_capacity: int = capacity
+        self.path: Optional[str] = path
+        self.bloom: Optional[BloomFilter] = None
+        self._building: bool = False
+        self.checks: int = 0
+        self.hits: int = 0
+        self.builds: int = 0
+
+    def __contains__(self, uri: str) -> bool:
+        if self.bloom is None:
+            return False
+        self.checks += 1
+        if uri in self.bloom:
+            self.hits += 1
+            return True
+        return False
+
+    def add_all(self, uris: Iterable[str]) -> None:
+        if self.bloom is None:
+            return
+        for uri in uris:
+            self.bloom.add(uri)
+
+    async def load(self) -> None:
+        """Load the saved filter and add newer queue elements, or build it from the queue."""
+        if self.fp_rate <= 0:
+            return
+        last_rowid = await self.queue.get_last_rowid()
+        saved_rowid = self._read()
+        if saved_rowid is None or saved_rowid > last_rowid:
+            await self._build(max(self.min_capacity, 2 * last_rowid))
+            return
+        async for uri in self.queue.get_uris(saved_rowid):
+            self.bloom.add(uri)
+        await self.grow_if_full()
+
+    def _read(self) -> Optional[int]:
+        """:return: rowid of the last element in the saved filter, None if it can't be used."""
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) < VisitedFilter._HEADER.size:
+            return None
+        rowid, capacity = VisitedFilter._HEADER.unpack_from(data)
+        bloom = BloomFilter(capacity, self.fp_rate)
+        if not bloom.load_bytes(data[VisitedFilter._HEADER.size :]):
+            logger.info("Saved visited uri filter doesn't match configuration")
+            return None
+        self.bloom = bloom
+        return rowid
+
+    async def _build(self, capacity: int) -> None:
+        self._building = True
+        try:
+            bloom = BloomFilter(capacity, self.fp_rate)
+            async for uri in self.queue.get_uris():
+                bloom.add(uri)
+            self.bloom = bloom
+            self.builds += 1
+        finally:
+            self._building = False
+
+    async def grow_if_full(self) -> None:
+        """Rebuild the filter twice as large if it holds more uris than it's sized for."""
+        if self.bloom is not None and self.bloom.is_full and not self._building:
+            await self._build(self.bloom.capacity * 2)
+
+    async def save(self) -> None:
+        if self.path is None or self.bloom is None:
+            return
+        header = VisitedFilter._HEADER.pack(
+            await self.queue.get_last_rowid(), self.bloom.capacity
+        )
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(self.bloom.to_bytes())
+        os.replace(tmp_path, self.path)
+
+    def get_stats(self) -> dict:
+        if self.bloom is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "size": self.bloom.size,
+            "capacity": self.bloom.capacity,
+            "uris": len(self.bloom),
+            "fp_rate": self.bloom.current_fp_rate(),
+            "checks": self.checks,
+            "hits": self.hits,
+            "hit_rate": self.checks and self.hits / self.checks,
+            "builds": self.builds,
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import traceback
+from typing import Dict, List, Optional, Set
+
+from common.webfinger import WebFinger
+from lookup.config import Config
+from lookup.database.database import Database
+from lookup.database.domains import DomainState
+from lookup.logging import event_counter, logger
+from lookup.schedule_queue import Domain, ScheduleQueue
+
+
+class WebfingerResolver:
+    """
+    Verifies WebFinger addresses of found actors outside of the crawl path.
+    Actors are stored right away, their `aux.webfinger` is filled in once resolved.
+    Waiting actors are persisted in the `webfinger_queue` table.
+    Resolutions share `Domain.next_req` and `Domain.in_flight` with the crawler,
+    so they count against the same per-domain request rate and parallelism.
+    Actors of temporarily unreachable domains stay in the table and are loaded again
+    by the next scan of the whole table.
+    """
+
+    RESCAN_PERIOD = 60
+    """How often to scan the table again for skipped actors (in seconds)"""
+
+    def __init__(
+        self, database: Database, webfinger: WebFinger, domains: Dict[str, Domain]
+    ) -> None:
+        self.database: Database = database
+        self.webfinger: WebFinger = webfinger
+        self.domains: Dict[str, Domain] = domains
+        self.queue: Optional[ScheduleQueue] = None
+        self.tasks: List[asyncio.Task] = []
+        self._loaded_num: int = 0
+        self._loaded: Set[str] = set()
+        self._skipped: bool = False
+        self._rescan_at: float = 0
+
+    def get_cached(self, actor: str, oid: str) -> Optional[str]:
+        """:return: cached webfinger address of actor `oid`, None or `MISSING`."""
+        return self.webfinger.get_cached_actor_webfinger(actor, oid)
+
+    async def defer(self, oid: str, actor: str, domain: str) -> None:
+        """
+        Resolve webfinger address `actor` of actor `oid` later.
+        :param domain: domain to which the request will be made.
+        """
+        await self.database.webfinger_queue.insert(oid, actor, domain)
+
+    def get_stats(self) -> dict:
+        return {"in_memory": 0 if self.queue is None else self.queue.total}
+
+    async def run(self) -> None:
+        self.queue = ScheduleQueue(Config.webfinger_chunk)
+        self.tasks.append(asyncio.create_task(self._load()))
+        self.tasks.extend(
+            asyncio.create_task(self._resolve())
+            for _ in range(Config.parallel_webfinger)
+        )
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        if self.queue is not None:
+            self.queue.stop()
+
+    def _get_domain(self, domain_name: str) -> Domain:
+        if domain_name not in self.domains:
+            self.domains[domain_name] = Domain()
+        return self.domains[domain_name]
+
+    async def _load(self) -> None:
+        while True:
+            try:
+                items = await self.database.webfinger_queue.get_after(
+                    self._loaded_num, Config.webfinger_chunk
+                )
+                for item in items:
+                    self._loaded_num = item["num"]
+                    if item["uri"] in self._loaded:
+                        continue
+                    domain = self._get_domain(item["domain"])
+                    if domain.is_temp_unreachable():
+                        self._skipped = True
+                        continue
+                    self._loaded.add(item["uri"])
+                    await self.queue.put(item, domain)
+                if len(items) < Config.webfinger_chunk:
+                    if self._skipped and time.time() >= self._rescan_at:
+                        self._skipped = False
+                        self._rescan_at = time.time() + WebfingerResolver.RESCAN_PERIOD
+                        self._loaded_num = 0
+                    await asyncio.sleep(2)
+
+            except Exception as e:
+                # something went very wrong
+                traceback.print_exc()
+                logger.exception(e)
+                await asyncio.sleep(2)
+
+    async def _resolve(self) -> None:
+        while True:
+            uri = None
+            try:
+                item, domain = await self.queue.get_first_available()
+                uri = item["uri"]
+                try:
+                    await self._resolve_single(item, domain)
+                finally:
+                    self.queue.release(domain)
+
+            except Exception as e:
+                logger.error("Exception while resolving webfinger of " + str(uri))
+                logger.exception(e)
+                await asyncio.sleep(3)
+            finally:
+                self._loaded.discard(uri)
+
+    async def _resolve_single(self, item: dict, domain: Domain) -> None:
+        uri = item["uri"]
+        if domain.is_temp_unreachable():
+            # stays in the table, loaded again once the crawler reaches the domain
+            self._skipped = True
+            return
+
+        webfinger_actor = None
+        if domain.state <= DomainState.Unknown:
+            domain.next_req = max(domain.next_req, time.time() + domain.request_period)
+            webfinger_actor = await self.webfinger.resolve_actor_webfinger(
+                item["actor"], uri
+            )
+        if webfinger_actor is not None:
+            event_counter.on_event(event_counter.ACTOR_WEBFINGER_RESOLVED)
+            await self.database.aliases.insert(webfinger_actor, uri)
+            await self.database.objects.update_aux(uri, {"webfinger": webfinger_actor})
+        await self.database.webfinger_queue.remove(uri)
@@ -1,28 +1,122 @@
 import asyncio
+import multiprocessing
+import signal
+from multiprocessing.synchronize import Event
 from typing import List, Optional, Tuple
 
+import aiohttp
+
 import common
 import lookup
-from lookup.database.domains import DomainState
+from lookup.cluster import ClusterNode, LeaseTable
+from lookup.constants import TRACE_LOG, log_trace
+from lookup.obj_handler import parse_pruned
+from lookup.schedule_queue import count_domains
+from lookup.shard import Shard
 from runners.constants import LOOKUP_CONFIG_FILE, LOOKUP_LOG_FILE, prepare_start
 
 
+def run_worker(
+    index: int,
+    count: int,
+    inboxes: list,
+    stop: Event,
+    start_uris: List[str],
+    log_level=None,
+    config_file: Optional[str] = None,
+    database_path: Optional[str] = None,
+) -> None:
+    """Entry point of a crawler process started by `LookupRunner.start_workers`."""
+    # Ctrl+C is handled by the main process, which sets `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    runner = LookupRunner(
+        log_level, Shard(index, count, inboxes), config_file, database_path
+    )
+
+    async def run():
+        try:
+            await runner.start(start_uris, False)
+            log_task = asyncio.create_task(runner.spin_and_log())
+            while not stop.is_set():
+                await asyncio.sleep(1)
+            log_task.cancel()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
 class LookupRunner:
-    def __init__(self, log_level=None):
+    def __init__(
+        self,
+        log_level=None,
+        shard: Optional[Shard] = None,
+        config_file: Optional[str] = None,
+        database_path: Optional[str] = None,
+    ):
+        """
+        :param shard: if given, run as one of the crawler processes.
+        :param config_file: path of the config file, default if None.
+        :param database_path: path of the database file, default if None.
+        """
+        self.log_level = log_level
         if log_level is not None:
             lookup.logger.setLevel(log_level)
+        self.shard: Optional[Shard] = shard
+        self.config_file: str = config_file or LOOKUP_CONFIG_FILE
+        self.database_path: Optional[str] = database_path
+        self.cluster_session: Optional[aiohttp.ClientSession] = None
         self.database: Optional[lookup.Database] = None
         self.crawler: Optional[lookup.Crawler] = None
         self.server: Optional[lookup.WebServer] = None
         self.fetcher: Optional[common.Fetcher] = None
+        self.workers: List[multiprocessing.Process] = []
+        self.stop_workers: Optional[Event] = None
+        # workers unpickle these after start, keep them alive
+        self.inboxes: list = []
 
-    async def _prepare(self):
+    async def _prepare(self, shared: bool = False):
         if self.database:
             return
-        prepare_start(LOOKUP_CONFIG_FILE, LOOKUP_LOG_FILE, lookup.Config, lookup.logger)
+        log_file = LOOKUP_LOG_FILE
+        if self.shard is not None:
+            log_file = LOOKUP_LOG_FILE.replace(".log", f"-{self.shard.index}.log")
+        prepare_start(self.config_file, log_file, lookup.Config, lookup.logger)
+
+        if self.shard is None and not shared and lookup.Config.cluster_node_uri:
+            self.shard = self._create_cluster_node()
+        self.database = lookup.Database(self.shard, shared)
+        await self.database.setup(self.database_path)
 
-        self.database = lookup.Database()
-        await self.database.setup()
+    def _create_cluster_node(self) -> ClusterNode:
+        config = lookup.Config
+        is_coordinator = config.cluster_coordinator_uri.rstrip(
+            "/"
+        ) == config.cluster_node_uri.rstrip("/")
+        self.cluster_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=config.cluster_lease_ttl / 4)
+        )
+        return ClusterNode(
+            config.cluster_node_uri,
+            config.cluster_coordinator_uri,
+            self.cluster_session,
+            config.cluster_buckets,
+            config.cluster_lease_ttl,
+            config.cluster_secret,
+            LeaseTable(config.cluster_buckets, config.cluster_lease_ttl)
+            if is_coordinator
+            else None,
+        )
+
+    async def _count_from_database(self) -> None:
+        """Set counters shown by the web server from the database."""
+        lookup.event_counter.all_time_fetched = (
+            await self.database.queue.get_count_by_state(lookup.QueueState.Fetched)
+        )
+        lookup.event_counter.queue_size = await self.database.queue.get_size()
+        lookup.event_counter.actor_count = await self.database.objects.get_object_cnt(
+            lookup.AsObjectType.Actor
+        )
 
     async def start(
         self, start_crawler: List[str] = None, start_server: bool = True
@@ -33,40 +127,105 @@ class LookupRunner:
         :param start_server: True if web server should be started else False.
         """
         await self._prepare()
-
-        lookup.event_counter.all_time_fetched = (
-            await self.database.queue.get_count_by_state(lookup.QueueState.Fetched)
-        )
-        lookup.event_counter.queue_size = await self.database.queue.get_size()
-        lookup.event_counter.actor_count = await self.database.objects.get_object_cnt(
-            lookup.AsObjectType.Actor
-        )
+        await self._count_from_database()
 
         if start_crawler is not None:
             self.fetcher = common.Fetcher(
-                lookup.logger, lookup.Config.parallel_fetches, lookup.Config.debug
+                lookup.logger,
+                lookup.Config.parallel_fetches,
+                lookup.Config.debug,
+                keep_alive=lookup.Config.keep_alive,
+                limit_per_host=lookup.Config.connections_per_host,
+                keep_alive_timeout=lookup.Config.keep_alive_timeout,
+                dns_ttl=lookup.Config.dns_ttl,
+                dns_negative_ttl=lookup.Config.dns_negative_ttl,
+                trace=log_trace if TRACE_LOG else None,
+                max_body_size=lookup.Config.max_response_size,
+                # archived notes and collections must be stored whole
+                parse=None
+                if lookup.Config.archive_notes or lookup.Config.archive_collections
+                else parse_pruned,
             )
             await self.fetcher.setup()
-            self.crawler = lookup.Crawler(self.database, self.fetcher)
+            visited_filter_path = self.database.path + ".visited"
+            if self.shard is not None and not isinstance(self.shard, ClusterNode):
+                visited_filter_path += f"-{self.shard.index}"
+            self.crawler = lookup.Crawler(
+                self.database, self.fetcher, self.shard, visited_filter_path
+            )
             await self.crawler.run(start_crawler)
 
+        if isinstance(self.shard, ClusterNode):
+            if not start_server:
+                lookup.logger.warning(
+                    "Cluster node without web server won't receive uris from others"
+                )
+            if self.crawler is None and self.shard.lease_table is None:
+                lookup.logger.warning(
+                    "Cluster node is neither crawling nor coordinating"
+                )
+
         if start_server:
-            self.server = lookup.WebServer(self.database, self.crawler)
+            self.server = lookup.WebServer(
+                self.database,
+                self.crawler,
+                self.shard if isinstance(self.shard, ClusterNode) else None,
+                len(self.workers),
+            )
             await self.server.run()
 
+    async def start_workers(
+        self, count: int, start_crawler: List[str], start_server: bool = True
+    ) -> None:
+        """
+        Start `count` crawler processes sharing the database and optionally web server.
+        Each process crawls domains of one shard (see `lookup.shard`).
+        :param start_crawler: list of starting urls.
+        :param start_server: True if web server should be started else False.
+        """
+        # resets interrupted elements of all shards before workers start
+        await self._prepare(shared=True)
+        context = multiprocessing.get_context("spawn")
+        self.stop_workers = context.Event()
+        self.inboxes = [context.Queue() for _ in range(count)]
+        for index in range(count):
+            worker = context.Process(
+                target=run_worker,
+                args=(
+                    index,
+                    count,
+                    self.inboxes,
+                    self.stop_workers,
+                    start_crawler if index == 0 else [],
+                    self.log_level,
+                    self.config_file,
+                    self.database_path,
+                ),
+                name=f"crawler-{index}",
+            )
+            worker.start()
+            self.workers.append(worker)
+        await self.start(None, start_server)
+
     async def spin_and_log(self):
         while True:
             await asyncio.sleep(10)
+            if self.workers:
+                # workers log their own stats, the web server shows their sum
+                await self._count_from_database()
+                continue
             stats = lookup.event_counter.reset_stats()
             stats["queue_size"] = await self.database.queue.get_size()
             if self.crawler:
-                stats["waiting_reachable"] = sum(
-                    1
-                    for d in self.crawler.domains.values()
-                    if d.state <= DomainState.Unknown
-                    and d.fail_streak == 0
-                    and d.has_waiting_elements
-                )
+                domains = count_domains(self.crawler.domains)
+                stats["waiting_reachable"] = domains["waiting_reachable"]
+                stats["domains"] = domains
+                stats["recrawl_lag"] = await self.crawler.recrawl.lag()
+                stats[
+                    "webfinger_queue_size"
+                ] = await self.database.webfinger_queue.get_size()
+            if self.shard:
+                stats["shard"] = self.shard.get_stats()
             await self.database.stats.insert(stats)
 
     async def add_verifier(self, verifier_uri) -> Tuple[int, str]:
@@ -86,5 +245,14 @@ class LookupRunner:
             await self.server.shutdown()
         if self.fetcher:
             await self.crawler.stop()
+        if self.workers:
+            self.stop_workers.set()
+            for worker in self.workers:
+                # workers flush their buffered writes before exiting
+                await asyncio.get_running_loop().run_in_executor(None, worker.join, 30)
+                if worker.is_alive():
+                    worker.terminate()
+        if self.cluster_session:
+            await self.cluster_session.close()
         if self.database:
             await self.database.close()
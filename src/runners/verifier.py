@@ -31,10 +31,11 @@ class VerifierRunner:
         self.database = verifier.Database()
         await self.database.setup()
 
-        self.server = verifier.WebServer(self.signer)
+        self.verifier = verifier.Verifier(self.signer, self.database)
+
+        self.server = verifier.WebServer(self.signer, self.verifier.fetcher.fetcher)
         await self.server.run()
 
-        self.verifier = verifier.Verifier(self.signer, self.database)
         await self.verifier.run(lookups)
 
     async def spin_and_log(self):
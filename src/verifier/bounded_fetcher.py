@@ -1,10 +1,12 @@
 import asyncio
 import time
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, Optional
 from urllib.parse import urlparse
 
 from common.constants import INF_TIME_CONST
-from common.fetcher import FailedFetch, Fetcher, TemporaryFetchError
+from common.fetcher import FailedFetch, Fetcher, RateLimited, TemporaryFetchError
+from common.rate_control import RateController
 from verifier import Config, Database, event_counter, logger
 
 
@@ -15,24 +17,64 @@ class ServerDown(FailedFetch):
 
 
 class BoundedFetcher:
-    def __init__(self, max_connections: int, database: Database):
-        self.fetcher: Fetcher = Fetcher(logger, timeout=Config.request_timeout)
+    """
+    Only the `max_rates` most recently requested domains keep their own rate controller,
+    the others start again from `Config.domain_request_period`.
+    """
+
+    def __init__(
+        self, max_connections: int, database: Database, max_rates: int = 10000
+    ):
+        self.fetcher: Fetcher = Fetcher(
+            logger,
+            max_connections,
+            timeout=Config.request_timeout,
+            keep_alive=Config.keep_alive,
+            limit_per_host=Config.connections_per_host,
+            keep_alive_timeout=Config.keep_alive_timeout,
+            result_ttl=Config.fetch_result_ttl,
+            max_body_size=Config.max_response_size,
+        )
         self.database: Database = database
         self.fetch_semaphore: asyncio.Semaphore = asyncio.Semaphore(max_connections)
         self.domains: Dict[str, dict] = {}
         self.temp_fails: Dict[str, float] = {}
+        self.max_rates: int = max_rates
+        self.rates: "OrderedDict[str, RateController]" = OrderedDict()
 
     async def setup(self) -> None:
         await self.fetcher.setup()
         self.domains = await self.database.get_domains_dict()
 
+    def get_rate(self, domain: str) -> RateController:
+        if domain in self.rates:
+            self.rates.move_to_end(domain)
+        else:
+            # worker makes one request to a domain at a time
+            self.rates[domain] = RateController(
+                Config.domain_request_period,
+                Config.min_domain_request_period,
+                Config.max_domain_request_period,
+            )
+            if len(self.rates) > self.max_rates:
+                self.rates.popitem(last=False)
+        return self.rates[domain]
+
+    def request_period(self, domain: Optional[str]) -> float:
+        """:return: current minimum time between two requests to `domain`."""
+        if domain not in self.rates:
+            return Config.domain_request_period
+        return self.rates[domain].period
+
     def reserve_time(self, domain: str) -> float:
         if domain not in self.domains:
             return time.time()
         d = self.domains[domain]
+        blocked_until = self.rates[domain].blocked_until if domain in self.rates else 0
         d["reserved_time"] = max(
             time.time() + Config.request_timeout,
             d["next_try"],
+            blocked_until,
             d.get("reserved_time", 0) + Config.request_timeout,
         )
         return d["reserved_time"]
@@ -42,16 +84,26 @@ class BoundedFetcher:
         if domain not in self.domains:
             self.domains[domain] = {"fails": 0, "next_try": time.time()}
         d = self.domains[domain]
+        rate = self.get_rate(domain)
+        if time.time() < rate.blocked_until:
+            # domain asked to wait, not a failure
+            raise ServerDown(uri, rate.blocked_until)
         try:
             if time.time() < d["next_try"]:
                 raise ServerDown(uri, d["next_try"])
             async with self.fetch_semaphore:
-                data = await self.fetcher.fetch_ap(uri)
+                data = await self.fetcher.fetch_ap(uri, rate)
             if d["fails"] > 0:
                 d["fails"] = 0
                 d["next_try"] = 0
                 await self.database.set_domain_state(domain, d["next_try"], d["fails"])
             return data
+        except RateLimited as e:
+            # domain isn't down, don't count it as a failure
+            event_counter.on_event(event_counter.ACTOR_FETCH_RATE_LIMITED)
+            raise ServerDown(
+                uri, max(rate.blocked_until, time.time() + rate.period)
+            ) from e
         except FailedFetch as e:
             if time.time() < d["next_try"]:
                 raise ServerDown(uri, d["next_try"]) from e
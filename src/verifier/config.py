@@ -33,11 +33,42 @@ class Config:
     """Maximum length of the queue"""
 
     domain_request_period: float = 1
-    """Minimum time between two requests to the same domain"""
+    """
+    Initial minimum time between two requests to the same domain,
+    adapted between `min_domain_request_period` and `max_domain_request_period`
+    based on responses of the domain.
+    """
+
+    min_domain_request_period: float = 1
+    """
+    Shortest time between two requests to the same domain,
+    lower it (e.g. to 0.25) to let the rate grow for domains which respond well
+    """
+
+    max_domain_request_period: float = 60
+    """Longest time between two requests to the same domain after slowing down"""
 
     request_timeout: float = 20
     """Maximum request time in total"""
 
+    max_response_size: int = 10 * 1024 * 1024
+    """Maximum size of a fetched document in bytes, larger ones are refused"""
+
+    keep_alive: bool = False
+    """If true, connections are kept open and reused for next requests to the same host"""
+
+    connections_per_host: int = 0
+    """Maximum number of simultaneous connections to one host, 0 if unlimited"""
+
+    keep_alive_timeout: float = 15
+    """How long to keep an idle connection open in seconds"""
+
+    fetch_result_ttl: float = 0
+    """
+    How long in seconds to reuse a fetched actor for other requests of the same uri,
+    0 if only concurrent requests should share the response
+    """
+
     lookup_request_period: float = 0.25
     """Minimum time between two requests to the lookup server"""
 
@@ -83,3 +114,17 @@ class Config:
             Config.queue_size = int(data["queue_size"])
         if "domain_request_period" in data:
             Config.domain_request_period = float(data["domain_request_period"])
+        if "min_domain_request_period" in data:
+            Config.min_domain_request_period = float(data["min_domain_request_period"])
+        if "max_domain_request_period" in data:
+            Config.max_domain_request_period = float(data["max_domain_request_period"])
+        if "max_response_size" in data:
+            Config.max_response_size = int(data["max_response_size"])
+        if "keep_alive" in data:
+            Config.keep_alive = bool(data["keep_alive"])
+        if "connections_per_host" in data:
+            Config.connections_per_host = int(data["connections_per_host"])
+        if "keep_alive_timeout" in data:
+            Config.keep_alive_timeout = float(data["keep_alive_timeout"])
+        if "fetch_result_ttl" in data:
+            Config.fetch_result_ttl = float(data["fetch_result_ttl"])
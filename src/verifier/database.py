@@ -1,8 +1,8 @@
-import json
 from typing import Dict, List, Optional
 
 import aiosqlite
 
+from common.json_codec import dumps
 from verifier import Config
 
 
@@ -139,7 +139,7 @@ class Database:
     async def insert_stats(self, stats: dict) -> None:
         async with self.conn.execute(
             "INSERT INTO stats(json) VALUES ($1)",
-            [json.dumps(stats)],
+            [dumps(stats)],
         ):
             await self.conn.commit()
 
@@ -10,6 +10,7 @@ logger: logging.Logger = logging.getLogger(LOGGER_NAME)
 class VerifierEventCounter(EventCounter):
     ACTOR_FETCH_FAILED = "actor_fetch_failed"
     ACTOR_FETCH_TEMP_ERROR = "actor_fetch_temporary_error"
+    ACTOR_FETCH_RATE_LIMITED = "actor_fetch_rate_limited"
     ACTOR_FETCH_SKIPPED = "actor_fetch_skipped"
     ACTOR_INFO_MISMATCH = "actor_info_mismatch"
     ACTOR_SIGNED = "actor_signed"
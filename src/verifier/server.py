@@ -1,20 +1,22 @@
-import json
 from typing import Optional, Tuple
 
 from aiohttp import web
 
 from common.constants import AS_JSON_CONTENT_TYPE, JSON_CONTENT_TYPE
+from common.fetcher import Fetcher
+from common.json_codec import dumps
 from common.signatures import Signer
 from verifier.config import Config
 from verifier.logging import event_counter, logger
 
 
 class WebServer:
-    def __init__(self, signer: Signer):
+    def __init__(self, signer: Signer, fetcher: Optional[Fetcher] = None):
         self.app: Optional[web.Application] = None
         self.runner: Optional[web.AppRunner] = None
         self.site: Optional[web.TCPSite] = None
         self.signer: Signer = signer
+        self.fetcher: Optional[Fetcher] = fetcher
 
         self.actor = {
             "type": "Application",
@@ -32,16 +34,15 @@ class WebServer:
         self.last_stats_cache: Tuple[float, Optional[dict]] = (0, None)
 
     async def get_key_handler(self, _request: web.Request):
-        return web.Response(
-            text=json.dumps(self.actor), content_type=AS_JSON_CONTENT_TYPE
-        )
+        return web.Response(text=dumps(self.actor), content_type=AS_JSON_CONTENT_TYPE)
 
     async def get_status_handler(self, _request: web.Request):
         return web.Response(
-            text=json.dumps(
+            text=dumps(
                 {
                     "total": event_counter.get_total_stats(),
                     "current": event_counter.get_stats(),
+                    "fetcher": self.fetcher and self.fetcher.get_stats(),
                 },
                 sort_keys=True,
             ),
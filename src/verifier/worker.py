@@ -1,5 +1,4 @@
 import asyncio
-import json
 import ssl
 import time
 import traceback
@@ -14,6 +13,7 @@ from aiohttp import ClientError, ClientResponseError, ClientTimeout
 from common.activity_streams import get_as_id
 from common.constants import INF_TIME_CONST
 from common.fetcher import FailedFetch
+from common.json_codec import dumps, loads
 from common.signatures import Signer
 from common.webfinger import WebFinger, actor_from_as
 from verifier import Config
@@ -69,7 +69,13 @@ class Worker:
         self.session = aiohttp.ClientSession(
             timeout=ClientTimeout(total=Config.request_timeout),
             connector=aiohttp.TCPConnector(
-                limit=Config.parallel_fetches, force_close=True, ssl=ssl_context
+                limit=Config.parallel_fetches,
+                limit_per_host=Config.connections_per_host,
+                force_close=not Config.keep_alive,
+                keepalive_timeout=Config.keep_alive_timeout
+                if Config.keep_alive
+                else None,
+                ssl=ssl_context,
             ),
         )
         self.webfinger = WebFinger(self.session)
@@ -165,7 +171,7 @@ class Worker:
                             async with self.session.get(
                                 f"{self.lookup}/get/{a['uri']}"
                             ) as r:
-                                data = await r.json()
+                                data = await r.json(loads=loads)
                                 a["json"] = data["json"]
                                 a["aux"] = data["aux"]
                         except Exception as e:
@@ -182,7 +188,7 @@ class Worker:
                 async with self.session.get(
                     f"{self.lookup}/actors?page={self.next_page}"
                 ) as r:
-                    data = await r.json()
+                    data = await r.json(loads=loads)
                     event_counter.on_event(event_counter.PAGE_FETCHED)
                 for a in data["actors"]:
                     a["page"] = self.next_page
@@ -287,8 +293,8 @@ class Worker:
 
             signature, signature_time = None, None
             if get_as_id(real_actor) == uri:
-                actor_parsed: dict = json.loads(actor_json)
-                actor_aux: dict = json.loads(actor_aux_json)
+                actor_parsed: dict = loads(actor_json)
+                actor_aux: dict = loads(actor_aux_json)
                 if await self.check_aux(actor_parsed, actor_aux):
                     signature_time = int(time.time())
                     signature = await self.signer.compare_and_sign(
@@ -296,10 +302,10 @@ class Worker:
                     )
             if signature is None or signature_time is None:
                 await self.database.insert_difference(
-                    self.lookup, uri, actor_json, json.dumps(real_actor), time.time()
+                    self.lookup, uri, actor_json, dumps(real_actor), time.time()
                 )
                 event_counter.on_event(event_counter.ACTOR_INFO_MISMATCH)
-                return time.time() + Config.domain_request_period
+                return time.time() + self.fetcher.request_period(domain)
 
             event_counter.on_event(event_counter.ACTOR_SIGNED)
             signed_actor: SignedActor = {
@@ -311,7 +317,7 @@ class Worker:
             success = True
             if len(self.signed_actors) >= Config.signature_batch_size:
                 self.enough_signatures.set()
-            return time.time() + Config.domain_request_period
+            return time.time() + self.fetcher.request_period(domain)
         except asyncio.CancelledError:
             # for cleanup only!
             task_nr = None
@@ -352,7 +358,7 @@ class Worker:
                 self.queue_semaphore.release()
                 self.prev_domain_fetch[domain] = (
                     self.prev_domain_fetch[domain][0],
-                    time.time() + Config.domain_request_period,
+                    time.time() + self.fetcher.request_period(domain),
                 )
 
     async def remove_from_queue(self, actor: dict, page: int):
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import unittest
 
 import common.activity_streams as streams
@@ -23,3 +25,39 @@ class TestActivityStreams(unittest.TestCase):
     def test_get_uri_given_dict_with_uri_and_id_returns_id(self):
         result = streams.get_as_id(self.object_with_uri_and_id)
         self.assertEqual("test_id", result)
+
+    def test_serialize_given_document_returns_its_body(self):
+        document = streams.AsDocument({"b": 1, "a": 2}, '{"b":1,"a":2}'.encode())
+        self.assertEqual('{"b":1,"a":2}', streams.serialize(document))
+
+    def test_serialize_given_utf16_document_returns_sorted_json(self):
+        document = streams.AsDocument(
+            {"b": 1, "a": 2}, '{"b":1,"a":2}'.encode("utf-16")
+        )
+        self.assertEqual('{"a":2,"b":1}', streams.serialize(document))
+
+    def test_serialize_given_document_with_bom_returns_parsable_body(self):
+        body = b"\xef\xbb\xbf" + '{"b":1,"a":2}'.encode()
+        document = streams.AsDocument(json.loads(body), body)
+        self.assertDictEqual({"b": 1, "a": 2}, json.loads(streams.serialize(document)))
+
+    def test_serialize_given_utf16_document_without_bom_returns_sorted_json(self):
+        body = '{"b":1,"a":2}'.encode("utf-16-le")
+        document = streams.AsDocument(json.loads(body), body)
+        self.assertEqual('{"a":2,"b":1}', streams.serialize(document))
+
+    def test_serialize_given_dict_returns_sorted_json(self):
+        self.assertEqual('{"a":2,"b":1}', streams.serialize({"b": 1, "a": 2}))
+
+    def test_content_hash_given_document_ignores_key_order_and_formatting(self):
+        document = streams.AsDocument({"b": 1, "a": 2}, b'{"b":1,"a":2}')
+        reordered = streams.AsDocument({"a": 2, "b": 1}, b'{ "a": 2, "b": 1 }')
+        self.assertEqual(
+            streams.content_hash(document), streams.content_hash(reordered)
+        )
+
+    def test_content_hash_matches_hash_of_sorted_json(self):
+        obj = {"b": 1, "a": "ž"}
+        expected = hashlib.md5(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+        self.assertEqual(expected, streams.content_hash(obj))
+        self.assertEqual(expected, streams.content_hash(streams.AsDocument(obj, b"")))
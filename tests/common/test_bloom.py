@@ -0,0 +1,42 @@
+import unittest
+
+from common.bloom import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_contains_added_items(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"https://example.com/{i}")
+        for i in range(1000):
+            self.assertIn(f"https://example.com/{i}", bloom)
+        self.assertGreater(len(bloom), 980)
+
+    def test_false_positive_rate_is_close_to_configured(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"https://example.com/{i}")
+        false_positives = sum(f"https://example.net/{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(0.01, bloom.current_fp_rate(), delta=0.005)
+
+    def test_add_given_added_item_returns_false(self):
+        bloom = BloomFilter(10, 0.01)
+        bloom.add("a")
+        self.assertFalse(bloom.add("a"))
+        self.assertEqual(1, len(bloom))
+
+    def test_load_bytes_restores_filter(self):
+        bloom = BloomFilter(10, 0.01)
+        bloom.add("a")
+        loaded = BloomFilter(10, 0.01)
+        self.assertTrue(loaded.load_bytes(bloom.to_bytes()))
+        self.assertIn("a", loaded)
+        self.assertEqual(1, len(loaded))
+
+    def test_load_bytes_given_filter_of_other_size_returns_false(self):
+        bloom = BloomFilter(10, 0.01)
+        bloom.add("a")
+        loaded = BloomFilter(10, 0.001)
+        self.assertFalse(loaded.load_bytes(bloom.to_bytes()))
+        self.assertNotIn("a", loaded)
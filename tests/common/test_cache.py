@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+
+from common.cache import MISSING, TtlCache
+
+
+class TestTtlCache(unittest.TestCase):
+    def test_get_given_missing_key_returns_missing(self):
+        cache = TtlCache(10, 100)
+        self.assertIs(MISSING, cache.get("a"))
+        self.assertEqual(1, cache.stats[TtlCache.MISSES])
+
+    def test_get_given_cached_none_returns_none(self):
+        cache = TtlCache(10, 100)
+        cache.set("a", None)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(1, cache.stats[TtlCache.HITS])
+
+    def test_get_given_expired_key_returns_missing(self):
+        cache = TtlCache(10, 100)
+        with patch("common.cache.time.time", return_value=1000):
+            cache.set("a", 1)
+        with patch("common.cache.time.time", return_value=1100):
+            self.assertIs(MISSING, cache.get("a"))
+        self.assertEqual(0, len(cache))
+
+    def test_set_given_none_uses_negative_ttl(self):
+        cache = TtlCache(10, 100, 10)
+        with patch("common.cache.time.time", return_value=1000):
+            cache.set("a", None)
+            cache.set("b", 1)
+        with patch("common.cache.time.time", return_value=1050):
+            self.assertNotIn("a", cache)
+            self.assertIn("b", cache)
+
+    def test_set_given_full_cache_evicts_least_recently_used(self):
+        cache = TtlCache(2, 100)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(1, cache.stats[TtlCache.EVICTIONS])
+
+    def test_set_given_zero_size_doesnt_cache(self):
+        cache = TtlCache(0, 100)
+        cache.set("a", 1)
+        self.assertEqual(0, len(cache))
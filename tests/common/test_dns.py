@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from test_helpers import async_test
+
+from common.dns import CachingResolver
+
+HOSTS = [{"hostname": "a.example", "host": "1.2.3.4", "port": 0, "family": 2}]
+
+
+def mocked_resolver(**kwargs) -> CachingResolver:
+    resolver = CachingResolver(AsyncMock(), **kwargs)
+    resolver.resolver.resolve.return_value = HOSTS
+    return resolver
+
+
+class TestCachingResolver(unittest.TestCase):
+    @async_test
+    async def test_resolve_returns_hosts_with_requested_port(self):
+        resolver = mocked_resolver()
+        hosts = await resolver.resolve("a.example", 443, 0)
+        self.assertEqual("1.2.3.4", hosts[0]["host"])
+        self.assertEqual(443, hosts[0]["port"])
+
+    @async_test
+    async def test_resolve_caches_result(self):
+        resolver = mocked_resolver()
+        await resolver.resolve("a.example", 443, 0)
+        await resolver.resolve("a.example", 80, 0)
+        resolver.resolver.resolve.assert_awaited_once()
+
+    @async_test
+    async def test_resolve_caches_failure(self):
+        resolver = mocked_resolver()
+        resolver.resolver.resolve.side_effect = OSError()
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                await resolver.resolve("a.example", 443, 0)
+        resolver.resolver.resolve.assert_awaited_once()
+        self.assertEqual(1, resolver.get_stats()[CachingResolver.FAILED])
+
+    @async_test
+    async def test_resolve_after_ttl_resolves_again(self):
+        resolver = mocked_resolver(ttl=0.01)
+        await resolver.resolve("a.example", 443, 0)
+        await asyncio.sleep(0.02)
+        await resolver.resolve("a.example", 443, 0)
+        self.assertEqual(2, resolver.resolver.resolve.await_count)
+
+    @async_test
+    async def test_concurrent_resolves_are_coalesced(self):
+        resolver = mocked_resolver()
+        await asyncio.gather(*(resolver.resolve("a.example", 443, 0) for _ in range(5)))
+        resolver.resolver.resolve.assert_awaited_once()
+
+    @async_test
+    async def test_prefetch_caches_host(self):
+        resolver = mocked_resolver()
+        resolver.prefetch("a.example")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertIn(("a.example", 0), resolver.cache)
+        resolver.prefetch("a.example")
+        self.assertEqual(1, resolver.get_stats()[CachingResolver.PREFETCHED])
@@ -1,3 +1,5 @@
+import json
+import time
 import unittest
 from unittest.mock import Mock, patch
 
@@ -5,6 +7,8 @@ from mocks.web import mock_client_session
 from test_helpers import async_test, raise_on_call
 
 import common.fetcher as fetch
+from common.activity_streams import serialize
+from common.rate_control import RateController
 
 
 class TestFetcher(unittest.TestCase):
@@ -108,6 +112,15 @@ class TestFetcher(unittest.TestCase):
         # noinspection PyUnresolvedReferences
         self.fetcher.session.get.assert_called_once()
 
+    @async_test
+    async def test_fetch_ap_given_server_error_records_latency_by_status(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session({url: {"__http_status_code": 500}})
+        with self.assertRaises(fetch.TemporaryFetchError):
+            await self.fetcher.fetch_ap(url)
+        outcomes = self.fetcher.latency_stats.get_stats()["outcomes"]
+        self.assertEqual(1, outcomes["500"]["count"])
+
     @async_test
     async def test_fetch_ap_given_server_error_510_raises_temporary_fetch(self):
         url = "https://example.com:8000/test"
@@ -117,6 +130,70 @@ class TestFetcher(unittest.TestCase):
         # noinspection PyUnresolvedReferences
         self.fetcher.session.get.assert_called_once()
 
+    @async_test
+    async def test_fetch_ap_given_429_raises_rate_limited_with_retry_after(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session(
+            {url: {"__http_status_code": 429, "__http_headers": {"Retry-After": "30"}}}
+        )
+        with self.assertRaises(fetch.RateLimited) as cm:
+            await self.fetcher.fetch_ap(url)
+        self.assertAlmostEqual(time.time() + 30, cm.exception.retry_at, delta=5)
+
+    @async_test
+    async def test_fetch_ap_given_rate_reports_response_to_it(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session(
+            {url: {"__http_status_code": 503, "__http_headers": {"Retry-After": "30"}}}
+        )
+        rate = RateController(1, 0.1, 10)
+        with self.assertRaises(fetch.RateLimited):
+            await self.fetcher.fetch_ap(url, rate)
+        self.assertEqual(2, rate.period)
+        self.assertGreater(rate.blocked_until, time.time() + 20)
+
+    @async_test
+    async def test_fetch_ap_given_too_large_body_raises_fetch_error(self):
+        url = "https://example.com:8000/test"
+        self.fetcher = fetch.Fetcher(self.logger, 1, max_body_size=100)
+        self.fetcher.session = mock_client_session({url: {"data": "x" * 200}})
+        with self.assertRaises(fetch.FailedFetch) as cm:
+            await self.fetcher.fetch_ap(url)
+        self.assertNotIsInstance(cm.exception, fetch.TemporaryFetchError)
+
+    @async_test
+    async def test_fetch_ap_given_html_raises_temporary_fetch_without_reading(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session(
+            {url: {"__http_headers": {"Content-Type": "text/html"}}}
+        )
+        with self.assertRaises(fetch.TemporaryFetchError):
+            await self.fetcher.fetch_ap(url)
+
+    @async_test
+    async def test_fetch_ap_given_large_body_parses_it(self):
+        url = "https://example.com:8000/test"
+        self.fetcher = fetch.Fetcher(self.logger, 1, decode_in_thread_size=10)
+        self.fetcher.session = mock_client_session({url: {"data": "x" * 100}})
+        self.assertEqual({"data": "x" * 100}, await self.fetcher.fetch_ap(url))
+
+    @async_test
+    async def test_fetch_ap_given_parse_parses_with_it(self):
+        url = "https://example.com:8000/test"
+        self.fetcher = fetch.Fetcher(
+            self.logger, 1, parse=lambda data: {"a": json.loads(data)["a"]}
+        )
+        self.fetcher.session = mock_client_session({url: {"a": 1, "b": 2}})
+        self.assertEqual({"a": 1}, await self.fetcher.fetch_ap(url))
+
+    @async_test
+    async def test_fetch_ap_returns_object_with_response_body(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session({url: {"b": 1, "a": 2}})
+        result = await self.fetcher.fetch_ap(url)
+        self.assertEqual(b'{"b": 1, "a": 2}', result.raw)
+        self.assertEqual('{"b": 1, "a": 2}', serialize(result))
+
     @async_test
     async def test_fetch_ap_given_no_internet_raises_temporary_fetch(self):
         url = "https://example.com:8000/test"
@@ -125,3 +202,52 @@ class TestFetcher(unittest.TestCase):
             await self.fetcher.fetch_ap(url)
         # noinspection PyUnresolvedReferences
         self.fetcher.session.get.assert_called_once()
+
+    @async_test
+    async def test_fetch_ap_conditional_given_validators_sends_conditional_headers(
+        self,
+    ):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session({url: {"data": "data"}})
+        await self.fetcher.fetch_ap_conditional(
+            url, {"etag": '"abc"', "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        )
+        # noinspection PyUnresolvedReferences
+        headers = self.fetcher.session.get.call_args.kwargs["headers"]
+        self.assertEqual('"abc"', headers["If-None-Match"])
+        self.assertEqual("Wed, 21 Oct 2015 07:28:00 GMT", headers["If-Modified-Since"])
+
+    @async_test
+    async def test_fetch_ap_conditional_given_not_modified_returns_none(self):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session(
+            {url: {"__http_status_code": 304, "__http_headers": {"ETag": '"abc"'}}}
+        )
+        obj, validators = await self.fetcher.fetch_ap_conditional(
+            url, {"etag": '"abc"'}
+        )
+        self.assertIsNone(obj)
+        self.assertDictEqual({"etag": '"abc"'}, validators)
+
+    @async_test
+    async def test_fetch_ap_conditional_returns_response_validators(self):
+        url = "https://example.com:8000/test"
+        headers = {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        self.fetcher.session = mock_client_session(
+            {url: {"data": "data", "__http_headers": headers}}
+        )
+        obj, validators = await self.fetcher.fetch_ap_conditional(url)
+        self.assertDictEqual({"data": "data"}, obj)
+        self.assertDictEqual(
+            {"etag": '"abc"', "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+            validators,
+        )
+
+    @async_test
+    async def test_fetch_ap_given_not_modified_without_validators_raises_fetch_error(
+        self,
+    ):
+        url = "https://example.com:8000/test"
+        self.fetcher.session = mock_client_session({url: {"__http_status_code": 304}})
+        with self.assertRaises(fetch.FailedFetch):
+            await self.fetcher.fetch_ap(url)
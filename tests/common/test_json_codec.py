@@ -0,0 +1,48 @@
+import json
+import unittest
+from unittest.mock import patch
+
+import common.json_codec as codec
+
+
+def stdlib_canonical(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+class TestJsonCodec(unittest.TestCase):
+    documents = [
+        {"b": [1, None, True, {"d": "x", "c": []}], "a": "text"},
+        {"name": "Žygimantas 😀", "control": "\x00\x1f\x7f ", "quote": '"\\/'},
+        {"float": 1e16, "nan": float("nan")},
+        {"big": 2**70},
+        {1: "int key"},
+        {"surrogate": "\ud800"},
+    ]
+
+    def test_dumps_canonical_equals_stdlib_output(self):
+        for document in self.documents:
+            self.assertEqual(
+                stdlib_canonical(document), codec.dumps_canonical(document)
+            )
+
+    def test_dumps_canonical_without_orjson_equals_stdlib_output(self):
+        with patch.object(codec, "orjson", None):
+            for document in self.documents:
+                self.assertEqual(
+                    stdlib_canonical(document), codec.dumps_canonical(document)
+                )
+
+    def test_dumps_returns_json_of_any_document(self):
+        for document in self.documents[:2] + self.documents[3:]:
+            self.assertEqual(
+                json.loads(stdlib_canonical(document)),
+                json.loads(codec.dumps(document)),
+            )
+
+    def test_loads_given_document_refused_by_orjson_parses_it(self):
+        self.assertEqual({"a": "\ud800"}, codec.loads(b'{"a": "\\ud800"}'))
+        self.assertEqual({"a": 1}, codec.loads('{"a": 1}'.encode("utf-16")))
+
+    def test_loads_given_invalid_json_raises_json_decode_error(self):
+        with self.assertRaises(json.JSONDecodeError):
+            codec.loads(b"{")
@@ -54,3 +54,18 @@ class TestEventCounter(unittest.TestCase):
         time_patch.return_value = 7
         result = self.counter.reset_stats()
         self.assertDictEqual(result | {"a": 2, "time": 7, "period": 4}, result)
+
+
+class TestMergeStats(unittest.TestCase):
+    def test_merge_stats_sums_numbers_of_processes(self):
+        merged = lg.merge_stats(
+            [
+                {"a": 1, "time": 5, "queue_size": 7, "domains": {"found": 2}},
+                {"a": 2, "b": 1, "time": 6, "queue_size": 7, "domains": {"found": 3}},
+            ],
+            ("time", "queue_size"),
+        )
+        self.assertDictEqual(
+            {"a": 3, "b": 1, "time": 6, "queue_size": 7, "domains": {"found": 5}},
+            merged,
+        )
@@ -0,0 +1,81 @@
+import time
+import unittest
+from email.utils import formatdate
+
+from common.rate_control import RateController, parse_retry_after
+
+
+class TestRateController(unittest.TestCase):
+    def test_success_increases_rate(self):
+        rate = RateController(2, 0.1, 60)
+        rate.on_response(200, {}, 0.1)
+        self.assertLess(rate.period, 2)
+
+    def test_success_doesnt_exceed_max_rate(self):
+        rate = RateController(1, 0.5, 60)
+        for _ in range(100):
+            rate.on_response(200, {}, 0.1)
+        self.assertAlmostEqual(0.5, rate.period)
+
+    def test_success_increases_parallelism_up_to_max(self):
+        rate = RateController(1, 0.1, 60, 3)
+        for _ in range(100):
+            rate.on_response(200, {}, 0.1)
+        self.assertEqual(3, rate.parallelism)
+
+    def test_rate_limit_response_halves_rate_and_parallelism(self):
+        rate = RateController(1, 0.1, 60, 4)
+        rate.window = 4
+        rate.on_response(429, {}, 0.1)
+        self.assertAlmostEqual(2, rate.period)
+        self.assertEqual(2, rate.parallelism)
+
+    def test_error_doesnt_go_below_min_rate(self):
+        rate = RateController(1, 0.1, 4)
+        for _ in range(10):
+            rate.on_error()
+        self.assertAlmostEqual(4, rate.period)
+
+    def test_slow_response_decreases_rate(self):
+        rate = RateController(1, 0.1, 60)
+        rate.on_response(200, {}, 0.5)
+        period = rate.period
+        rate.on_response(200, {}, 5)
+        self.assertGreater(rate.period, period)
+
+    def test_retry_after_blocks_requests(self):
+        rate = RateController(1, 0.1, 60)
+        rate.on_response(429, {"Retry-After": "120"}, 0.1)
+        self.assertAlmostEqual(time.time() + 120, rate.blocked_until, delta=5)
+
+    def test_rate_limit_headers_cap_rate_to_remaining_budget(self):
+        rate = RateController(0.1, 0.1, 60)
+        reset = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 100))
+        rate.on_response(
+            200, {"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": reset}, 0.1
+        )
+        self.assertAlmostEqual(10, rate.period, delta=1)
+
+    def test_exhausted_rate_limit_blocks_until_reset(self):
+        rate = RateController(1, 0.1, 60)
+        reset = time.time() + 100
+        rate.on_response(
+            200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)}, 0.1
+        )
+        self.assertAlmostEqual(reset, rate.blocked_until)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_given_seconds_returns_time_from_now(self):
+        self.assertEqual(130, parse_retry_after({"Retry-After": "30"}, 100))
+
+    def test_given_http_date_returns_the_date(self):
+        retry_at = time.time() + 100
+        headers = {"Retry-After": formatdate(retry_at, usegmt=True)}
+        self.assertAlmostEqual(retry_at, parse_retry_after(headers, 0), delta=1)
+
+    def test_given_invalid_value_returns_none(self):
+        self.assertIsNone(parse_retry_after({"Retry-After": "soon"}, 0))
+
+    def test_given_no_header_returns_none(self):
+        self.assertIsNone(parse_retry_after({}, 0))
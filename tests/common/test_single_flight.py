@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from test_helpers import async_test
+
+from common.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    @async_test
+    async def test_run_given_concurrent_calls_calls_func_once(self):
+        single_flight = SingleFlight()
+        event = asyncio.Event()
+
+        async def func():
+            await event.wait()
+            return "result"
+
+        mock = AsyncMock(side_effect=func)
+        calls = [asyncio.create_task(single_flight.run("key", mock)) for _ in range(3)]
+        await asyncio.sleep(0)
+        event.set()
+        self.assertListEqual(["result"] * 3, await asyncio.gather(*calls))
+        mock.assert_awaited_once()
+        self.assertEqual(2, single_flight.stats[SingleFlight.COALESCED])
+
+    @async_test
+    async def test_run_given_different_keys_calls_func_for_each(self):
+        single_flight = SingleFlight()
+        mock = AsyncMock(return_value="result")
+        await asyncio.gather(single_flight.run("a", mock), single_flight.run("b", mock))
+        self.assertEqual(2, mock.await_count)
+
+    @async_test
+    async def test_run_given_sequential_calls_without_ttl_calls_func_again(self):
+        single_flight = SingleFlight()
+        mock = AsyncMock(return_value="result")
+        await single_flight.run("key", mock)
+        await single_flight.run("key", mock)
+        self.assertEqual(2, mock.await_count)
+
+    @async_test
+    async def test_run_given_ttl_reuses_result(self):
+        single_flight = SingleFlight(ttl=10)
+        mock = AsyncMock(return_value="result")
+        await single_flight.run("key", mock)
+        self.assertEqual("result", await single_flight.run("key", mock))
+        mock.assert_awaited_once()
+        self.assertEqual(1, single_flight.stats[SingleFlight.CACHED])
+
+    @async_test
+    async def test_run_given_exception_raises_it_for_all_callers(self):
+        single_flight = SingleFlight(ttl=10)
+        mock = AsyncMock(side_effect=ValueError())
+        results = await asyncio.gather(
+            single_flight.run("key", mock),
+            single_flight.run("key", mock),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        with self.assertRaises(ValueError):
+            await single_flight.run("key", mock)
+
+    @async_test
+    async def test_run_given_cancelled_caller_doesnt_cancel_others(self):
+        single_flight = SingleFlight()
+        event = asyncio.Event()
+
+        async def func():
+            await event.wait()
+            return "result"
+
+        first = asyncio.create_task(single_flight.run("key", func))
+        second = asyncio.create_task(single_flight.run("key", func))
+        await asyncio.sleep(0)
+        first.cancel()
+        event.set()
+        self.assertEqual("result", await second)
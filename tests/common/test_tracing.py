@@ -0,0 +1,118 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from test_helpers import async_test
+from yarl import URL
+
+from common.tracing import ConnectionStats, Histogram, LatencyStats, RequestTimings
+
+
+async def request(stats: ConnectionStats, url: str, reused: bool) -> None:
+    ctx = SimpleNamespace()
+    await stats._on_request_start(None, ctx, Mock(url=URL(url)))
+    if reused:
+        await stats._on_connection_reuseconn(None, ctx, None)
+    else:
+        await stats._on_connection_create_end(None, ctx, None)
+
+
+class TestConnectionStats(unittest.TestCase):
+    @async_test
+    async def test_connection_stats_counts_connections_per_host(self):
+        stats = ConnectionStats()
+        await request(stats, "https://a.example/1", False)
+        await request(stats, "https://a.example/2", True)
+        await request(stats, "https://b.example/1", False)
+        self.assertDictEqual(
+            {
+                "total": {"reused": 1, "new": 2},
+                "hosts": {
+                    "a.example": {"reused": 1, "new": 1},
+                    "b.example": {"reused": 0, "new": 1},
+                },
+            },
+            stats.get_stats(),
+        )
+
+    @async_test
+    async def test_get_stats_returns_only_top_hosts(self):
+        stats = ConnectionStats()
+        await request(stats, "https://a.example/1", False)
+        await request(stats, "https://b.example/1", False)
+        await request(stats, "https://b.example/2", True)
+        self.assertListEqual(["b.example"], list(stats.get_stats(1)["hosts"].keys()))
+
+    @async_test
+    async def test_connection_stats_keeps_most_recently_connected_hosts(self):
+        stats = ConnectionStats(max_hosts=2)
+        for host in ["a", "b", "a", "c"]:
+            await request(stats, f"https://{host}.example/", False)
+        self.assertListEqual(["a.example", "c.example"], list(stats.per_host))
+        self.assertDictEqual({"reused": 0, "new": 4}, stats.total)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_get_stats_returns_counts_and_quantiles(self):
+        histogram = Histogram()
+        for value in [0.001, 0.02, 0.02, 30]:
+            histogram.add(value)
+        stats = histogram.get_stats()
+        self.assertEqual(4, stats["count"])
+        self.assertEqual(0.025, stats["p50"])
+        self.assertEqual(float("inf"), stats["p99"])
+        self.assertDictEqual({"<=0.005": 1, "<=0.025": 2, ">20": 1}, stats["buckets"])
+
+
+class TestLatencyStats(unittest.TestCase):
+    @async_test
+    async def test_hooks_record_phases_of_request_without_timings(self):
+        stats = LatencyStats()
+        ctx = SimpleNamespace(trace_request_ctx=None)
+        await stats._on_request_start(None, ctx, Mock(url=URL("https://a.example/")))
+        await stats._on_connection_create_start(None, ctx, None)
+        await stats._on_dns_resolvehost_start(None, ctx, None)
+        await stats._on_dns_resolvehost_end(None, ctx, None)
+        await stats._on_connection_create_end(None, ctx, None)
+        await stats._on_request_headers_sent(None, ctx, None)
+        await stats._on_request_end(None, ctx, Mock(response=Mock(status=200)))
+        result = stats.get_stats()
+        for phase in ["dns", "connect", "ttfb", "total"]:
+            self.assertEqual(1, result["total"][phase]["count"])
+        self.assertEqual(0, result["total"]["body"]["count"])
+        self.assertIn("a.example", result["hosts"])
+        self.assertEqual(1, result["outcomes"]["200"]["count"])
+
+    @async_test
+    async def test_hooks_record_request_without_response(self):
+        stats = LatencyStats()
+        ctx = SimpleNamespace(trace_request_ctx=None)
+        await stats._on_request_start(None, ctx, Mock(url=URL("https://a.example/")))
+        await stats._on_request_exception(None, ctx, None)
+        outcomes = stats.get_stats()["outcomes"]
+        self.assertEqual(1, outcomes[LatencyStats.NO_RESPONSE]["count"])
+
+    @async_test
+    async def test_given_timings_request_is_recorded_with_body(self):
+        stats = LatencyStats()
+        timings = RequestTimings()
+        ctx = SimpleNamespace(trace_request_ctx=timings)
+        await stats._on_request_start(None, ctx, Mock(url=URL("https://a.example/")))
+        await stats._on_request_end(None, ctx, None)
+        self.assertEqual(0, stats.get_stats()["total"]["total"]["count"])
+        stats.record("a.example", timings)
+        self.assertEqual(1, stats.get_stats()["total"]["body"]["count"])
+
+    def test_record_traces_sampled_requests(self):
+        trace = Mock()
+        stats = LatencyStats(trace=trace, trace_sample=1)
+        stats.record("a.example", RequestTimings())
+        self.assertEqual(("L", "a.example"), trace.call_args.args[:2])
+
+    def test_record_keeps_most_recently_requested_hosts(self):
+        stats = LatencyStats(max_hosts=2)
+        for host in ["a.example", "b.example", "a.example", "c.example"]:
+            stats.record(host, RequestTimings())
+        self.assertListEqual(["a.example", "c.example"], list(stats.per_host))
+        self.assertEqual(2, stats.per_host["a.example"]["total"].count)
+        self.assertEqual(4, stats.total["total"].count)
@@ -175,7 +175,7 @@ class TestWebfinger(unittest.TestCase):
         actor_uri = self.host_meta_lrdd_template + actor
         mock_session = mock_client_session(None)
         webfinger = wf.WebFinger(session=mock_session)
-        webfinger.meta_cache[url] = (1e12, self.host_meta_lrdd_template + "{uri}")
+        webfinger.meta_cache.set(url, self.host_meta_lrdd_template + "{uri}")
         webfinger.resolve_webfinger = AsyncMock()
         result = await webfinger.resolve_webfinger_from_host_meta(actor)
         self.assertIsNotNone(result)
@@ -189,7 +189,7 @@ class TestWebfinger(unittest.TestCase):
         actor = "acct:test@example.com"
         mock_session = mock_client_session(None)
         webfinger = wf.WebFinger(session=mock_session)
-        webfinger.meta_cache[url] = (1e12, None)
+        webfinger.meta_cache.set(url, None)
         webfinger.resolve_webfinger = AsyncMock()
         result = await webfinger.resolve_webfinger_from_host_meta(actor)
         self.assertIsNone(result)
@@ -208,6 +208,27 @@ class TestWebfinger(unittest.TestCase):
         result = await webfinger.resolve_webfinger_from_host_meta(actor)
         self.assertDictEqual(response, result)
 
+    @async_test
+    async def test_resolve_webfinger_from_host_meta_given_http_error_caches_none(self):
+        url = "https://example.com/.well-known/host-meta"
+        actor = "acct:test@example.com"
+        mock_session = mock_client_session({url: None})
+        webfinger = wf.WebFinger(session=mock_session)
+        self.assertIsNone(await webfinger.resolve_webfinger_from_host_meta(actor))
+        self.assertIsNone(await webfinger.resolve_webfinger_from_host_meta(actor))
+        self.assertEqual(1, mock_session.get.call_count)
+
+    @async_test
+    async def test_get_actor_webfinger_given_cached_result_doesnt_resolve(self):
+        actor = "acct:test@example.com"
+        mock_session = mock_client_session({})
+        webfinger = wf.WebFinger(session=mock_session)
+        webfinger.actor_cache.set(actor, (actor, "https://example.com/test"))
+        webfinger.resolve_webfinger = AsyncMock()
+        result = await webfinger.get_actor_webfinger(actor)
+        self.assertTupleEqual((actor, "https://example.com/test"), result)
+        webfinger.resolve_webfinger.assert_not_awaited()
+
     @async_test
     async def test_resolve_webfinger_given_invalid_actor_returns_none(self):
         mock_session = mock_client_session({})
@@ -0,0 +1,142 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from aiohttp import web
+from mocks.db import memory_queue
+from test_helpers import async_test
+
+from lookup.cluster import SECRET_HEADER, ClusterNode, LeaseTable
+from lookup.database.queue import QueueState
+from lookup.server import WebServer
+from lookup.shard import domain_shard
+
+A = "http://a.local"
+B = "http://b.local"
+
+
+def domain_of_bucket(bucket: int, buckets: int) -> str:
+    i = 0
+    while domain_shard(f"example{i}.com", buckets) != bucket:
+        i += 1
+    return f"example{i}.com"
+
+
+def owned(lease_table: LeaseTable, node: str):
+    return {b for b, owner in enumerate(lease_table.owners) if owner == node}
+
+
+class TestLeaseTable(unittest.TestCase):
+    def test_renew_given_single_node_leases_all_buckets(self):
+        lease_table = LeaseTable(8, 60)
+        lease = lease_table.renew(A, 0)
+        self.assertListEqual([A], lease["nodes"])
+        self.assertListEqual([0] * 8, lease["owners"])
+
+    def test_renew_given_new_node_rebalances_without_double_owner(self):
+        lease_table = LeaseTable(8, 60)
+        lease_table.renew(A, 0)
+        lease_table.renew(B, 1)
+        # A still has all buckets until it renews
+        self.assertEqual(8, len(owned(lease_table, A)))
+        self.assertEqual(0, len(owned(lease_table, B)))
+        lease_table.renew(A, 2)
+        self.assertEqual(4, len(owned(lease_table, A)))
+        # A may not know it released them until its previous lease ends
+        lease_table.renew(B, 3)
+        self.assertEqual(0, len(owned(lease_table, B)))
+        lease_table.renew(A, 40)
+        lease_table.renew(B, 62)
+        self.assertEqual(4, len(owned(lease_table, B)))
+        self.assertFalse(owned(lease_table, A) & owned(lease_table, B))
+
+    def test_renew_given_expired_node_fails_over_its_buckets(self):
+        lease_table = LeaseTable(8, 60)
+        lease_table.renew(A, 0)
+        lease_table.renew(B, 0)
+        lease_table.renew(A, 1)
+        lease_table.renew(B, 1)
+        lease_table.renew(B, 100)
+        self.assertEqual(8, len(owned(lease_table, B)))
+        self.assertNotIn(A, lease_table.nodes)
+
+
+class TestClusterNode(unittest.TestCase):
+    @staticmethod
+    def node(lease_table=None) -> ClusterNode:
+        # noinspection PyTypeChecker
+        return ClusterNode(A, A, Mock(), 8, 60, "secret", lease_table)
+
+    @async_test
+    async def test_owns_given_leased_bucket_returns_true(self):
+        node = self.node(LeaseTable(8, 60))
+        self.assertFalse(node.owns("example.com"))
+        self.assertSetEqual(set(), node.buckets())
+        await node.renew()
+        self.assertTrue(node.owns("example.com"))
+        self.assertSetEqual(set(range(8)), node.buckets())
+
+    def test_apply_lease_given_expired_lease_doesnt_own(self):
+        node = self.node()
+        node.apply_lease({"ttl": 60, "nodes": [A], "owners": [0] * 8}, 0)
+        self.assertFalse(node.owns("example.com"))
+
+    @async_test
+    async def test_forward_given_other_owner_posts_batch(self):
+        node = self.node()
+        node._post = AsyncMock()
+        node.apply_lease(
+            {"ttl": 60, "nodes": [A, B], "owners": [0] * 4 + [1] * 4}, 1e12
+        )
+        domain = domain_of_bucket(5, 8)
+        found = ("https://" + domain + "/a", "example.com", False, None)
+        node.forward(domain, found)
+        node.flush()
+        await asyncio.sleep(0)
+        node._post.assert_called_once_with(B, [found])
+
+    @async_test
+    async def test_handle_found_given_unleased_bucket_keeps_until_renewal(self):
+        node = self.node(LeaseTable(8, 60))
+        on_found = AsyncMock()
+        node.on_found = on_found
+        found = ("https://example.com/a", "example.org", True, None)
+        await node.handle_found([found])
+        node.flush()
+        on_found.assert_not_awaited()
+        self.assertEqual(1, node.get_stats()["pending"])
+        await node.renew()
+        on_found.assert_awaited_once_with([found])
+        self.assertEqual(0, node.get_stats()["pending"])
+
+    def test_check_cluster_secret_given_empty_secret_rejects_requests(self):
+        # noinspection PyTypeChecker
+        node = ClusterNode(A, A, Mock(), 8, 60, "")
+        server = WebServer(Mock(), cluster=node)
+        with self.assertRaises(web.HTTPForbidden):
+            server._check_cluster_secret(Mock(headers={SECRET_HEADER: ""}))
+        server.cluster = self.node()
+        with self.assertRaises(web.HTTPForbidden):
+            server._check_cluster_secret(Mock(headers={SECRET_HEADER: "wrong"}))
+        server._check_cluster_secret(Mock(headers={SECRET_HEADER: "secret"}))
+
+    @async_test
+    async def test_queue_keeps_waiting_elements_of_released_bucket(self):
+        domain = domain_of_bucket(3, 8)
+        db_queue = await memory_queue()
+        node = self.node()
+        db_queue.shard = node
+        await db_queue.insert(
+            f"https://{domain}/a", domain, domain, QueueState.Waiting, 10
+        )
+        lease = {"ttl": 60, "nodes": [A, B], "owners": [0] * 8}
+        node.apply_lease(lease, time.time())
+        self.assertListEqual([domain], await db_queue.get_waiting_domains())
+        # not handed over to the new owner, kept until the bucket comes back
+        node.apply_lease({**lease, "owners": [0, 0, 0, 1, 0, 0, 0, 0]}, time.time())
+        self.assertListEqual([], await db_queue.get_waiting_domains())
+        self.assertIsNotNone(await db_queue.get_element(f"https://{domain}/a"))
+        node.apply_lease(lease, time.time())
+        self.assertListEqual([domain], await db_queue.get_waiting_domains())
+        await db_queue.conn.close()
@@ -0,0 +1,108 @@
+import unittest
+
+import aiosqlite
+from test_helpers import async_test
+
+from lookup.database.domain_ids import DomainIds
+from lookup.database.domains import Domains, DomainState
+from lookup.database.queue import FifoQueue, QueueState
+from lookup.database.webfinger_queue import WebfingerQueue
+from lookup.shard import Shard, domain_shard
+
+
+async def memory_connection() -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(":memory:")
+    conn.row_factory = aiosqlite.Row
+    return conn
+
+
+class TestDomainIds(unittest.TestCase):
+    @async_test
+    async def test_get_ids_assigns_ids_once(self):
+        domain_ids = DomainIds()
+        await domain_ids.setup(await memory_connection())
+        ids = await domain_ids.get_ids(["a.example", "b.example"])
+        self.assertNotEqual(ids["a.example"], ids["b.example"])
+        self.assertEqual(ids["a.example"], await domain_ids.get_id("a.example"))
+        self.assertIsNone(await domain_ids.find("c.example"))
+        await domain_ids.conn.close()
+
+    @async_test
+    async def test_get_names_given_id_added_by_another_process(self):
+        conn = await memory_connection()
+        domain_ids, other = DomainIds(), DomainIds()
+        await domain_ids.setup(conn)
+        await other.setup(conn)
+        domain_id = await other.get_id("a.example")
+        self.assertEqual(
+            {domain_id: "a.example"}, await domain_ids.get_names([domain_id, None])
+        )
+        self.assertEqual(domain_id, await domain_ids.find("a.example"))
+        await conn.close()
+
+    @async_test
+    async def test_setup_migrates_tables_with_domain_names(self):
+        conn = await memory_connection()
+        await conn.execute(
+            "CREATE TABLE queue (queue_id INTEGER, uri TEXT PRIMARY KEY, domain TEXT, "
+            "found_in TEXT, state INTEGER, next_update INTEGER, update_time INTEGER, "
+            "hash TEXT, aux TEXT);"
+        )
+        await conn.execute(
+            "INSERT INTO queue(rowid, queue_id, uri, domain, found_in, state) "
+            "VALUES (7, 1, 'https://a.example/1', 'a.example', 'b.example', "
+            f"{QueueState.WaitingPriority})"
+        )
+        await conn.execute(
+            "CREATE TABLE domains (domain TEXT PRIMARY KEY, next_req REAL, "
+            "fail_streak INTEGER, state INTEGER NOT NULL);"
+        )
+        await conn.execute(
+            f"INSERT INTO domains VALUES ('a.example', 0, 1, {DomainState.Unknown})"
+        )
+        domain_ids = DomainIds()
+        await domain_ids.setup(conn)
+        domains, queue = Domains(domain_ids), FifoQueue(domain_ids=domain_ids)
+        await domains.setup(conn)
+        await queue.setup(conn)
+
+        element = await queue.get_element("https://a.example/1")
+        self.assertEqual("a.example", element["domain"])
+        self.assertEqual("b.example", element["found_in"])
+        self.assertEqual(7, await queue.get_last_rowid())
+        self.assertEqual(
+            ["a.example"], [row["domain"] for row in await domains.get_all()]
+        )
+        self.assertEqual(1, len(await queue.get_random_from_domain("a.example", 10)))
+        self.assertFalse(
+            await queue.insert(
+                "https://a.example/1", "a.example", None, QueueState.Waiting, 10
+            )
+        )
+        await conn.close()
+
+    @async_test
+    async def test_webfinger_queue_migrates_and_filters_by_shard(self):
+        conn = await memory_connection()
+        await conn.execute(
+            "CREATE TABLE webfinger_queue (num INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "uri TEXT UNIQUE, actor TEXT, domain TEXT);"
+        )
+        await conn.execute(
+            "INSERT INTO webfinger_queue VALUES "
+            "(5, 'https://a.example/u', 'acct:u@a.example', 'a.example')"
+        )
+        webfinger_queue = WebfingerQueue(Shard(domain_shard("a.example", 2), 2, []))
+        await webfinger_queue.setup(conn)
+        await webfinger_queue.insert(
+            "https://b.example/u", "acct:u@b.example", "b.example"
+        )
+        items = await webfinger_queue.get_after(0, 10)
+        # b.example is in the other shard
+        self.assertEqual(
+            [(5, "a.example")], [(item["num"], item["domain"]) for item in items]
+        )
+        webfinger_queue.shard = None
+        items = await webfinger_queue.get_after(5, 10)
+        self.assertEqual(["b.example"], [item["domain"] for item in items])
+        await conn.close()
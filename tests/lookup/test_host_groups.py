@@ -0,0 +1,76 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from test_helpers import async_test
+
+from lookup.host_groups import HostGroups
+from lookup.schedule_queue import Domain, ScheduleQueue
+
+
+class TestHostGroups(unittest.TestCase):
+    def test_group_key_given_ipv4_uses_prefix(self):
+        groups = HostGroups(Mock(), ipv4_prefix=24)
+        self.assertEqual("10.1.2.0/24", groups.group_key("10.1.2.3"))
+
+    def test_group_key_given_ipv6_uses_prefix(self):
+        groups = HostGroups(Mock(), ipv6_prefix=64)
+        self.assertEqual("2001:db8::/64", groups.group_key("2001:db8::1"))
+
+    def test_group_key_given_address_in_network_returns_network(self):
+        groups = HostGroups(Mock(), networks=["10.0.0.0/8"])
+        self.assertEqual("10.0.0.0/8", groups.group_key("10.1.2.3"))
+        self.assertEqual("11.1.2.3/32", groups.group_key("11.1.2.3"))
+
+    @async_test
+    async def test_assign_groups_domains_of_same_address(self):
+        groups = HostGroups(Mock())
+        groups._resolve = AsyncMock(side_effect=["1.2.3.4/32", "1.2.3.4/32", None])
+        domains = {"a.com": Domain(), "b.com": Domain(), "c.com": Domain()}
+        await groups.assign(domains)
+        self.assertIsNotNone(domains["a.com"].group)
+        self.assertIs(domains["a.com"].group, domains["b.com"].group)
+        self.assertIsNone(domains["c.com"].group)
+        self.assertEqual(2, domains["a.com"].group.domains)
+
+    @async_test
+    async def test_assign_resolves_domain_once(self):
+        groups = HostGroups(Mock())
+        groups._resolve = AsyncMock(return_value="1.2.3.4/32")
+        domain = Domain()
+        await groups.assign({"a.com": domain})
+        await groups.assign({"a.com": domain})
+        groups._resolve.assert_awaited_once()
+        self.assertEqual(1, domain.group.domains)
+
+    @async_test
+    async def test_assign_soon_assigns_unresolved_domains_in_background(self):
+        groups = HostGroups(Mock())
+        groups._resolve = AsyncMock(return_value="1.2.3.4/32")
+        domain = Domain()
+        groups.assign_soon({"a.com": domain})
+        groups.assign_soon({"a.com": domain})
+        self.assertIsNone(domain.group)
+        await asyncio.gather(*groups._tasks)
+        self.assertIsNotNone(domain.group)
+        groups._resolve.assert_awaited_once()
+        other = Domain()
+        groups.assign_soon({"b.com": other, "a.com": domain})
+        self.assertEqual(1, domain.group.domains)
+        await asyncio.gather(*groups._tasks)
+
+    @patch("lookup.schedule_queue.Config.host_group_request_period", 0.05)
+    @async_test
+    async def test_schedule_queue_spaces_domains_of_same_group(self):
+        groups = HostGroups(Mock())
+        groups._resolve = AsyncMock(return_value="1.2.3.4/32")
+        domains = {"a.com": Domain(), "b.com": Domain()}
+        await groups.assign(domains)
+        queue = ScheduleQueue(10)
+        await queue.put({"uri": "a"}, domains["a.com"])
+        await queue.put({"uri": "b"}, domains["b.com"])
+        st = time.time()
+        await queue.get_first_available()
+        await queue.get_first_available()
+        self.assertGreaterEqual(time.time(), st + 0.05)
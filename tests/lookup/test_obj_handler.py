@@ -1,34 +1,42 @@
+import json
 import unittest
 from typing import Any, Tuple
 from unittest.mock import AsyncMock, Mock, patch
 
+import aiosqlite
 from mocks.db import mock_lookup_db
 from test_helpers import async_test
 
-from common.webfinger import WebFinger
-from lookup.database.objects import AsObjectType
-from lookup.obj_handler import ObjectHandler
+from common import json_codec
+from common.activity_streams import content_hash
+from common.cache import MISSING
+from common.json_codec import dumps
+from lookup.config import Config
+from lookup.database.objects import AsObjectType, Objects
+from lookup.database.queue import QueueState
+from lookup.obj_handler import ObjectHandler, parse_pruned, prune_unused_fields
+from lookup.webfinger_resolver import WebfingerResolver
 
 
 def testable_handler(
     mock_handle: bool = False,
 ) -> Tuple[ObjectHandler, Any, AsyncMock, Mock, list]:
     db = mock_lookup_db()
-    webfinger = Mock(spec=WebFinger)
-    on_id_found = AsyncMock()
+    webfinger = Mock(spec=WebfingerResolver)
+    on_ids_found = AsyncMock()
     # noinspection PyTypeChecker
-    handler = ObjectHandler(db, on_id_found, webfinger)
+    handler = ObjectHandler(db, on_ids_found, webfinger)
 
     handle_args = []
     if mock_handle:
 
         async def handle(
-            obj, domain: str, priority: bool = False, top_level=False, aux=None
+            obj, domain: str, found, priority: bool = False, top_level=False, aux=None
         ) -> None:
             handle_args.append((obj, domain, priority, top_level, aux))
 
         handler._handle = handle
-    return handler, db, on_id_found, webfinger, handle_args
+    return handler, db, on_ids_found, webfinger, handle_args
 
 
 class TestObjectHandler(unittest.TestCase):
@@ -40,7 +48,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": "a_val", "b": "b_val", "c": "c_val"}
         fields = ["a", "c"]
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         expected = ["a_val", "c_val"]
         self.assertListEqual(expected, [r[0] for r in handle_args])
         self.assertListEqual([domain] * len(expected), [r[1] for r in handle_args])
@@ -54,7 +62,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": ["a_val1", "a_val2", "a_val3"]}
         fields = ["a"]
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         expected = ["a_val1", "a_val2", "a_val3"]
         self.assertListEqual(expected, [r[0] for r in handle_args])
         self.assertListEqual([domain] * len(expected), [r[1] for r in handle_args])
@@ -70,7 +78,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": ["a_val1", "a_val2", "a_val3"], "b": "b_val", "c": "c_val"}
         fields = ["a", "c"]
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         expected = ["a_val1", "a_val2", "a_val3", "c_val"]
         self.assertListEqual(expected, [r[0] for r in handle_args])
         self.assertListEqual([domain] * len(expected), [r[1] for r in handle_args])
@@ -84,7 +92,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": "a_val", "b": "b_val", "c": "c_val"}
         fields = []
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         self.assertListEqual([], handle_args)
 
     @async_test
@@ -95,7 +103,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": "a_val", "b": "b_val", "c": "c_val"}
         fields = ["d", "e", "f"]
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         self.assertListEqual([], handle_args)
 
     @async_test
@@ -106,7 +114,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": "a_val", "b": "b_val", "c": "c_val"}
         fields = ["a", "e", "f"]
         domain, priority = "example.com", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         self.assertListEqual([("a_val", domain, priority, False, None)], handle_args)
 
     @async_test
@@ -117,7 +125,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": "a_val", "b": "b_val", "c": "c_val"}
         fields = ["a", "c", "e", "f"]
         domain, priority = "example.net", False
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         expected = [
             ("a_val", domain, priority, False, None),
             ("c_val", domain, priority, False, None),
@@ -132,7 +140,7 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"a": ["a_val1", "a_val2"], "b": "b_val", "c": "c_val"}
         fields = ["a", "c", "e", "f"]
         domain, priority = "example.com", True
-        await handler._handle_fields(obj, fields, domain, priority)
+        await handler._handle_fields(obj, fields, domain, [], priority)
         expected = [
             ("a_val1", domain, priority, False, None),
             ("a_val2", domain, priority, False, None),
@@ -153,7 +161,7 @@ class TestObjectHandler(unittest.TestCase):
             "following": "actor_following",
         }
         domain = "example.com"
-        await handler._handle_actor(obj, domain)
+        await handler._handle_actor(obj, domain, [])
         expected = [
             ("actor_outbox", domain, False, False, None),
             ("actor_followers", domain, True, False, None),
@@ -175,7 +183,7 @@ class TestObjectHandler(unittest.TestCase):
             "orderedItems": ["c", "d"],
         }
         domain = "example.com"
-        await handler._handle_collection_or_page(obj, domain, True)
+        await handler._handle_collection_or_page(obj, domain, [], True)
         expected = [
             ("a", "example.com", True, False, {"colDir": "prev"}),
             ("b", "example.com", True, False, {"colDir": "prev"}),
@@ -197,8 +205,8 @@ class TestObjectHandler(unittest.TestCase):
             "following": "actor_following",
         }
         domain = "example.com"
-        webfinger.resolve_actor_webfinger.return_value = None
-        await handler._handle_actor(obj, domain)
+        webfinger.get_cached.return_value = None
+        await handler._handle_actor(obj, domain, [])
         db.objects.insert.assert_awaited_once_with(
             "actor_uri", obj, AsObjectType.Actor, {"webfinger": None}
         )
@@ -218,8 +226,8 @@ class TestObjectHandler(unittest.TestCase):
             "following": "actor_following",
         }
         domain = "example.com"
-        webfinger.resolve_actor_webfinger.return_value = "actor_webfinger"
-        await handler._handle_actor(obj, domain)
+        webfinger.get_cached.return_value = "actor_webfinger"
+        await handler._handle_actor(obj, domain, [])
         db.objects.insert.assert_awaited_once_with(
             "actor_uri", obj, AsObjectType.Actor, {"webfinger": "actor_webfinger"}
         )
@@ -239,9 +247,9 @@ class TestObjectHandler(unittest.TestCase):
         }
         _patched_actor.return_value = None
         domain = "example.com"
-        await handler._handle_actor(obj, domain)
+        await handler._handle_actor(obj, domain, [])
         _patched_actor.assert_not_called()
-        webfinger.resolve_actor_webfinger.assert_not_awaited()
+        webfinger.defer.assert_not_awaited()
 
     @patch("lookup.obj_handler.actor_from_as")
     @async_test
@@ -258,13 +266,13 @@ class TestObjectHandler(unittest.TestCase):
             "following": "actor_following",
         }
         _patched_actor.return_value = None
-        await handler._handle_actor(obj, None)
+        await handler._handle_actor(obj, None, [])
         _patched_actor.assert_not_called()
-        webfinger.resolve_actor_webfinger.assert_not_awaited()
+        webfinger.defer.assert_not_awaited()
 
     @patch("lookup.obj_handler.actor_from_as")
     @async_test
-    async def test_handle_actor_given_valid_actor_calls_webfinger_resolve(
+    async def test_handle_actor_given_uncached_webfinger_defers_resolution(
         self, _patched_actor
     ):
         handler, db, ids_found, webfinger, handle_args = testable_handler(
@@ -278,26 +286,61 @@ class TestObjectHandler(unittest.TestCase):
         }
         _patched_actor.return_value = "acct:actor@example.com"
         domain = "example.com"
-        await handler._handle_actor(obj, domain)
+        webfinger.get_cached.return_value = MISSING
+        await handler._handle_actor(obj, domain, [])
         _patched_actor.assert_called_once_with(obj, domain)
-        webfinger.resolve_actor_webfinger.assert_awaited_once_with(
+        webfinger.get_cached.assert_called_once_with(
             "acct:actor@example.com", "actor_uri"
         )
+        webfinger.defer.assert_awaited_once_with(
+            "actor_uri", "acct:actor@example.com", domain
+        )
+        db.objects.insert_keeping_aux.assert_awaited_once_with(
+            "actor_uri", obj, AsObjectType.Actor, {"webfinger": None}
+        )
+        db.objects.insert.assert_not_awaited()
 
+    @patch("lookup.obj_handler.actor_from_as")
     @async_test
-    async def test__handle_given_string_calls_on_id_found(self):
+    async def test_handle_actor_given_cold_cache_keeps_resolved_webfinger(
+        self, _patched_actor
+    ):
+        handler, db, ids_found, webfinger, handle_args = testable_handler(
+            mock_handle=True
+        )
+        conn = await aiosqlite.connect(":memory:")
+        conn.row_factory = aiosqlite.Row
+        db.objects = Objects()
+        await db.objects.setup(conn)
+        obj = {"id": "actor_uri", "name": "a"}
+        await db.objects.insert(
+            "actor_uri", obj, AsObjectType.Actor, {"webfinger": "acct:a@example.com"}
+        )
+        _patched_actor.return_value = "acct:a@example.com"
+        webfinger.get_cached.return_value = MISSING
+        await handler._handle_actor({"id": "actor_uri", "name": "b"}, "example.com", [])
+        row = await db.objects.get_as_object("actor_uri")
+        self.assertEqual("b", json.loads(row["json"])["name"])
+        self.assertDictEqual(
+            {"webfinger": "acct:a@example.com"}, json.loads(row["aux"])
+        )
+        await conn.close()
+
+    @async_test
+    async def test__handle_given_string_adds_it_to_found(self):
         handler, db, id_found, *_ = testable_handler()
         obj = "object_id"
-        domain, priority = "example.com", False
-        await handler._handle(obj, domain, priority)
-        id_found.assert_awaited_once_with(obj, domain, priority, None)
+        domain, priority, found = "example.com", False, []
+        await handler._handle(obj, domain, found, priority)
+        self.assertListEqual([(obj, domain, priority, None)], found)
+        id_found.assert_not_awaited()
 
     @async_test
     async def test__handle_given_none_does_nothing(self):
         handler, db, id_found, *_ = testable_handler()
         obj = None
         domain, priority = "example.com", False
-        await handler._handle(obj, domain, priority)
+        await handler._handle(obj, domain, [], priority)
         id_found.assert_not_awaited()
         db.queue.update_state.assert_not_awaited()
 
@@ -307,10 +350,10 @@ class TestObjectHandler(unittest.TestCase):
         handler._handle_actor = AsyncMock()
         obj = {"type": "Person"}
         domain, priority = "example.com", False
-        await handler._handle(obj, domain, priority)
+        await handler._handle(obj, domain, [], priority)
         id_found.assert_not_awaited()
         db.queue.update_state.assert_not_awaited()
-        handler._handle_actor.assert_awaited_once_with(obj, domain)
+        handler._handle_actor.assert_awaited_once_with(obj, domain, [])
 
     @async_test
     async def test__handle_given_person_with_trust_domain_id_calls_handle_actor(self):
@@ -320,10 +363,10 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"uri": oid, "type": "Person"}
         domain, priority = "example.com", False
         db.queue.get_element.return_value = None
-        await handler._handle(obj, domain, priority, top_level=True)
+        await handler._handle(obj, domain, [], priority, top_level=True)
         id_found.assert_not_awaited()
         db.queue.insert.assert_awaited_once()
-        handler._handle_actor.assert_awaited_once_with(obj, domain)
+        handler._handle_actor.assert_awaited_once_with(obj, domain, [])
 
     @async_test
     async def test__handle_given_person_update_calls_update_state_time(self):
@@ -333,9 +376,31 @@ class TestObjectHandler(unittest.TestCase):
         obj = {"uri": oid, "type": "Person"}
         domain, priority = "example.com", False
         db.queue.get_element.return_value = {"hash": None}
-        await handler._handle(obj, domain, priority, top_level=True)
+        await handler._handle(obj, domain, [], priority, top_level=True)
+        id_found.assert_not_awaited()
+        db.queue.update_state_time.assert_awaited_once()
+
+    @async_test
+    async def test__handle_given_unchanged_person_skips_handling_it(self):
+        handler, db, id_found, *_ = testable_handler()
+        handler._handle_actor = AsyncMock()
+        obj = {"uri": "https://example.com/actor/1", "type": "Person"}
+        cur_hash = content_hash(obj)
+        db.queue.get_element.return_value = {"hash": cur_hash, "update_time": 10}
+        await handler._handle(obj, "example.com", [], False, top_level=True)
+        db.queue.update_state_time.assert_awaited_once()
+        handler._handle_actor.assert_not_awaited()
         id_found.assert_not_awaited()
+
+    @async_test
+    async def test__handle_given_changed_person_handles_it(self):
+        handler, db, id_found, *_ = testable_handler()
+        handler._handle_actor = AsyncMock()
+        obj = {"uri": "https://example.com/actor/1", "type": "Person"}
+        db.queue.get_element.return_value = {"hash": "old", "update_time": 10}
+        await handler._handle(obj, "example.com", [], False, top_level=True)
         db.queue.update_state_time.assert_awaited_once()
+        handler._handle_actor.assert_awaited_once_with(obj, "example.com", [])
 
     @async_test
     async def test__handle_given_person_with_not_trust_id_calls_id_found(self):
@@ -344,8 +409,9 @@ class TestObjectHandler(unittest.TestCase):
         oid = "https://example.com/actor/1"
         obj = {"uri": oid, "type": "Person"}
         domain, priority = "domain.net", False
-        await handler._handle(obj, domain, priority)
-        id_found.assert_awaited_once_with(oid, domain, priority, None)
+        found = []
+        await handler._handle(obj, domain, found, priority)
+        self.assertListEqual([(oid, domain, priority, None)], found)
         db.queue.update_state.assert_not_awaited()
         handler._handle_actor.assert_not_awaited()
 
@@ -369,3 +435,94 @@ class TestObjectHandler(unittest.TestCase):
         await handler.handle(obj, domain, priority, aux)
         db.aliases.insert.assert_not_awaited()
         self.assertListEqual([(obj, domain, priority, True, aux)], handle_args)
+
+    @async_test
+    async def test_handle_reports_all_found_ids_at_once(self):
+        handler, db, ids_found, *_ = testable_handler()
+        obj = {"type": "OrderedCollectionPage", "orderedItems": ["a", "b"]}
+        await handler.handle(obj, "example.com", True)
+        aux = dumps({"colDir": "prev"})
+        ids_found.assert_awaited_once_with(
+            [("a", "example.com", True, aux), ("b", "example.com", True, aux)]
+        )
+
+    @async_test
+    async def test_handle_not_modified_keeps_hash_and_doubles_update_period(self):
+        handler, db, id_found, *_ = testable_handler()
+        await handler.handle_not_modified("https://example.com/actor/1", "h")
+        id_found.assert_not_awaited()
+        db.queue.update_state_time.assert_awaited_once_with(
+            "https://example.com/actor/1",
+            QueueState.Fetched,
+            min(Config.min_update_period * 2, Config.max_update_period),
+            "h",
+        )
+
+
+class TestPruneUnusedFields(unittest.TestCase):
+    def test_prunes_unused_fields_of_embedded_notes(self):
+        page = json.dumps(
+            {
+                "type": "OrderedCollectionPage",
+                "next": "https://a.example/outbox?page=2",
+                "orderedItems": [
+                    {
+                        "type": "Create",
+                        "actor": "https://a.example/u",
+                        "published": "2022-01-01T00:00:00Z",
+                        "object": {
+                            "id": "https://a.example/n",
+                            "type": "Note",
+                            "content": "<p>text</p>",
+                            "tag": [{"type": "Hashtag", "name": "#a"}],
+                        },
+                    }
+                ],
+            }
+        )
+        parsed = json.loads(page, object_pairs_hook=prune_unused_fields)
+        self.assertDictEqual(
+            {
+                "type": "OrderedCollectionPage",
+                "next": "https://a.example/outbox?page=2",
+                "orderedItems": [
+                    {
+                        "type": "Create",
+                        "actor": "https://a.example/u",
+                        "object": {"id": "https://a.example/n", "type": "Note"},
+                    }
+                ],
+            },
+            parsed,
+        )
+
+    def test_keeps_actors_whole(self):
+        actor = {
+            "id": "https://a.example/u",
+            "type": "Person",
+            "publicKey": {"id": "https://a.example/u#key", "publicKeyPem": "-"},
+            "icon": {"type": "Image", "url": "https://a.example/i.png"},
+            "attachment": [{"type": "PropertyValue", "name": "a", "value": "b"}],
+        }
+        parsed = json.loads(json.dumps(actor), object_pairs_hook=prune_unused_fields)
+        self.assertDictEqual(actor, parsed)
+
+    def test_parse_pruned_prunes_like_hook(self):
+        page = json.dumps(
+            {
+                "type": "OrderedCollection",
+                "orderedItems": [
+                    {
+                        "type": "Announce",
+                        "object": [{"type": "Note", "id": "n", "content": "c"}],
+                        "published": "2022-01-01T00:00:00Z",
+                    },
+                    {"type": "Person", "id": "p", "icon": {"type": "Image"}},
+                    "https://a.example/n",
+                ],
+            }
+        ).encode()
+        expected = json.loads(page, object_pairs_hook=prune_unused_fields)
+        self.assertDictEqual(expected, parse_pruned(page))
+        with patch.object(json_codec, "orjson", None):
+            self.assertDictEqual(expected, parse_pruned(page))
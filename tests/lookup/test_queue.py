@@ -0,0 +1,179 @@
+import asyncio
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+from mocks.db import memory_queue
+from test_helpers import async_test
+
+from lookup.database.queue import FifoQueue, QueueItem, QueueState
+
+
+async def insert(queue: FifoQueue, uri: str) -> bool:
+    return await queue.insert(uri, "example.com", "example.com", QueueState.Waiting, 10)
+
+
+class TestFifoQueue(unittest.TestCase):
+    @async_test
+    async def test_insert_given_new_uri_returns_true(self):
+        queue = await memory_queue()
+        self.assertTrue(await insert(queue, "https://example.com/1"))
+        self.assertIsNotNone(await queue.get_element("https://example.com/1"))
+        await queue.conn.close()
+
+    @async_test
+    async def test_insert_given_existing_uri_returns_false(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        self.assertFalse(await insert(queue, "https://example.com/1"))
+        await queue.conn.close()
+
+    @async_test
+    async def test_insert_given_concurrent_inserts_reports_only_first_as_new(self):
+        queue = await memory_queue()
+        uris = ["https://example.com/1", "https://example.com/2"] * 2
+        result = await asyncio.gather(*(insert(queue, uri) for uri in uris))
+        self.assertListEqual([True, True, False, False], result)
+        self.assertEqual(2, await queue.get_count_by_state(QueueState.Waiting))
+        await queue.conn.close()
+
+    @async_test
+    async def test_insert_many_returns_only_new_uris(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        uris = ["https://example.com/1", "https://example.com/2"] * 2
+        new_uris = await queue.insert_many(
+            (uri, "example.com", "example.com", QueueState.Waiting, 10, None)
+            for uri in uris
+        )
+        self.assertSetEqual({"https://example.com/2"}, new_uris)
+        self.assertEqual(2, await queue.get_count_by_state(QueueState.Waiting))
+        await queue.conn.close()
+
+    @async_test
+    async def test_update_state_is_visible_in_get_element_before_flush(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await queue.update_state("https://example.com/1", QueueState.Processing)
+        self.assertEqual(1, len(queue._updates))
+        element = await queue.get_element("https://example.com/1")
+        self.assertEqual(QueueState.Processing, element["state"])
+        self.assertIsNone(element["next_update"])
+        await queue.conn.close()
+
+    @async_test
+    async def test_update_state_time_merges_with_previous_update(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await queue.update_state("https://example.com/1", QueueState.Processing)
+        await queue.update_state_time(
+            "https://example.com/1", QueueState.Fetched, 100, "hash"
+        )
+        await queue.flush()
+        element = await queue.get_element("https://example.com/1")
+        self.assertEqual(QueueState.Fetched, element["state"])
+        self.assertEqual(100, element["update_time"])
+        self.assertEqual("hash", element["hash"])
+        await queue.conn.close()
+
+    @async_test
+    async def test_flush_given_failed_write_keeps_rows_for_next_flush(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await queue.update_state("https://example.com/1", QueueState.Processing)
+        locked = sqlite3.OperationalError("database is locked")
+        with patch.object(queue, "_flush_updates", side_effect=locked):
+            with self.assertRaises(sqlite3.OperationalError):
+                await queue.flush()
+        await queue.flush()
+        element = await queue.get_element("https://example.com/1")
+        self.assertEqual(QueueState.Processing, element["state"])
+        await queue.conn.close()
+
+    @async_test
+    async def test_flush_given_failed_write_resolves_insert_on_retry(self):
+        queue = await memory_queue()
+        locked = sqlite3.OperationalError("database is locked")
+        # uris are inserted before updates fail, the retry finds them in the queue
+        with patch.object(queue, "_flush_updates", side_effect=[locked, None]):
+            inserted = asyncio.create_task(insert(queue, "https://example.com/1"))
+            await asyncio.sleep(0)
+            with self.assertRaises(sqlite3.OperationalError):
+                await queue.flush()
+            await queue.flush()
+            self.assertTrue(await asyncio.wait_for(inserted, 1))
+        await queue.conn.close()
+
+    @async_test
+    async def test_get_random_doesnt_return_element_with_buffered_update(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await queue.update_state("https://example.com/1", QueueState.Processing)
+        self.assertListEqual([], await queue.get_random(10))
+        await queue.conn.close()
+
+    @async_test
+    async def test_get_random_returns_items_with_fetch_fields(self):
+        queue = await memory_queue()
+        await queue.insert(
+            "https://example.com/1",
+            "example.com",
+            "other.example",
+            QueueState.WaitingPriority,
+            10,
+            '{"colDir":"next"}',
+        )
+        self.assertListEqual(
+            [
+                QueueItem(
+                    "https://example.com/1",
+                    "example.com",
+                    QueueState.WaitingPriority,
+                    '{"colDir":"next"}',
+                    None,
+                    None,
+                    None,
+                )
+            ],
+            await queue.get_random(10),
+        )
+        await queue.conn.close()
+
+    @async_test
+    async def test_archive_terminal_moves_finished_elements_out_of_queue(self):
+        queue = await memory_queue()
+        for i in range(4):
+            await insert(queue, f"https://example.com/{i}")
+        await queue.update_state("https://example.com/0", QueueState.Failed)
+        await queue.update_state("https://example.com/1", QueueState.Fetched)
+        await queue.update_state_time(
+            "https://example.com/2", QueueState.Fetched, 100, "hash"
+        )
+        self.assertEqual(2, await queue.archive_terminal(10))
+        self.assertIsNone(await queue.get_element("https://example.com/0"))
+        self.assertIsNotNone(await queue.get_element("https://example.com/2"))
+        self.assertIsNotNone(await queue.get_element("https://example.com/3"))
+        self.assertEqual(0, await queue.archive_terminal(10))
+        await queue.conn.close()
+
+    @async_test
+    async def test_insert_given_archived_uri_returns_false(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await queue.update_state("https://example.com/1", QueueState.Redirected)
+        await queue.archive_terminal(10)
+        self.assertFalse(await insert(queue, "https://example.com/1"))
+        self.assertTrue(await insert(queue, "https://example.com/2"))
+        await queue.conn.close()
+
+    @async_test
+    async def test_get_count_by_state_includes_archived_elements(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        await insert(queue, "https://example.com/2")
+        await queue.update_state("https://example.com/1", QueueState.Fetched)
+        await queue.update_state("https://example.com/2", QueueState.Fetched)
+        await queue.archive_terminal(1)
+        self.assertEqual(2, await queue.get_count_by_state(QueueState.Fetched))
+        self.assertEqual(1, await queue.get_domain_count_by_state(QueueState.Fetched))
+        await queue.conn.close()
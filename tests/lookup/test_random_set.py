@@ -0,0 +1,66 @@
+import unittest
+
+from lookup.random_set import RandomSet
+
+
+class TestRandomSet(unittest.TestCase):
+    def test_add_given_new_items_contains_them(self):
+        s = RandomSet()
+        s.add("a")
+        s.add("b")
+        self.assertEqual(2, len(s))
+        self.assertIn("a", s)
+        self.assertIn("b", s)
+
+    def test_add_given_duplicate_item_keeps_one_copy(self):
+        s = RandomSet()
+        s.add("a")
+        s.add("a")
+        self.assertEqual(1, len(s))
+
+    def test_remove_given_middle_item_keeps_others(self):
+        s = RandomSet()
+        for item in ["a", "b", "c", "d"]:
+            s.add(item)
+        s.remove("b")
+        self.assertNotIn("b", s)
+        self.assertSetEqual({"a", "c", "d"}, set(s))
+        s.remove("d")
+        s.remove("a")
+        self.assertListEqual(["c"], list(s))
+
+    def test_remove_given_missing_item_raises_key_error(self):
+        s = RandomSet()
+        with self.assertRaises(KeyError):
+            s.remove("a")
+
+    def test_discard_given_missing_item_does_nothing(self):
+        s = RandomSet()
+        s.add("a")
+        s.discard("b")
+        self.assertListEqual(["a"], list(s))
+
+    def test_choice_given_empty_set_raises_index_error(self):
+        with self.assertRaises(IndexError):
+            RandomSet().choice()
+
+    def test_choice_returns_every_element(self):
+        s = RandomSet()
+        for item in range(5):
+            s.add(item)
+        s.remove(2)
+        self.assertSetEqual({0, 1, 3, 4}, {s.choice() for _ in range(1000)})
+
+    def test_sample_returns_distinct_elements(self):
+        s = RandomSet()
+        for item in range(100):
+            s.add(item)
+        sample = s.sample(10)
+        self.assertEqual(10, len(set(sample)))
+        self.assertTrue(all(item in s for item in sample))
+
+    def test_sample_given_count_over_size_returns_all(self):
+        s = RandomSet()
+        for item in range(3):
+            s.add(item)
+        self.assertSetEqual({0, 1, 2}, set(s.sample(10)))
@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from mocks.db import memory_queue
+from test_helpers import async_test
+
+from lookup.database.queue import FifoQueue, QueueState
+from lookup.recrawl import RecrawlScheduler
+
+
+async def insert_fetched(queue: FifoQueue, uri: str, update_time: int) -> None:
+    await queue.insert(uri, "example.com", "example.com", QueueState.Fetched, 0)
+    await queue.update_state_time(uri, QueueState.Fetched, update_time, "hash")
+
+
+@patch("lookup.recrawl.Config.recrawl_window", 100)
+@patch("lookup.recrawl.Config.recrawl_window_size", 10)
+@patch("lookup.recrawl.Config.recrawl_batch", 2)
+class TestRecrawlScheduler(unittest.TestCase):
+    @async_test
+    async def test_promote_due_moves_only_due_elements(self):
+        queue = await memory_queue()
+        await insert_fetched(queue, "due", -10)
+        await insert_fetched(queue, "later", 50)
+        await insert_fetched(queue, "not_loaded", 1000)
+        scheduler = RecrawlScheduler(queue)
+        self.assertEqual(1, await scheduler.promote_due())
+        self.assertEqual(
+            QueueState.WaitingPriority, (await queue.get_element("due"))["state"]
+        )
+        self.assertEqual(
+            QueueState.Fetched, (await queue.get_element("later"))["state"]
+        )
+        self.assertEqual(1, len(scheduler._heap))
+        await queue.conn.close()
+
+    @async_test
+    async def test_promote_due_given_backlog_promotes_in_batches(self):
+        queue = await memory_queue()
+        for i in range(5):
+            await insert_fetched(queue, f"due{i}", -10 - i)
+        scheduler = RecrawlScheduler(queue)
+        self.assertListEqual(
+            [2, 2, 1, 0], [await scheduler.promote_due() for _ in range(4)]
+        )
+        self.assertEqual(5, await queue.get_count_by_state(QueueState.WaitingPriority))
+        await queue.conn.close()
+
+    @async_test
+    async def test_promote_due_given_truncated_window_loads_rest(self):
+        queue = await memory_queue()
+        for i in range(15):
+            await insert_fetched(queue, f"due{i}", -10 - i)
+        scheduler = RecrawlScheduler(queue)
+        promoted = 0
+        for _ in range(10):
+            promoted += await scheduler.promote_due()
+        self.assertEqual(15, promoted)
+        await queue.conn.close()
+
+    @async_test
+    async def test_promote_due_skips_element_refetched_after_loading(self):
+        queue = await memory_queue()
+        await insert_fetched(queue, "due", -10)
+        scheduler = RecrawlScheduler(queue)
+        await scheduler._load_window(int(time.time()))
+        await queue.update_state_time("due", QueueState.Fetched, 500, "hash")
+        await scheduler.promote_due()
+        self.assertEqual(QueueState.Fetched, (await queue.get_element("due"))["state"])
+        await queue.conn.close()
+
+    @async_test
+    async def test_lag_returns_age_of_oldest_due_element(self):
+        queue = await memory_queue()
+        for i in range(3):
+            await insert_fetched(queue, f"due{i}", -100 * (i + 1))
+        scheduler = RecrawlScheduler(queue)
+        await scheduler.promote_due()
+        self.assertAlmostEqual(100, await scheduler.lag(), delta=2)
+        await queue.conn.close()
+
+    @async_test
+    async def test_lag_given_due_elements_not_loaded_returns_their_age(self):
+        queue = await memory_queue()
+        scheduler = RecrawlScheduler(queue)
+        await scheduler.promote_due()
+        await insert_fetched(queue, "due", -100)
+        self.assertEqual(0, await scheduler.promote_due())
+        self.assertAlmostEqual(100, await scheduler.lag(), delta=2)
+        await queue.conn.close()
@@ -0,0 +1,182 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from test_helpers import async_test
+
+from lookup.database.domains import DomainState
+from lookup.schedule_queue import Domain, ScheduleQueue, count_domains
+
+
+@patch("lookup.schedule_queue.Config.domain_request_period", 0.05)
+class TestScheduleQueue(unittest.TestCase):
+    @async_test
+    async def test_get_first_available_given_ready_domain_returns_item(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        await queue.put({"uri": "a"}, domain)
+        item, item_domain = await queue.get_first_available()
+        self.assertEqual({"uri": "a"}, item)
+        self.assertIs(domain, item_domain)
+        self.assertEqual(0, queue.total)
+
+    @async_test
+    async def test_get_first_available_returns_domain_items_in_fifo_order(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        for uri in ["a", "b", "c"]:
+            await queue.put({"uri": uri}, domain)
+        result = []
+        for _ in range(3):
+            item, _ = await queue.get_first_available()
+            queue.release(domain)
+            result.append(item["uri"])
+        self.assertListEqual(["a", "b", "c"], result)
+
+    @async_test
+    async def test_get_first_available_waits_for_domain_next_req(self):
+        queue = ScheduleQueue(10)
+        st = time.time()
+        await queue.put({"uri": "a"}, Domain(next_req=st + 0.05))
+        await queue.get_first_available()
+        self.assertGreaterEqual(time.time(), st + 0.05)
+
+    @async_test
+    async def test_get_first_available_spaces_items_of_same_domain(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        await queue.put({"uri": "a"}, domain)
+        await queue.put({"uri": "b"}, domain)
+        st = time.time()
+        await queue.get_first_available()
+        queue.release(domain)
+        await queue.get_first_available()
+        self.assertGreaterEqual(time.time(), st + 0.05)
+
+    @async_test
+    async def test_get_first_available_prefers_ready_domain(self):
+        queue = ScheduleQueue(10)
+        await queue.put({"uri": "late"}, Domain(next_req=time.time() + 10))
+        await queue.put({"uri": "ready"}, Domain())
+        item, _ = await queue.get_first_available()
+        self.assertEqual("ready", item["uri"])
+        queue.stop()
+
+    @async_test
+    async def test_get_first_available_releases_unreachable_domain_immediately(self):
+        queue = ScheduleQueue(10)
+        domain = Domain(next_req=time.time() + 10, fail_streak=1)
+        await queue.put({"uri": "a"}, domain)
+        item, _ = await asyncio.wait_for(queue.get_first_available(), 1)
+        self.assertEqual("a", item["uri"])
+
+    @async_test
+    async def test_get_first_available_releases_blocked_domain_immediately(self):
+        queue = ScheduleQueue(10)
+        domain = Domain(next_req=time.time() + 10, state=DomainState.Blocked)
+        await queue.put({"uri": "a"}, domain)
+        item, _ = await asyncio.wait_for(queue.get_first_available(), 1)
+        self.assertEqual("a", item["uri"])
+
+    @async_test
+    async def test_put_wakes_waiting_fetcher(self):
+        queue = ScheduleQueue(10)
+        waiter = asyncio.create_task(queue.get_first_available())
+        await asyncio.sleep(0)
+        await queue.put({"uri": "a"}, Domain())
+        item, _ = await asyncio.wait_for(waiter, 1)
+        self.assertEqual("a", item["uri"])
+
+    @async_test
+    async def test_cancelled_fetcher_doesnt_lose_item(self):
+        queue = ScheduleQueue(10)
+        waiter = asyncio.create_task(queue.get_first_available())
+        await asyncio.sleep(0)
+        await queue.put({"uri": "a"}, Domain())
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        item, _ = await asyncio.wait_for(queue.get_first_available(), 1)
+        self.assertEqual("a", item["uri"])
+
+    @async_test
+    async def test_get_first_available_waits_for_release_of_domain_at_parallelism(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        await queue.put({"uri": "a"}, domain)
+        await queue.put({"uri": "b"}, domain)
+        await queue.get_first_available()
+        waiter = asyncio.create_task(queue.get_first_available())
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiter.done())
+        queue.release(domain)
+        item, _ = await asyncio.wait_for(waiter, 1)
+        self.assertEqual("b", item["uri"])
+
+    @async_test
+    async def test_get_first_available_counts_items_of_domain_in_other_queue(self):
+        queue, other = ScheduleQueue(10), ScheduleQueue(10)
+        domain = Domain()
+        await other.put({"uri": "a"}, domain)
+        await queue.put({"uri": "b"}, domain)
+        await other.get_first_available()
+        waiter = asyncio.create_task(queue.get_first_available())
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiter.done())
+        other.release(domain)
+        item, _ = await asyncio.wait_for(waiter, 1)
+        self.assertEqual("b", item["uri"])
+        self.assertEqual(1, domain.in_flight)
+
+    @async_test
+    async def test_get_first_available_allows_parallel_items_of_domain(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        domain.get_rate().window = 2
+        await queue.put({"uri": "a"}, domain)
+        await queue.put({"uri": "b"}, domain)
+        await queue.get_first_available()
+        item, _ = await asyncio.wait_for(queue.get_first_available(), 1)
+        self.assertEqual("b", item["uri"])
+
+    @async_test
+    async def test_get_first_available_waits_for_rate_limited_domain(self):
+        queue = ScheduleQueue(10)
+        domain = Domain()
+        st = time.time()
+        domain.get_rate().blocked_until = st + 0.05
+        await queue.put({"uri": "a"}, domain)
+        await queue.get_first_available()
+        self.assertGreaterEqual(time.time(), st + 0.05)
+
+    @async_test
+    async def test_put_prefetches_first_item_of_domain(self):
+        prefetched = []
+        queue = ScheduleQueue(10, prefetched.append)
+        domain = Domain()
+        await queue.put({"uri": "a"}, domain)
+        await queue.put({"uri": "b"}, domain)
+        self.assertListEqual([{"uri": "a"}], prefetched)
+
+
+class TestCountDomains(unittest.TestCase):
+    def test_count_domains_counts_by_state(self):
+        waiting, unreachable = Domain(), Domain(time.time() + 60, 1)
+        waiting.has_waiting_elements = unreachable.has_waiting_elements = True
+        domains = {
+            "a": waiting,
+            "b": unreachable,
+            "c": Domain(state=DomainState.Blocked),
+            "d": Domain(),
+        }
+        self.assertDictEqual(
+            {
+                "found": 4,
+                "waiting": 2,
+                "waiting_reachable": 1,
+                "unreachable": 1,
+                "blocked": 1,
+            },
+            count_domains(domains),
+        )
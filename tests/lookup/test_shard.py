@@ -0,0 +1,87 @@
+import queue
+import unittest
+from unittest.mock import AsyncMock
+
+from mocks.db import memory_queue
+from test_helpers import async_test
+
+from lookup.database.queue import QueueState
+from lookup.shard import Shard, domain_shard
+
+
+def domains_of_shards(count: int):
+    """One domain for each of `count` shards."""
+    domains = {}
+    i = 0
+    while len(domains) < count:
+        domain = f"example{i}.com"
+        domains.setdefault(domain_shard(domain, count), domain)
+        i += 1
+    return [domains[i] for i in range(count)]
+
+
+class TestShard(unittest.TestCase):
+    def test_domain_shard_is_stable(self):
+        self.assertEqual(domain_shard("example.com", 7), domain_shard("example.com", 7))
+        self.assertIn(domain_shard("example.com", 7), range(7))
+
+    def test_owns_given_domain_of_shard_returns_true(self):
+        domains = domains_of_shards(3)
+        shard = Shard(1, 3, [])
+        self.assertTrue(shard.owns(domains[1]))
+        self.assertFalse(shard.owns(domains[0]))
+
+    def test_flush_sends_forwarded_uris_to_owner(self):
+        domains = domains_of_shards(2)
+        inboxes = [queue.Queue(), queue.Queue()]
+        shard = Shard(0, 2, inboxes)
+        found = ("https://" + domains[1] + "/a", "example.com", True, None)
+        shard.forward(domains[1], found)
+        self.assertTrue(inboxes[1].empty())
+        shard.flush()
+        self.assertListEqual([found], inboxes[1].get_nowait())
+        self.assertTrue(inboxes[0].empty())
+        self.assertEqual(1, shard.forwarded)
+
+    @async_test
+    async def test_receive_calls_on_found_for_each_batch(self):
+        inboxes = [queue.Queue()]
+        shard = Shard(0, 1, inboxes)
+        on_found = AsyncMock()
+        found = ("https://example.com/a", "example.com", False, None)
+        inboxes[0].put([found])
+        on_found.side_effect = [None, StopAsyncIteration()]
+        inboxes[0].put([found])
+        with self.assertRaises(StopAsyncIteration):
+            await shard.receive(on_found)
+        on_found.assert_awaited_with([found])
+        self.assertEqual(2, shard.received)
+
+    @async_test
+    async def test_sharded_queue_returns_only_domains_of_shard(self):
+        domains = domains_of_shards(2)
+        db_queue = await memory_queue()
+        for domain in domains:
+            await db_queue.insert(
+                f"https://{domain}/a", domain, domain, QueueState.Waiting, 10
+            )
+        db_queue.shard = Shard(1, 2, [])
+        self.assertListEqual([domains[1]], await db_queue.get_waiting_domains())
+        items = await db_queue.get_random(10)
+        self.assertListEqual([domains[1]], [item.domain for item in items])
+        await db_queue.conn.close()
+
+    @async_test
+    async def test_sharded_queue_follows_new_domains_and_ownership(self):
+        domains = domains_of_shards(2)
+        db_queue = await memory_queue()
+        db_queue.shard = Shard(0, 2, [])
+        self.assertListEqual([], await db_queue.get_waiting_domains())
+        for domain in domains:
+            await db_queue.insert(
+                f"https://{domain}/a", domain, domain, QueueState.Waiting, 10
+            )
+        self.assertListEqual([domains[0]], await db_queue.get_waiting_domains())
+        db_queue.shard = Shard(1, 2, [])
+        self.assertListEqual([domains[1]], await db_queue.get_waiting_domains())
+        await db_queue.conn.close()
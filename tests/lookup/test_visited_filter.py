@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from mocks.db import memory_queue
+from test_helpers import async_test
+
+from lookup.database.queue import FifoQueue, QueueState
+from lookup.visited_filter import VisitedFilter
+
+
+async def insert(queue: FifoQueue, uri: str) -> None:
+    await queue.insert(uri, "example.com", "example.com", QueueState.Waiting, 10)
+
+
+class TestVisitedFilter(unittest.TestCase):
+    @async_test
+    async def test_load_builds_filter_from_queue(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        visited = VisitedFilter(queue, 0.01, 100)
+        await visited.load()
+        self.assertIn("https://example.com/1", visited)
+        self.assertNotIn("https://example.com/2", visited)
+        self.assertEqual(1, visited.get_stats()["hits"])
+        self.assertEqual(2, visited.get_stats()["checks"])
+        await queue.conn.close()
+
+    @async_test
+    async def test_load_given_saved_filter_adds_newer_elements(self):
+        queue = await memory_queue()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "visited")
+            visited = VisitedFilter(queue, 0.01, 100, path)
+            await visited.load()
+            visited.add_all(["https://example.com/not-in-queue"])
+            await insert(queue, "https://example.com/1")
+            await visited.save()
+            await insert(queue, "https://example.com/2")
+
+            loaded = VisitedFilter(queue, 0.01, 100, path)
+            await loaded.load()
+        self.assertEqual(0, loaded.builds)
+        self.assertIn("https://example.com/not-in-queue", loaded)
+        self.assertIn("https://example.com/2", loaded)
+        await queue.conn.close()
+
+    @async_test
+    async def test_load_given_saved_filter_of_other_fp_rate_rebuilds_it(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "visited")
+            visited = VisitedFilter(queue, 0.01, 100, path)
+            await visited.load()
+            await visited.save()
+
+            loaded = VisitedFilter(queue, 0.001, 100, path)
+            await loaded.load()
+        self.assertEqual(1, loaded.builds)
+        self.assertIn("https://example.com/1", loaded)
+        await queue.conn.close()
+
+    @async_test
+    async def test_grow_if_full_rebuilds_larger_filter(self):
+        queue = await memory_queue()
+        visited = VisitedFilter(queue, 0.01, 2)
+        await visited.load()
+        for i in range(3):
+            await insert(queue, f"https://example.com/{i}")
+        visited.add_all(f"https://example.com/{i}" for i in range(3))
+        await visited.grow_if_full()
+        self.assertEqual(4, visited.bloom.capacity)
+        self.assertIn("https://example.com/2", visited)
+        await queue.conn.close()
+
+    @async_test
+    async def test_disabled_filter_contains_nothing(self):
+        queue = await memory_queue()
+        await insert(queue, "https://example.com/1")
+        visited = VisitedFilter(queue, 0, 100)
+        await visited.load()
+        self.assertNotIn("https://example.com/1", visited)
+        self.assertFalse(visited.get_stats()["enabled"])
+        await queue.conn.close()
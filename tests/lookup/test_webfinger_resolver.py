@@ -0,0 +1,62 @@
+import time
+import unittest
+from unittest.mock import Mock
+
+from mocks.db import mock_lookup_db
+from test_helpers import async_test
+
+from common.webfinger import WebFinger
+from lookup.database.domains import DomainState
+from lookup.schedule_queue import Domain
+from lookup.webfinger_resolver import WebfingerResolver
+
+ITEM = {"num": 1, "uri": "actor_uri", "actor": "acct:a@example.com", "domain": "a"}
+
+
+def mocked_resolver():
+    db = mock_lookup_db()
+    webfinger = Mock(spec=WebFinger)
+    # noinspection PyTypeChecker
+    return WebfingerResolver(db, webfinger, {}), db, webfinger
+
+
+class TestWebfingerResolver(unittest.TestCase):
+    @async_test
+    async def test_resolve_single_given_resolved_actor_updates_aux(self):
+        resolver, db, webfinger = mocked_resolver()
+        webfinger.resolve_actor_webfinger.return_value = "acct:a@example.com"
+        domain = Domain()
+        await resolver._resolve_single(dict(ITEM), domain)
+        webfinger.resolve_actor_webfinger.assert_awaited_once_with(
+            "acct:a@example.com", "actor_uri"
+        )
+        db.aliases.insert.assert_awaited_once_with("acct:a@example.com", "actor_uri")
+        db.objects.update_aux.assert_awaited_once_with(
+            "actor_uri", {"webfinger": "acct:a@example.com"}
+        )
+        db.webfinger_queue.remove.assert_awaited_once_with("actor_uri")
+        self.assertGreater(domain.next_req, time.time())
+
+    @async_test
+    async def test_resolve_single_given_unresolved_actor_doesnt_update_aux(self):
+        resolver, db, webfinger = mocked_resolver()
+        webfinger.resolve_actor_webfinger.return_value = None
+        await resolver._resolve_single(dict(ITEM), Domain())
+        db.objects.update_aux.assert_not_awaited()
+        db.webfinger_queue.remove.assert_awaited_once_with("actor_uri")
+
+    @async_test
+    async def test_resolve_single_given_blocked_domain_doesnt_resolve(self):
+        resolver, db, webfinger = mocked_resolver()
+        await resolver._resolve_single(dict(ITEM), Domain(state=DomainState.Blocked))
+        webfinger.resolve_actor_webfinger.assert_not_awaited()
+        db.webfinger_queue.remove.assert_awaited_once_with("actor_uri")
+
+    @async_test
+    async def test_resolve_single_given_temp_unreachable_domain_keeps_actor(self):
+        resolver, db, webfinger = mocked_resolver()
+        domain = Domain(time.time() + 100, 1)
+        await resolver._resolve_single(dict(ITEM), domain)
+        webfinger.resolve_actor_webfinger.assert_not_awaited()
+        db.webfinger_queue.remove.assert_not_awaited()
+        self.assertTrue(resolver._skipped)
@@ -1,5 +1,9 @@
 from unittest.mock import AsyncMock
 
+import aiosqlite
+
+from lookup.database.queue import FifoQueue
+
 
 def mock_lookup_db():
     class MockSubDb:
@@ -19,3 +23,11 @@ def mock_lookup_db():
             return self.__dict__[name]
 
     return MockDb()
+
+
+async def memory_queue() -> FifoQueue:
+    conn = await aiosqlite.connect(":memory:")
+    conn.row_factory = aiosqlite.Row
+    queue = FifoQueue()
+    await queue.setup(conn)
+    return queue
@@ -9,12 +9,13 @@ def mock_client_session(responses: Optional[dict]):
     session = Mock()
 
     # noinspection PyUnusedLocal
-    def session_get(url, headers=None):
+    def session_get(url, headers=None, **_kwargs):
         class MockResponse:
             async def resp(self):
                 if responses and url in responses:
                     content = responses[url]
                     resp = Mock()
+                    resp.headers = {}
                     if content is None:
                         resp.status = 404
                         return resp
@@ -22,6 +23,9 @@ def mock_client_session(responses: Optional[dict]):
                     if "__http_status_code" in content:
                         resp.status = content["__http_status_code"]
                         del content["__http_status_code"]
+                    if "__http_headers" in content:
+                        resp.headers = content["__http_headers"]
+                        del content["__http_headers"]
 
                     async def get_json():
                         return content
@@ -31,8 +35,18 @@ def mock_client_session(responses: Optional[dict]):
                             return content
                         return json.dumps(content)
 
+                    async def iter_chunked(size):
+                        body = (await get_text()).encode()
+                        for i in range(0, len(body), size):
+                            yield body[i : i + size]
+
                     resp.json = get_json
                     resp.text = get_text
+                    resp.content_type = resp.headers.get(
+                        "Content-Type", "application/activity+json"
+                    )
+                    resp.content_length = None
+                    resp.content.iter_chunked = iter_chunked
                     return resp
                 else:
                     raise ClientError()
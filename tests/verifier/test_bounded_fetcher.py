@@ -1,3 +1,4 @@
+import time
 import unittest
 from typing import Any, Tuple
 from unittest.mock import AsyncMock
@@ -5,7 +6,8 @@ from unittest.mock import AsyncMock
 from mocks.db import mock_lookup_db
 from test_helpers import async_test
 
-from verifier.bounded_fetcher import BoundedFetcher
+from common.fetcher import RateLimited
+from verifier.bounded_fetcher import BoundedFetcher, ServerDown
 
 
 def testable_b_fetcher() -> Tuple[BoundedFetcher, Any, AsyncMock]:
@@ -21,4 +23,33 @@ class TestBoundedFetcher(unittest.TestCase):
         uri = "https://example.com/"
         b_fetcher, db, fetcher = testable_b_fetcher()
         await b_fetcher.fetch_ap(uri)
-        fetcher.fetch_ap.assert_awaited_once_with(uri)
+        fetcher.fetch_ap.assert_awaited_once_with(uri, b_fetcher.rates["example.com"])
+
+    @async_test
+    async def test_fetch_ap_given_rate_limited_raises_server_down_without_failure(self):
+        uri = "https://example.com/"
+        b_fetcher, db, fetcher = testable_b_fetcher()
+        fetcher.fetch_ap.side_effect = RateLimited(uri, time.time() + 30)
+        b_fetcher.get_rate("example.com").blocked_until = 0
+        with self.assertRaises(ServerDown):
+            await b_fetcher.fetch_ap(uri)
+        self.assertEqual(0, b_fetcher.domains["example.com"]["fails"])
+        self.assertNotIn("example.com", b_fetcher.temp_fails)
+
+    @async_test
+    async def test_fetch_ap_given_blocked_domain_doesnt_fetch(self):
+        uri = "https://example.com/"
+        b_fetcher, db, fetcher = testable_b_fetcher()
+        b_fetcher.get_rate("example.com").blocked_until = time.time() + 30
+        with self.assertRaises(ServerDown) as cm:
+            await b_fetcher.fetch_ap(uri)
+        self.assertGreater(cm.exception.next_try, time.time() + 20)
+        fetcher.fetch_ap.assert_not_awaited()
+
+    def test_get_rate_given_max_rates_evicts_least_recently_used(self):
+        b_fetcher = BoundedFetcher(10, mock_lookup_db(), max_rates=2)
+        a = b_fetcher.get_rate("a.com")
+        b_fetcher.get_rate("b.com")
+        self.assertIs(a, b_fetcher.get_rate("a.com"))
+        b_fetcher.get_rate("c.com")
+        self.assertEqual(["a.com", "c.com"], list(b_fetcher.rates))
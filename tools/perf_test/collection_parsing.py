@@ -0,0 +1,86 @@
+import functools
+import json
+import time
+import tracemalloc
+
+from common import json_codec
+from lookup.obj_handler import parse_pruned, prune_unused_fields
+
+PAGES = 200
+ITEMS_PER_PAGE = 20
+
+
+def outbox_page(page: int) -> bytes:
+    base = "https://example.com/users/someone"
+    items = []
+    for i in range(ITEMS_PER_PAGE):
+        note_id = f"{base}/statuses/{page}{i}"
+        items.append(
+            {
+                "id": f"{note_id}/activity",
+                "type": "Create",
+                "actor": base,
+                "to": ["https://www.w3.org/ns/activitystreams#Public"],
+                "cc": [f"{base}/followers"],
+                "object": {
+                    "id": note_id,
+                    "type": "Note",
+                    "attributedTo": base,
+                    "content": "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>",
+                    "contentMap": {"en": "<p>" + "Lorem ipsum. " * 40 + "</p>"},
+                    "to": ["https://www.w3.org/ns/activitystreams#Public"],
+                    "cc": [f"{base}/followers"],
+                    "attachment": [
+                        {"type": "Document", "url": f"{note_id}/{j}.png"}
+                        for j in range(4)
+                    ],
+                    "tag": [{"type": "Hashtag", "name": f"#tag{j}"} for j in range(5)],
+                    "replies": {
+                        "id": f"{note_id}/replies",
+                        "type": "Collection",
+                        "first": {
+                            "type": "CollectionPage",
+                            "next": f"{note_id}/replies?page=true",
+                            "items": [],
+                        },
+                    },
+                },
+            }
+        )
+    return json.dumps(
+        {
+            "id": f"{base}/outbox?page={page}",
+            "type": "OrderedCollectionPage",
+            "next": f"{base}/outbox?page={page + 1}",
+            "orderedItems": items,
+        }
+    ).encode()
+
+
+def measure(name: str, pages, parse) -> None:
+    # tracemalloc slows allocations down, time is measured without it
+    durations = []
+    for _ in range(5):
+        st = time.perf_counter()
+        for page in pages:
+            parse(page)
+        durations.append(time.perf_counter() - st)
+    tracemalloc.start()
+    parsed = [parse(page) for page in pages]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = len(json.dumps(parsed[0]))
+    print(f"{name}: {min(durations):.3f} s, peak {peak / 2**20:.1f} MiB, page {size} B")
+
+
+if __name__ == "__main__":
+    pages = [outbox_page(i) for i in range(PAGES)]
+    measure("full", pages, json.loads)
+    measure(
+        "pruned by hook",
+        pages,
+        functools.partial(json.loads, object_pairs_hook=prune_unused_fields),
+    )
+    if json_codec.orjson is not None:
+        measure("full orjson", pages, json_codec.loads)
+        measure("pruned after orjson", pages, parse_pruned)
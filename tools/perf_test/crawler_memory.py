@@ -0,0 +1,59 @@
+import asyncio
+import time
+import tracemalloc
+
+import aiosqlite
+
+from lookup.database.queue import FifoQueue, QueueState
+from lookup.schedule_queue import Domain
+
+DOMAINS = 1000000
+ITEMS = 10000
+
+
+def measure_domains() -> None:
+    tracemalloc.start()
+    st = time.perf_counter()
+    domains = {f"domain{i}.example": Domain() for i in range(DOMAINS)}
+    duration = time.perf_counter() - st
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{len(domains)} domains: {size / 2**20:.1f} MiB "
+        f"({size / DOMAINS:.0f} B per domain with its name), {duration:.2f} s"
+    )
+
+
+async def measure_items() -> None:
+    conn = await aiosqlite.connect(":memory:")
+    conn.row_factory = aiosqlite.Row
+    queue = FifoQueue()
+    await queue.setup(conn)
+    aux = '{"colDir":"next","empPag":1}'
+    await queue.insert_many(
+        (
+            f"https://domain{i % 1000}.example/users/user{i}/outbox?page=true",
+            f"domain{i % 1000}.example",
+            f"domain{i % 77}.example",
+            QueueState.WaitingPriority,
+            3600,
+            aux,
+        )
+        for i in range(ITEMS)
+    )
+    tracemalloc.start()
+    st = time.perf_counter()
+    items = await queue.get_last(ITEMS)
+    duration = time.perf_counter() - st
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{len(items)} queue items: {size / 2**20:.1f} MiB "
+        f"({size / ITEMS:.0f} B per item), {duration * 1000:.0f} ms to select"
+    )
+    await conn.close()
+
+
+if __name__ == "__main__":
+    measure_domains()
+    asyncio.run(measure_items())
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+from lookup.config import Config
+from lookup.crawler import Crawler
+from lookup.database.queue import QueueItem, QueueState
+from lookup.schedule_queue import Domain
+
+DOMAIN_COUNTS = [1000, 10000, 100000, 1000000]
+ROUNDS = 200
+
+
+async def schedule_rounds(domain_count: int) -> float:
+    """Average time of one `_schedule_random_from_domain` round without database time."""
+    database = Mock()
+    database.queue.get_random_from_domain = AsyncMock(
+        side_effect=lambda domain, _count: [
+            QueueItem(
+                f"https://{domain}/1",
+                domain,
+                QueueState.WaitingPriority,
+                None,
+                None,
+                None,
+                None,
+            )
+        ]
+    )
+    database.queue.update_state = AsyncMock()
+    fetcher = Mock()
+    crawler = Crawler(database, fetcher)
+    crawler.items_to_explore = Mock()
+    scheduled = []
+    crawler.items_to_explore.put = AsyncMock(
+        side_effect=lambda item, _domain: scheduled.append(item.domain)
+    )
+    for i in range(domain_count):
+        name = f"domain{i}.example"
+        crawler.domains[name] = Domain()
+        crawler.domains[name].not_scheduled = True
+        crawler.not_scheduled_domains.add(name)
+
+    st = time.process_time()
+    for _ in range(ROUNDS):
+        await crawler._schedule_random_from_domain()
+        # items were "fetched", domains can be scheduled again
+        for name in scheduled:
+            crawler.domains[name].scheduled_items = 0
+            crawler.domains[name].not_scheduled = True
+            crawler.not_scheduled_domains.add(name)
+        scheduled.clear()
+    return (time.process_time() - st) / ROUNDS
+
+
+if __name__ == "__main__":
+    Config.domain_chunk = 100
+    # host groups need DNS, which isn't mocked
+    Config.host_group_request_period = 0
+    for count in DOMAIN_COUNTS:
+        round_time = asyncio.run(schedule_rounds(count))
+        print(f"{count} domains: {round_time * 1000:.3f} ms per scheduling round")
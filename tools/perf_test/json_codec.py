@@ -0,0 +1,95 @@
+import json
+import time
+from unittest.mock import patch
+
+import common.json_codec as codec
+from common.signatures import get_data_to_sign
+
+ITERATIONS = 20000
+
+
+def make_actor(i: int) -> dict:
+    base = f"https://example.com/users/user{i}"
+    return {
+        "@context": [
+            "https://www.w3.org/ns/activitystreams",
+            "https://w3id.org/security/v1",
+        ],
+        "id": base,
+        "type": "Person",
+        "following": f"{base}/following",
+        "followers": f"{base}/followers",
+        "inbox": f"{base}/inbox",
+        "outbox": f"{base}/outbox",
+        "preferredUsername": f"user{i}",
+        "name": "Žygimantas 🐘",
+        "summary": "<p>" + "Lorem ipsum dolor sit amet. " * 10 + "</p>",
+        "url": f"https://example.com/@user{i}",
+        "published": "2022-01-01T00:00:00Z",
+        "publicKey": {
+            "id": f"{base}#main-key",
+            "owner": base,
+            "publicKeyPem": "-----BEGIN PUBLIC KEY-----\n"
+            + "A" * 392
+            + "\n-----END PUBLIC KEY-----\n",
+        },
+        "endpoints": {"sharedInbox": "https://example.com/inbox"},
+        "tag": [{"type": "Hashtag", "name": f"#tag{j}"} for j in range(5)],
+    }
+
+
+def call_sites() -> dict:
+    actor = make_actor(0)
+    actor_json = json.dumps(actor)
+    aux = {"webfinger": "user0@example.com"}
+    aux_json = json.dumps(aux)
+    ascii_actor = {**actor, "name": "User 0"}
+    row = {
+        "num": 1,
+        "uri": actor["id"],
+        "type": 2,
+        "last_update": 1650000000.0,
+        "json": actor_json,
+        "aux": aux_json,
+        "key_signatures": [
+            {"signed_by": "https://verifier.example", "signature": "S" * 344}
+        ],
+    }
+    stats = {
+        "total": {f"event_{j}": j for j in range(40)},
+        "current": {f"event_{j}": j for j in range(40)},
+    }
+    return {
+        # Objects.insert and Objects.update_aux
+        "objects_insert": lambda: codec.dumps(aux),
+        # WebServer.get_handler, the stored json is served as a string
+        "get_handler": lambda: codec.dumps(row),
+        # Worker.get_signature parses the stored actor and dumps differences
+        "get_signature": lambda: (
+            codec.loads(actor_json),
+            codec.loads(aux_json),
+            codec.dumps(actor),
+        ),
+        "get_data_to_sign": lambda: get_data_to_sign(ascii_actor, aux, 1650000000),
+        # json escapes non ASCII characters, such actors are signed as before
+        "get_data_to_sign_non_ascii": lambda: get_data_to_sign(actor, aux, 1650000000),
+        # Stats.insert, Database.insert_stats
+        "stats_insert": lambda: codec.dumps(stats),
+    }
+
+
+def measure(name: str) -> None:
+    for site, call in call_sites().items():
+        st = time.perf_counter()
+        for _ in range(ITERATIONS):
+            call()
+        duration = time.perf_counter() - st
+        print(f"{name} {site}: {duration / ITERATIONS * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    if codec.orjson is None:
+        print("orjson is not installed, both runs use json")
+    with patch.object(codec, "orjson", None):
+        measure("json")
+    measure("codec")
@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+from typing import List, Tuple
+
+from lookup.config import Config
+from lookup.database.domains import DomainState
+from lookup.schedule_queue import Domain, ScheduleQueue
+
+DOMAINS = 20000
+ITEMS = 10000
+WORKERS = 100
+REQUEST_PERIOD = 0.05
+
+
+class PollingScheduleQueue:
+    """ScheduleQueue before the domain heap was introduced, kept for comparison."""
+
+    def __init__(self, size: int):
+        self.unavailable: List[Tuple[float, dict, Domain]] = []
+        self.available_items: asyncio.Queue = asyncio.Queue()
+        self.free_spaces = asyncio.Semaphore(size)
+        self._track_waiting_task = asyncio.create_task(self._track_waiting())
+
+    async def _track_waiting(self) -> None:
+        waiting_items = []
+        while True:
+            waiting_items.extend(self.unavailable)
+            self.unavailable = []
+            waiting_items.sort(key=lambda x: x[0])
+            new_waiting = []
+            for t, uri, domain in waiting_items:
+                if (
+                    domain.next_req < time.time()
+                    or domain.temp_unreachable
+                    or domain.state > DomainState.Unknown
+                ):
+                    self.available_items.put_nowait((t, uri, domain))
+                else:
+                    new_waiting.append((t, uri, domain))
+            waiting_items = new_waiting
+            await asyncio.sleep(Config.domain_request_period / 4)
+
+    async def get_first_available(self) -> Tuple[dict, Domain]:
+        while True:
+            t, uri, domain = await self.available_items.get()
+            if (
+                domain.next_req < time.time()
+                or domain.temp_unreachable
+                or domain.state > DomainState.Unknown
+            ):
+                self.free_spaces.release()
+                return uri, domain
+            self.unavailable.append((t, uri, domain))
+
+    async def put(self, uri: dict, domain: Domain):
+        await self.free_spaces.acquire()
+        self.available_items.put_nowait((time.time(), uri, domain))
+
+    def release(self, domain: Domain) -> None:
+        # one request per domain at a time isn't enforced by this queue
+        pass
+
+    def stop(self):
+        self._track_waiting_task.cancel()
+
+
+async def run(queue_class) -> Tuple[float, float, int]:
+    random.seed(0)
+    domains = [Domain() for _ in range(DOMAINS)]
+    # a few large instances get many items each
+    weights = [100 if i < 10 else 1 for i in range(DOMAINS)]
+    queue = queue_class(ITEMS)
+    violations = 0
+    last_fetch = {}
+
+    async def worker():
+        nonlocal violations
+        while True:
+            _, domain = await queue.get_first_available()
+            now = time.time()
+            if now - last_fetch.get(id(domain), 0) < REQUEST_PERIOD * 0.9:
+                violations += 1
+            last_fetch[id(domain)] = now
+            domain.next_req = max(domain.next_req, now + REQUEST_PERIOD)
+            await asyncio.sleep(0)
+            queue.release(domain)
+
+    for i, domain in enumerate(random.choices(domains, weights, k=ITEMS)):
+        await queue.put({"uri": str(i)}, domain)
+
+    cpu, wall = time.process_time(), time.time()
+    tasks = [asyncio.create_task(worker()) for _ in range(WORKERS)]
+    while queue.free_spaces._value < ITEMS:
+        await asyncio.sleep(0.01)
+    cpu, wall = time.process_time() - cpu, time.time() - wall
+    for task in tasks:
+        task.cancel()
+    queue.stop()
+    return cpu, wall, violations
+
+
+if __name__ == "__main__":
+    Config.domain_request_period = REQUEST_PERIOD
+    for name, cls in [("polling", PollingScheduleQueue), ("heap", ScheduleQueue)]:
+        cpu_time, wall_time, errors = asyncio.run(run(cls))
+        print(
+            f"{name}: cpu {cpu_time:.3f}s, wall {wall_time:.3f}s, "
+            f"politeness violations {errors}"
+        )